@@ -1,6 +1,28 @@
+import functools
+import re
+import numpy as np
 import pandas as pd
 import unicodedata
-from typing import Dict, Any
+from typing import Any, Dict, Iterable, List, Optional
+
+# Colunas da equipe: um par CODJ_n/AJUDANTE_n por posição de ajudante, tantas quantas a tabela tiver.
+# Os planos declaram as posições padrão; core.database.expandir_colunas_equipe acrescenta à
+# projeção as demais posições que existirem na Distribuição (nenhuma posição fica de fora).
+PADRAO_COLUNA_EQUIPE = re.compile(r'^(CODJ|AJUDANTE)_(\d+)$')
+POSICOES_EQUIPE_PADRAO = 3
+COLUNAS_EQUIPE = [f'{prefixo}_{i}' for i in range(1, POSICOES_EQUIPE_PADRAO + 1) for prefixo in ('CODJ', 'AJUDANTE')]
+
+def colunas_equipe(colunas: Iterable[str], prefixo: Optional[str] = None) -> List[str]:
+    """Colunas de equipe entre 'colunas' (só as de 'prefixo', ex. 'CODJ', se dado), por posição."""
+    encontradas = []
+    for col in colunas:
+        m = PADRAO_COLUNA_EQUIPE.match(str(col))
+        if m and (prefixo is None or m.group(1) == prefixo):
+            encontradas.append((int(m.group(2)), m.group(1) != 'CODJ', col))
+    return [col for _, _, col in sorted(encontradas)]
+
+# Colunas da Distribuição lidas pelo motor do xadrez (usadas na projeção do select).
+COLUNAS_XADREZ = ['COD', 'MOTORISTA', 'COD_2', 'MOTORISTA_2'] + COLUNAS_EQUIPE
 
 def limpar_texto(text):
     if not isinstance(text, str):
@@ -10,63 +32,120 @@ def limpar_texto(text):
     ascii_bytes = nfkd_form.encode('ASCII', 'ignore')
     return ascii_bytes.decode('utf-8')
 
+# Memo dos textos já normalizados (nomes de motoristas/ajudantes repetem-se em milhares de viagens).
+TAMANHO_MEMO_TEXTO = 16384
+_limpar_texto_memo = functools.lru_cache(maxsize=TAMANHO_MEMO_TEXTO)(limpar_texto)
+
+def limpar_serie(serie: pd.Series) -> pd.Series:
+    """
+    Equivalente a serie.apply(limpar_texto), mas normaliza cada texto distinto uma única vez
+    (factorize + memo) e espalha o resultado pelos códigos de forma vetorizada.
+    Valores que não são texto (números, None, NaN) ficam intactos.
+    """
+    valores = serie.to_numpy(dtype=object)
+    try:
+        codigos, unicos = pd.factorize(valores)
+    except TypeError:
+        # Valores não hasheáveis (ex.: colunas JSON): caminho célula a célula.
+        return serie.apply(limpar_texto)
+
+    eh_texto = np.fromiter((isinstance(u, str) for u in unicos), dtype=bool, count=len(unicos))
+    resultado = valores.copy()
+    if eh_texto.any():
+        limpos = np.array([_limpar_texto_memo(u) if t else u for u, t in zip(unicos, eh_texto)], dtype=object)
+        posicoes = codigos >= 0
+        posicoes[posicoes] = eh_texto[codigos[posicoes]]
+        resultado[posicoes] = limpos[codigos[posicoes]]
+    # infer_objects reproduz a inferência de dtype que o .apply faria
+    return pd.Series(resultado, index=serie.index, name=serie.name).infer_objects()
+
+COLUNAS_MELTED = ['MOTORISTA_COD', 'MOTORISTA_NOME', 'AJUDANTE_NOME', 'AJUDANTE_COD', 'POSICAO']
+
 def _preparar_dataframe_ajudantes(df: pd.DataFrame) -> pd.DataFrame:
-    ajudantes_dfs = []
-    colunas_ajudante = sorted(df.filter(regex=r'^AJUDANTE_\d+$').columns)
-    for aj_col in colunas_ajudante:
-        try:
-            num = aj_col.split('_')[-1]
-            cod_col = f'CODJ_{num}'
-            if cod_col in df.columns:
-                temp_df = df[['COD', 'MOTORISTA', aj_col, cod_col]].copy()
-                temp_df.rename(columns={
-                    'COD': 'MOTORISTA_COD', 
-                    'MOTORISTA': 'MOTORISTA_NOME',
-                    aj_col: 'AJUDANTE_NOME', 
-                    cod_col: 'AJUDANTE_COD'
-                }, inplace=True)
-                temp_df['POSICAO'] = f'AJUDANTE {num}'
-                ajudantes_dfs.append(temp_df)
-        except Exception as e:
-            print(f"Erro ao processar coluna {aj_col}: {e}")
-            continue
-
-    if not ajudantes_dfs:
-        return pd.DataFrame(columns=['MOTORISTA_COD', 'MOTORISTA_NOME', 'AJUDANTE_NOME', 'AJUDANTE_COD', 'POSICAO'])
-    
-    df_global_melted = pd.concat(ajudantes_dfs)
-    
-    # --- SANITIZAÇÃO RIGOROSA ---
-    # 1. Remove caracteres inválidos
-    df_global_melted['AJUDANTE_NOME'] = df_global_melted['AJUDANTE_NOME'].astype(str)
-    
+    """
+    Uma linha por (viagem, posição de ajudante) com nome e código válidos.
+    Todos os pares AJUDANTE_n/CODJ_n passam de largo para longo num único reshape
+    (bloco da posição 1, depois 2, ...), e só as linhas que sobrevivem à sanitização
+    chegam a ser materializadas.
+    """
+    pares = []
+    for aj_col in sorted(df.filter(regex=r'^AJUDANTE_\d+$').columns):
+        num = aj_col.split('_')[-1]
+        if f'CODJ_{num}' in df.columns:
+            pares.append((aj_col, f'CODJ_{num}', f'AJUDANTE {num}'))
+
+    if not pares or 'COD' not in df.columns or 'MOTORISTA' not in df.columns:
+        if pares:
+            print("Erro ao processar ajudantes: colunas COD/MOTORISTA ausentes")
+        return pd.DataFrame(columns=COLUNAS_MELTED)
+
+    # Só as células com CODJ numérico seguem adiante; o texto das demais nem é convertido.
+    linhas, posicoes, codigos, nomes = [], [], [], []
+    for i, (aj_col, cod_col, _) in enumerate(pares):
+        cod = pd.to_numeric(df[cod_col], errors='coerce').to_numpy(dtype=float)
+        com_codigo = np.flatnonzero(~np.isnan(cod))
+        linhas.append(com_codigo)
+        posicoes.append(np.full(len(com_codigo), i))
+        codigos.append(cod[com_codigo])
+        # --- SANITIZAÇÃO RIGOROSA ---
+        # 1. Nomes como texto (None -> 'None', NaN -> 'nan', como no astype(str) por célula)
+        nomes.append(df[aj_col].iloc[com_codigo].astype(str).to_numpy(dtype=object))
+
+    linhas = np.concatenate(linhas)
+    posicoes = np.concatenate(posicoes)
+    codigos = np.concatenate(codigos)
+
+    # Os nomes se repetem em milhares de viagens: a limpeza roda uma vez por nome distinto.
+    ids_nome, distintos = pd.factorize(np.concatenate(nomes))
+    distintos = pd.Series(distintos, dtype=object)
+
     # 2. Split de nomes compostos com '/' (Ex: "JOAO / MARIA")
     # Assume-se que o ID (CODJ) pertence ao primeiro nome listado.
-    df_global_melted['AJUDANTE_NOME'] = df_global_melted['AJUDANTE_NOME'].apply(
-        lambda x: x.split('/')[0].strip() if '/' in x else x
-    )
-
-    df_global_melted.dropna(subset=['AJUDANTE_NOME'], inplace=True)
-    df_global_melted = df_global_melted[df_global_melted['AJUDANTE_NOME'].str.strip() != '']
-    df_global_melted['AJUDANTE_COD'] = pd.to_numeric(df_global_melted['AJUDANTE_COD'], errors='coerce')
-    df_global_melted.dropna(subset=['AJUDANTE_COD'], inplace=True)
-    df_global_melted['AJUDANTE_COD'] = df_global_melted['AJUDANTE_COD'].astype(int)
-    
-    return df_global_melted.drop_duplicates()
+    compostos = distintos.str.contains('/', regex=False).to_numpy(dtype=bool)
+    if compostos.any():
+        distintos[compostos] = distintos[compostos].str.split('/', n=1).str[0].str.strip()
+
+    validas = (distintos.str.strip() != '').to_numpy(dtype=bool)[ids_nome]
+    linhas, posicoes, codigos = linhas[validas], posicoes[validas], codigos[validas].astype(int)
+    # Nomes compostos diferentes podem virar o mesmo nome limpo
+    ids_limpo, limpos = pd.factorize(distintos)
+    ids_nome = ids_limpo[ids_nome[validas]]
+
+    # drop_duplicates sobre chaves inteiras: as colunas de texto só são montadas para as linhas únicas
+    ids_motorista = df.groupby(['COD', 'MOTORISTA'], sort=False, dropna=False).ngroup().to_numpy()
+    unicas = ~pd.DataFrame({
+        'm': ids_motorista[linhas], 'n': ids_nome, 'c': codigos, 'p': posicoes
+    }).duplicated().to_numpy()
+    linhas = linhas[unicas]
+
+    return pd.DataFrame({
+        'MOTORISTA_COD': df['COD'].to_numpy()[linhas],
+        'MOTORISTA_NOME': df['MOTORISTA'].to_numpy()[linhas],
+        'AJUDANTE_NOME': np.asarray(limpos, dtype=object)[ids_nome[unicas]],
+        'AJUDANTE_COD': codigos[unicas],
+        'POSICAO': np.array([p for _, _, p in pares], dtype=object)[posicoes[unicas]],
+    }, index=df.index[linhas])
+
+def _moda_por_grupo(df: pd.DataFrame, chave: str, coluna: str, padrao: Any) -> dict:
+    """
+    Equivalente a groupby(chave)[coluna].apply(lambda x: x.mode().iloc[0]) sem lambda por grupo:
+    conta os pares (chave, valor) uma vez e fica com o mais frequente; no empate vence o menor
+    valor, como no mode() (que devolve as modas ordenadas). Grupos só com nulos recebem o padrão.
+    """
+    contagem = df.groupby([chave, coluna], sort=False).size().reset_index(name='_QTD')
+    contagem = contagem.sort_values([chave, '_QTD', coluna], ascending=[True, False, True], kind='mergesort')
+    moda = contagem.drop_duplicates(subset=[chave]).set_index(chave)[coluna].to_dict()
+
+    chaves = df[chave].dropna().unique()
+    if len(moda) < len(chaves):
+        moda = {k: moda.get(k, padrao) for k in np.sort(chaves).tolist()}
+    return moda
 
 def _calcular_mapas_referencia(df_melted: pd.DataFrame, df_original: pd.DataFrame) -> dict:
-    motorista_fixo_map = df_melted.groupby('AJUDANTE_COD')['MOTORISTA_COD'].apply(
-        lambda x: x.mode().iloc[0] if not x.mode().empty else None
-    ).to_dict()
-    
-    posicao_fixa_map = df_melted.groupby('AJUDANTE_COD')['POSICAO'].apply(
-        lambda x: x.mode().iloc[0] if not x.mode().empty else 'AJUDANTE 1'
-    ).to_dict()
-    
-    nome_ajudante_map = df_melted.groupby('AJUDANTE_COD')['AJUDANTE_NOME'].apply(
-        lambda x: x.mode().iloc[0] if not x.mode().empty else ''
-    ).to_dict()
-    
+    motorista_fixo_map = _moda_por_grupo(df_melted, 'AJUDANTE_COD', 'MOTORISTA_COD', None)
+    posicao_fixa_map = _moda_por_grupo(df_melted, 'AJUDANTE_COD', 'POSICAO', 'AJUDANTE 1')
+    nome_ajudante_map = _moda_por_grupo(df_melted, 'AJUDANTE_COD', 'AJUDANTE_NOME', '')
+
     contagem_viagens_motorista = df_original['COD'].value_counts().to_dict()
     
     motorista_nome_map = {}
@@ -81,32 +160,50 @@ def _calcular_mapas_referencia(df_melted: pd.DataFrame, df_original: pd.DataFram
         "motorista_nome_map": motorista_nome_map
     }
 
+def _agrupar_viagens_por_motorista(
+    contagem_viagens_ajudantes: pd.DataFrame,
+    mapas: Dict[str, Any],
+    regras: Dict[str, Any]
+) -> Dict[int, List[Dict[str, Any]]]:
+    """
+    Classifica todos os pares (motorista, ajudante) de uma vez e agrupa por motorista.
+    Fixo: o motorista é o mais frequente do ajudante, ou o par passa de
+    RATIO_SIGNIFICANCIA_FIXO das viagens do motorista. Os demais são visitantes.
+    """
+    contagem = contagem_viagens_ajudantes
+    viagens = contagem['VIAGENS'].to_numpy(dtype=float)
+    total = contagem['MOTORISTA_COD'].map(mapas["contagem_viagens_motorista"]).fillna(0).to_numpy(dtype=float)
+    ratio = np.divide(viagens, total, out=np.zeros_like(viagens), where=total > 0)
+
+    is_primary_fixed = (contagem['AJUDANTE_COD'].map(mapas["motorista_fixo_map"]) == contagem['MOTORISTA_COD']).to_numpy()
+    is_fixo = is_primary_fixed | (ratio > regras["RATIO_SIGNIFICANCIA_FIXO"])
+    posicao_fixa = contagem['AJUDANTE_COD'].map(mapas["posicao_fixa_map"]).fillna('AJUDANTE 1')
+
+    viagens_por_motorista: Dict[int, List[Dict[str, Any]]] = {}
+    for cod_motorista, cod_ajudante, nome, num, fixo, posicao in zip(
+        contagem['MOTORISTA_COD'].tolist(), contagem['AJUDANTE_COD'].tolist(), contagem['AJUDANTE_NOME'].tolist(),
+        contagem['VIAGENS'].tolist(), is_fixo.tolist(), posicao_fixa.tolist()
+    ):
+        viagens_por_motorista.setdefault(cod_motorista, []).append({
+            'cod_ajudante': int(cod_ajudante),
+            'nome_ajudante': nome,
+            'num_viagens': int(num), # Garante int
+            'fixo': fixo,
+            'posicao_fixa': posicao
+        })
+    return viagens_por_motorista
+
 def _classificar_e_atribuir_viagens(
     info_linha: Dict[str, Any], 
-    viagens_com_motorista: pd.DataFrame, 
-    mapas: Dict[str, Any], 
+    viagens_com_motorista: List[Dict[str, Any]], 
     total_viagens: int,
     regras: Dict[str, Any],
     ids_visiveis: set
 ):
-    viagens_fixas = []
-    viagens_visitantes = []
-    
-    for _, viagem in viagens_com_motorista.iterrows():
-        viagem_data = {
-            'cod_ajudante': int(viagem['AJUDANTE_COD']),
-            'nome_ajudante': viagem['AJUDANTE_NOME'],
-            'num_viagens': int(viagem['VIAGENS']) # Garante int
-        }
-        is_primary_fixed = mapas["motorista_fixo_map"].get(viagem_data['cod_ajudante']) == info_linha['COD']
-        significance_ratio = (viagem_data['num_viagens'] / total_viagens) if total_viagens > 0 else 0
-        is_significant = significance_ratio > regras["RATIO_SIGNIFICANCIA_FIXO"]
-        if is_primary_fixed or is_significant:
-            viagem_data['posicao_fixa'] = mapas["posicao_fixa_map"].get(viagem_data['cod_ajudante'], 'AJUDANTE 1')
-            viagens_fixas.append(viagem_data)
-            ids_visiveis.add(viagem_data['cod_ajudante'])
-        else:
-            viagens_visitantes.append(viagem_data)
+    viagens_fixas = [v for v in viagens_com_motorista if v['fixo']]
+    viagens_visitantes = [v for v in viagens_com_motorista if not v['fixo']]
+    for fixo in viagens_fixas:
+        ids_visiveis.add(fixo['cod_ajudante'])
 
     tem_fixo_acima_de_10 = False
     for fixo in viagens_fixas:
@@ -133,7 +230,15 @@ def _classificar_e_atribuir_viagens(
             info_linha['VISITANTES'].append(f"{visitante['nome_ajudante'].strip()} ({visitante['num_viagens']}x)")
             ids_visiveis.add(visitante['cod_ajudante'])
 
-def gerar_dashboard_e_mapas(df: pd.DataFrame) -> dict:
+def gerar_dashboard_e_mapas(
+    df: pd.DataFrame,
+    df_melted: Optional[pd.DataFrame] = None,
+    mapas: Optional[Dict[str, Any]] = None
+) -> dict:
+    """
+    Xadrez de equipas fixas do período. 'df_melted' e 'mapas' podem vir já calculados
+    (ver core.context.ContextoCalculo) para não repetir a expansão e as modas.
+    """
     regras = {
         "RATIO_SIGNIFICANCIA_FIXO": 0.40,
         "MIN_VIAGENS_PARA_ATIVAR_REGRA_ESTRITA": 10,
@@ -142,7 +247,8 @@ def gerar_dashboard_e_mapas(df: pd.DataFrame) -> dict:
         "LIMITE_VISITANTE_PADRAO": 1,
     }
     
-    df_melted = _preparar_dataframe_ajudantes(df)
+    if df_melted is None:
+        df_melted = _preparar_dataframe_ajudantes(df)
     
     if df_melted.empty:
         return {
@@ -152,7 +258,8 @@ def gerar_dashboard_e_mapas(df: pd.DataFrame) -> dict:
             "ids_visiveis": set()
         }
 
-    mapas = _calcular_mapas_referencia(df_melted, df)
+    if mapas is None:
+        mapas = _calcular_mapas_referencia(df_melted, df)
     contagem_viagens_ajudantes = df_melted.groupby(['MOTORISTA_COD', 'AJUDANTE_COD']).size().reset_index(name='VIAGENS')
     contagem_viagens_ajudantes['AJUDANTE_NOME'] = contagem_viagens_ajudantes['AJUDANTE_COD'].map(mapas["nome_ajudante_map"])
     
@@ -166,8 +273,12 @@ def gerar_dashboard_e_mapas(df: pd.DataFrame) -> dict:
          return {"dashboard_data": [], "mapas": mapas, "df_melted": df_melted, "ids_visiveis": set()}
 
     motoristas_no_periodo = df[colunas_existentes].drop_duplicates(subset=['COD'])
-    
-    for _, motorista_row in motoristas_no_periodo.iterrows():
+    viagens_por_motorista = _agrupar_viagens_por_motorista(contagem_viagens_ajudantes, mapas, regras)
+
+    max_pos = df_melted['POSICAO'].nunique()
+    if max_pos < 3: max_pos = 3
+
+    for motorista_row in motoristas_no_periodo.to_dict('records'):
         cod_motorista = int(motorista_row['COD'])
         total_viagens = mapas["contagem_viagens_motorista"].get(cod_motorista, 0)
         
@@ -183,17 +294,12 @@ def gerar_dashboard_e_mapas(df: pd.DataFrame) -> dict:
             'COD_2': motorista_row.get('COD_2'),
             'VISITANTES': []
         }
-        max_pos = df_melted['POSICAO'].nunique() if not df_melted.empty else 3
-        if max_pos < 3: max_pos = 3
-            
         for i in range(1, max_pos + 1):
             info_linha[f'AJUDANTE_{i}'] = ''
             info_linha[f'CODJ_{i}'] = ''
         
-        viagens_com_motorista = contagem_viagens_ajudantes[contagem_viagens_ajudantes['MOTORISTA_COD'] == cod_motorista]
-        
         _classificar_e_atribuir_viagens(
-            info_linha, viagens_com_motorista, mapas, total_viagens, regras, ids_visiveis
+            info_linha, viagens_por_motorista.get(cod_motorista, []), total_viagens, regras, ids_visiveis
         )
         dashboard_data.append(info_linha)
     if dashboard_data:
@@ -0,0 +1,279 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Mapping
+from types import MappingProxyType
+from typing import Any, Callable, Dict, Hashable, Optional
+import numpy as np
+import pandas as pd
+from loguru import logger
+
+def tamanho_dataframe(df: pd.DataFrame) -> int:
+    """Bytes ocupados pelo DataFrame (inclui o conteúdo das strings)."""
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+class CacheLRU:
+    """
+    Cache chave -> valor com TTL e expulsão LRU limitada pela soma dos tamanhos.
+    'medir' calcula o tamanho de cada valor em bytes (por omissão, de um DataFrame).
+    Seguro para uso a partir das threads do threadpool.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int,
+        ttl_segundos: float,
+        medir: Callable[[Any], int] = tamanho_dataframe
+    ):
+        self.max_bytes = max_bytes
+        self.ttl_segundos = ttl_segundos
+        self._medir = medir
+        self._lock = threading.Lock()
+        # chave -> (valor, tamanho, guardado_em)
+        self._entradas: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._bytes = 0
+        self._acertos = 0
+        self._falhas = 0
+
+    def obter(self, chave: Hashable) -> Optional[Any]:
+        with self._lock:
+            entrada = self._entradas.get(chave)
+            if entrada is None:
+                self._falhas += 1
+                return None
+            valor, tamanho, guardado_em = entrada
+            if time.monotonic() - guardado_em > self.ttl_segundos:
+                self._remover(chave)
+                self._falhas += 1
+                return None
+            self._entradas.move_to_end(chave)
+            self._acertos += 1
+            return valor
+
+    def espiar(self, chave: Hashable) -> Optional[Any]:
+        """Como obter, mas sem contar acerto/falha nem mexer na ordem LRU."""
+        with self._lock:
+            entrada = self._entradas.get(chave)
+        if entrada is None or time.monotonic() - entrada[2] > self.ttl_segundos:
+            return None
+        return entrada[0]
+
+    def guardar(self, chave: Hashable, valor: Any) -> None:
+        tamanho = self._medir(valor)
+        with self._lock:
+            if chave in self._entradas:
+                self._remover(chave)
+            if tamanho > self.max_bytes:
+                # Valor maior que o cache inteiro: não vale a pena guardar.
+                return
+            self._entradas[chave] = (valor, tamanho, time.monotonic())
+            self._bytes += tamanho
+            while self._bytes > self.max_bytes:
+                self._remover(next(iter(self._entradas)))
+
+    def remover(self, chave: Hashable) -> None:
+        with self._lock:
+            if chave in self._entradas:
+                self._remover(chave)
+
+    def limpar(self) -> None:
+        with self._lock:
+            self._entradas.clear()
+            self._bytes = 0
+
+    def estatisticas(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entradas": len(self._entradas),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "acertos": self._acertos,
+                "falhas": self._falhas,
+            }
+
+    def _remover(self, chave: Hashable) -> None:
+        _, tamanho, _ = self._entradas.pop(chave)
+        self._bytes -= tamanho
+
+
+def calcular_versao(valor: Any) -> str:
+    """Impressão digital do conteúdo (estável entre processos) usada como versão."""
+    h = hashlib.sha1()
+    if isinstance(valor, pd.DataFrame):
+        h.update(json.dumps([str(c) for c in valor.columns]).encode())
+        h.update(pd.util.hash_pandas_object(valor, index=False).values.tobytes())
+    else:
+        h.update(json.dumps(copia_editavel(valor), sort_keys=True, default=str).encode())
+    return h.hexdigest()[:16]
+
+def somente_leitura(valor: Any) -> Any:
+    """
+    Versão imutável de um valor em cache: dicts viram MappingProxyType (também os aninhados),
+    listas viram tuplas e as colunas de um DataFrame ficam em arrays não graváveis, de modo que
+    uma escrita no lugar (df.loc[...] = ..., metas[...] = ...) falha em vez de alterar o cache.
+    """
+    if isinstance(valor, pd.DataFrame):
+        colunas = {}
+        for i, col in enumerate(valor.columns):
+            serie = valor.iloc[:, i]
+            if isinstance(serie.dtype, np.dtype):
+                array = serie.to_numpy(copy=True)
+                array.flags.writeable = False
+            else:
+                # Arrays de extensão (Int64, string[pyarrow]) não têm a flag: copiados apenas
+                array = serie.array.copy()
+            colunas[i] = array
+        df = pd.DataFrame(colunas, index=valor.index, copy=False)
+        df.columns = valor.columns
+        return df
+    if isinstance(valor, Mapping):
+        return MappingProxyType({chave: somente_leitura(v) for chave, v in valor.items()})
+    if isinstance(valor, (list, tuple)):
+        return tuple(somente_leitura(v) for v in valor)
+    return valor
+
+def copia_editavel(valor: Any) -> Any:
+    """Cópia comum (dict, list, DataFrame gravável) de um valor de somente_leitura()."""
+    if isinstance(valor, pd.DataFrame):
+        return valor.copy()
+    if isinstance(valor, Mapping):
+        return {chave: copia_editavel(v) for chave, v in valor.items()}
+    if isinstance(valor, tuple):
+        return [copia_editavel(v) for v in valor]
+    return valor
+
+class CacheReferencia:
+    """
+    Cache de dados de referência (Cadastro, Metas) com versão e stale-while-revalidate:
+    - até 'ttl_segundos' a entrada é servida diretamente;
+    - até 'ttl_segundos + janela_stale_segundos' é servida e recarregada em segundo plano;
+    - depois disso (ou sem entrada) é carregada na hora, uma única vez por chave.
+    'carregar' devolve o valor ou None (não guardado); exceções não apagam a entrada antiga.
+    Os valores são guardados em somente_leitura() e partilhados entre os chamadores: alterá-los
+    no lugar falha; quem precisar de os modificar usa copia_editavel().
+    """
+
+    def __init__(self, ttl_segundos: float, janela_stale_segundos: float):
+        self.ttl_segundos = ttl_segundos
+        self.janela_stale_segundos = janela_stale_segundos
+        self._lock = threading.Lock()
+        # chave -> (valor, versão, carregado_em)
+        self._entradas: Dict[str, tuple] = {}
+        self._locks_carga: Dict[str, threading.Lock] = {}
+        self._em_revalidacao: set = set()
+        # chave -> (versão da fonte, artefacto)
+        self._derivados: Dict[str, tuple] = {}
+        # chave -> geração, incrementada a cada invalidação da chave (todas com invalidar()):
+        # uma carga iniciada antes dela não é guardada; as outras chaves não são afetadas.
+        self._geracao: Dict[str, int] = {}
+
+    def obter(self, chave: str, carregar: Callable[[], Any]) -> Any:
+        """
+        Valor em cache da chave (só leitura), carregado se preciso. Um DataFrame é entregue como
+        cópia rasa: acrescentar ou trocar colunas não afeta o cache, escrever nos valores falha.
+        """
+        entrada = self._obter_entrada(chave, carregar)
+        if entrada is None:
+            return None
+        valor = entrada[0]
+        return valor.copy(deep=False) if isinstance(valor, pd.DataFrame) else valor
+
+    def derivado(
+        self,
+        chave: str,
+        chave_fonte: str,
+        carregar_fonte: Callable[[], Any],
+        construir: Callable[[Any], Any]
+    ) -> Any:
+        """
+        Artefacto calculado a partir de uma entrada (ex.: índice de CPFs sobre o Cadastro),
+        construído uma única vez por versão da fonte e partilhado entre os chamadores.
+        'construir' recebe o valor em cache (só leitura, ver somente_leitura).
+        """
+        entrada = self._obter_entrada(chave_fonte, carregar_fonte)
+        if entrada is None:
+            return None
+        with self._lock:
+            atual = self._derivados.get(chave)
+        if atual is not None and atual[0] == entrada[1]:
+            return atual[1]
+        with self._lock_carga(chave):
+            with self._lock:
+                atual = self._derivados.get(chave)
+            if atual is not None and atual[0] == entrada[1]:
+                return atual[1]
+            valor = construir(entrada[0])
+            with self._lock:
+                self._derivados[chave] = (entrada[1], valor)
+            return valor
+
+    def _obter_entrada(self, chave: str, carregar: Callable[[], Any]) -> Optional[tuple]:
+        entrada = self._entrada_valida(chave)
+        if entrada is None:
+            with self._lock_carga(chave):
+                # Outro pedido pode ter carregado enquanto esperávamos.
+                entrada = self._entrada_valida(chave)
+                if entrada is None:
+                    entrada = self._carregar(chave, carregar)
+        elif time.monotonic() - entrada[2] > self.ttl_segundos:
+            self._revalidar_em_segundo_plano(chave, carregar)
+        return entrada
+
+    def versao(self, chave: str) -> Optional[str]:
+        """Versão da entrada que obter() serviria agora sem recarregar; None se não houver."""
+        entrada = self._entrada_valida(chave)
+        return entrada[1] if entrada else None
+
+    def invalidar(self, chave: Optional[str] = None) -> None:
+        with self._lock:
+            for invalidada in (self._geracao if chave is None else [chave]):
+                self._geracao[invalidada] = self._geracao.get(invalidada, 0) + 1
+            if chave is None:
+                self._entradas.clear()
+                self._derivados.clear()
+            else:
+                self._entradas.pop(chave, None)
+
+    def _entrada_valida(self, chave: str) -> Optional[tuple]:
+        with self._lock:
+            entrada = self._entradas.get(chave)
+        if entrada is None or time.monotonic() - entrada[2] > self.ttl_segundos + self.janela_stale_segundos:
+            return None
+        return entrada
+
+    def _lock_carga(self, chave: str) -> threading.Lock:
+        with self._lock:
+            return self._locks_carga.setdefault(chave, threading.Lock())
+
+    def _carregar(self, chave: str, carregar: Callable[[], Any]) -> Optional[tuple]:
+        with self._lock:
+            # Registada antes de carregar, para que invalidar() a incremente
+            geracao = self._geracao.setdefault(chave, 0)
+        valor = carregar()
+        if valor is None:
+            return None
+        entrada = (somente_leitura(valor), calcular_versao(valor), time.monotonic())
+        with self._lock:
+            if geracao == self._geracao[chave]:
+                self._entradas[chave] = entrada
+        return entrada
+
+    def _revalidar_em_segundo_plano(self, chave: str, carregar: Callable[[], Any]) -> None:
+        with self._lock:
+            if chave in self._em_revalidacao:
+                return
+            self._em_revalidacao.add(chave)
+
+        def revalidar():
+            try:
+                with self._lock_carga(chave):
+                    self._carregar(chave, carregar)
+            except Exception as e:
+                logger.warning(f"Revalidação de '{chave}' falhou, mantendo a versão anterior: {e}")
+            finally:
+                with self._lock:
+                    self._em_revalidacao.discard(chave)
+
+        threading.Thread(target=revalidar, name=f"revalidar-{chave}", daemon=True).start()
@@ -0,0 +1,67 @@
+import functools
+import pandas as pd
+from typing import Any, Dict, Optional
+from .analysis import _preparar_dataframe_ajudantes, _calcular_mapas_referencia, gerar_dashboard_e_mapas
+from .indexes import IndicePessoas
+from .loader import deduplicar_viagens
+
+class ContextoCalculo:
+    """
+    Dados de uma requisição e os artefactos derivados deles, partilhados pelos motores
+    (xadrez, incentivo, caixas). Cada artefacto é calculado na primeira vez que um motor
+    o pede e reaproveitado pelos seguintes (ex.: /pagamento corre incentivo e caixas
+    sobre a mesma deduplicação, a mesma expansão de ajudantes e os mesmos mapas).
+    Os artefactos são partilhados: os motores não os devem alterar.
+    """
+
+    def __init__(
+        self,
+        viagens_bruto: Optional[pd.DataFrame] = None,
+        viagens: Optional[pd.DataFrame] = None,
+        pessoas: Optional[IndicePessoas] = None,
+        indicadores: Optional[pd.DataFrame] = None,
+        caixas: Optional[pd.DataFrame] = None,
+        metas: Optional[Dict[str, Any]] = None
+    ):
+        self.viagens_bruto = viagens_bruto
+        self._viagens = viagens
+        self.pessoas = pessoas
+        self.indicadores = indicadores
+        self.caixas = caixas
+        self.metas = metas or {}
+
+    @classmethod
+    def de_fontes(cls, dados: Dict[str, Any]) -> "ContextoCalculo":
+        """Contexto a partir do resultado de core.loader.carregar_fontes."""
+        return cls(
+            viagens_bruto=dados.get("df_viagens_bruto"),
+            viagens=dados.get("df_viagens_dedup"),
+            pessoas=dados.get("indice_pessoas"),
+            indicadores=dados.get("df_indicadores"),
+            caixas=dados.get("df_caixas"),
+            metas=dados.get("metas"),
+        )
+
+    @functools.cached_property
+    def viagens(self) -> Optional[pd.DataFrame]:
+        """Viagens deduplicadas (uma por MAPA)."""
+        if self._viagens is not None:
+            return self._viagens
+        return deduplicar_viagens(self.viagens_bruto)
+
+    @functools.cached_property
+    def df_melted(self) -> pd.DataFrame:
+        """Uma linha por (viagem, posição de ajudante), como em gerar_dashboard_e_mapas."""
+        return _preparar_dataframe_ajudantes(self.viagens)
+
+    @functools.cached_property
+    def mapas(self) -> Dict[str, Any]:
+        """Mapas de referência (motorista fixo, posição, nomes); vazio sem ajudantes."""
+        if self.df_melted.empty:
+            return {}
+        return _calcular_mapas_referencia(self.df_melted, self.viagens)
+
+    @functools.cached_property
+    def xadrez(self) -> Dict[str, Any]:
+        """Resultado de gerar_dashboard_e_mapas sobre os artefactos já calculados."""
+        return gerar_dashboard_e_mapas(self.viagens, df_melted=self.df_melted, mapas=self.mapas)
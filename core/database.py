@@ -1,80 +1,322 @@
 import os
 import pandas as pd
 from supabase import Client
-from typing import Optional, Tuple
-from .analysis import limpar_texto 
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from .analysis import colunas_equipe, limpar_texto, limpar_serie
+from .cache import CacheLRU, CacheReferencia, calcular_versao, tamanho_dataframe
+from .indexes import IndicePessoas
 import functools
+from concurrent.futures import ThreadPoolExecutor
 from fastapi import Request
 
 NOME_DA_TABELA = "Distribuição"
 NOME_COLUNA_DATA = "DATA"
+COLUNAS_BUSCA = ['MOTORISTA', 'MOTORISTA_2', 'AJUDANTE_1', 'AJUDANTE_2', 'AJUDANTE_3']
 
 def get_supabase(request: Request) -> Client:
     """Função centralizada para recuperar o cliente Supabase do estado da requisição."""
     return request.state.supabase
 
+def unir_colunas(*listas: Optional[Iterable[str]]) -> Optional[List[str]]:
+    """
+    União ordenada das colunas declaradas por cada consumidor.
+    None significa "todas as colunas" e prevalece sobre qualquer lista.
+    """
+    if any(lista is None for lista in listas):
+        return None
+    return list(dict.fromkeys(col for lista in listas for col in lista))
+
 def validar_colunas(df: pd.DataFrame, colunas_obrigatorias: list):
     """Verifica se todas as colunas necessárias estão presentes no DataFrame para evitar KeyError."""
     colunas_faltantes = [col for col in colunas_obrigatorias if col not in df.columns]
     if colunas_faltantes:
         raise KeyError(f"Colunas obrigatórias ausentes na tabela: {', '.join(colunas_faltantes)}")
 
+# --- PAGINAÇÃO DA DISTRIBUIÇÃO ---
+NOME_COLUNA_ID = "id"
+TAMANHO_PAGINA = 1000  # Limite de linhas por requisição do Supabase
+# Número máximo de páginas pedidas em simultâneo (DISTRIBUICAO_PAGINAS_PARALELAS=1 desliga o paralelismo).
+PAGINAS_PARALELAS = max(1, int(os.environ.get("DISTRIBUICAO_PAGINAS_PARALELAS", "4")))
+
+def _consulta_distribuicao(supabase: Client, data_inicio_str: str, data_fim_str: str, colunas: str = "*", **select_kwargs):
+    return (
+        supabase.table(NOME_DA_TABELA)
+        .select(colunas, **select_kwargs)
+        .gte(NOME_COLUNA_DATA, data_inicio_str)
+        .lte(NOME_COLUNA_DATA, data_fim_str)
+    )
+
+def _buscar_pagina_distribuicao(supabase: Client, data_inicio_str: str, data_fim_str: str, pagina: int, colunas: str = "*") -> list:
+    # Ordenação total por (DATA, id): as páginas não se sobrepõem e o resultado é determinístico.
+    response = (
+        _consulta_distribuicao(supabase, data_inicio_str, data_fim_str, colunas)
+        .order(NOME_COLUNA_DATA)
+        .order(NOME_COLUNA_ID)
+        .range(pagina * TAMANHO_PAGINA, (pagina + 1) * TAMANHO_PAGINA - 1)
+        .execute()
+    )
+    return response.data or []
+
+def _contar_distribuicao(supabase: Client, data_inicio_str: str, data_fim_str: str) -> Optional[int]:
+    try:
+        response = _consulta_distribuicao(
+            supabase, data_inicio_str, data_fim_str, NOME_COLUNA_ID, count="exact", head=True
+        ).execute()
+        return response.count
+    except Exception as e:
+        print(f"Contagem da Distribuição indisponível, usando paginação sequencial: {e}")
+        return None
+
+def _buscar_distribuicao(
+    supabase: Client,
+    data_inicio_str: str,
+    data_fim_str: str,
+    paginas_paralelas: int = PAGINAS_PARALELAS,
+    colunas: str = "*"
+) -> list:
+    """
+    Busca todas as linhas do período. Conta as linhas primeiro e pede as páginas
+    em paralelo (até 'paginas_paralelas' de cada vez), juntando-as pela ordem.
+    Se a contagem falhar, ou se entraram linhas depois dela, continua sequencialmente
+    até receber uma página incompleta.
+    """
+    if colunas != "*":
+        # Projeção: se alguma coluna pedida não existir na tabela, repete com todas.
+        try:
+            return _buscar_distribuicao_paginas(supabase, data_inicio_str, data_fim_str, paginas_paralelas, colunas)
+        except Exception as e:
+            print(f"Projeção de colunas da Distribuição falhou ({e}), buscando todas as colunas.")
+            colunas = "*"
+    return _buscar_distribuicao_paginas(supabase, data_inicio_str, data_fim_str, paginas_paralelas, colunas)
+
+def _buscar_distribuicao_paginas(
+    supabase: Client,
+    data_inicio_str: str,
+    data_fim_str: str,
+    paginas_paralelas: int,
+    colunas: str
+) -> list:
+    total = _contar_distribuicao(supabase, data_inicio_str, data_fim_str)
+    if total == 0:
+        return []
+    paginas = []
+    if total:
+        num_paginas = -(-total // TAMANHO_PAGINA)
+        workers = min(paginas_paralelas, num_paginas)
+        if workers > 1:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                paginas = list(executor.map(
+                    lambda p: _buscar_pagina_distribuicao(supabase, data_inicio_str, data_fim_str, p, colunas),
+                    range(num_paginas)
+                ))
+        else:
+            paginas = [_buscar_pagina_distribuicao(supabase, data_inicio_str, data_fim_str, p, colunas) for p in range(num_paginas)]
+
+    while not paginas or len(paginas[-1]) == TAMANHO_PAGINA:
+        pagina = _buscar_pagina_distribuicao(supabase, data_inicio_str, data_fim_str, len(paginas), colunas)
+        if not pagina:
+            break
+        paginas.append(pagina)
+
+    return [linha for pagina in paginas for linha in pagina]
+
+# --- CACHE POR DIA (DISTRIBUIÇÃO E CAIXAS) ---
+# Os dados limpos são guardados em partições diárias: um período qualquer é montado a partir
+# dos dias em cache e só os dias em falta são buscados no Supabase.
+CACHE_DIAS_TTL_SEGUNDOS = float(os.environ.get("CACHE_DIAS_TTL_SEGUNDOS", "600"))
+CACHE_DIAS_MAX_BYTES = int(float(os.environ.get("CACHE_DIAS_MAX_MB", "256")) * 1024 * 1024)
+
+def _tamanho_particao(particao: tuple) -> int:
+    return tamanho_dataframe(particao[0])
+
+# dia 'YYYY-MM-DD' -> (DataFrame limpo do dia, colunas buscadas ou None para todas, versão do conteúdo)
+cache_distribuicao = CacheLRU(CACHE_DIAS_MAX_BYTES, CACHE_DIAS_TTL_SEGUNDOS, medir=_tamanho_particao)
+cache_caixas = CacheLRU(CACHE_DIAS_MAX_BYTES, CACHE_DIAS_TTL_SEGUNDOS, medir=_tamanho_particao)
+
+def _dias_do_periodo(data_inicio_str: str, data_fim_str: str) -> Optional[List[str]]:
+    try:
+        dias = pd.date_range(data_inicio_str, data_fim_str, freq="D")
+    except (ValueError, TypeError):
+        return None
+    return [dia.strftime("%Y-%m-%d") for dia in dias]
+
+def _intervalos_consecutivos(dias: List[str]) -> List[Tuple[str, str]]:
+    """Agrupa dias ordenados em intervalos contínuos (um pedido ao Supabase por intervalo)."""
+    intervalos = []
+    anterior = None
+    for dia in dias:
+        atual = pd.Timestamp(dia)
+        if anterior is not None and atual - anterior == pd.Timedelta(days=1):
+            intervalos[-1][1] = dia
+        else:
+            intervalos.append([dia, dia])
+        anterior = atual
+    return [tuple(intervalo) for intervalo in intervalos]
+
+def _carregar_por_dia(
+    cache: CacheLRU,
+    dias: List[str],
+    colunas: Optional[frozenset],
+    coluna_data: str,
+    buscar: Callable[[str, str, Optional[frozenset]], pd.DataFrame],
+    forcar: bool = False
+) -> List[pd.DataFrame]:
+    """
+    Devolve as partições dos 'dias' pedidos. Um dia em cache só serve se tiver todas as
+    'colunas' pedidas (None = todas); os dias em falta são buscados por intervalos contínuos
+    com 'buscar(inicio, fim, colunas)', divididos por dia e guardados (inclusive os vazios).
+    Com 'forcar', todos os dias são buscados de novo e substituem os que estavam em cache.
+    """
+    particoes: Dict[str, pd.DataFrame] = {}
+    em_falta = []
+    colunas_busca = colunas
+    for dia in dias:
+        entrada = None if forcar else cache.obter(dia)
+        if entrada is not None and (entrada[1] is None or (colunas is not None and colunas <= entrada[1])):
+            particoes[dia] = entrada[0]
+            continue
+        em_falta.append(dia)
+        if entrada is not None and colunas_busca is not None:
+            # Ao rebuscar um dia, mantém as colunas que ele já tinha.
+            colunas_busca = colunas_busca | entrada[1]
+
+    for inicio, fim in _intervalos_consecutivos(em_falta):
+        df = buscar(inicio, fim, colunas_busca)
+        grupos = {}
+        if not df.empty:
+            grupos = dict(tuple(df.groupby(df[coluna_data].astype(str).str[:10], sort=False)))
+        for dia in _dias_do_periodo(inicio, fim):
+            particao = grupos.get(dia, df.iloc[0:0])
+            cache.guardar(dia, (particao, colunas_busca, calcular_versao(particao)))
+            particoes[dia] = particao
+
+    return [particoes[dia] for dia in dias]
+
+def versao_periodo(cache: CacheLRU, data_inicio_str: str, data_fim_str: str) -> Optional[str]:
+    """
+    Versão dos dados de um período a partir das versões das partições diárias em cache,
+    sem ir ao Supabase. None se algum dia não estiver em cache (a versão não é conhecida).
+    """
+    dias = _dias_do_periodo(data_inicio_str, data_fim_str)
+    if dias is None:
+        return None
+    versoes = []
+    for dia in dias:
+        entrada = cache.espiar(dia)
+        if entrada is None:
+            return None
+        versoes.append(entrada[2])
+    return calcular_versao(versoes)
+
+def _juntar_particoes(particoes: List[pd.DataFrame]) -> Optional[pd.DataFrame]:
+    """Concatena as partições não vazias (sempre numa cópia, o cache não é partilhado)."""
+    preenchidas = [p for p in particoes if not p.empty]
+    if not preenchidas:
+        return None
+    # Um dia sem valores numa coluna chega como 'object'; infer_objects repõe o dtype do período inteiro.
+    return pd.concat(preenchidas, ignore_index=True).infer_objects()
+
 # --- FUNÇÃO 1: DADOS APURADOS (XADREZ) ---
+ERRO_SEM_COD = "A coluna 'COD' principal não foi encontrada."
+
+def _limpar_distribuicao(df: pd.DataFrame) -> pd.DataFrame:
+    """Limpeza de texto e validação da coluna COD principal."""
+    # Limpeza de Texto
+    # (cada texto distinto é normalizado uma vez; ver limpar_serie)
+    for col in df.select_dtypes(include=['object']):
+        df[col] = limpar_serie(df[col])
+    
+    # Validação da coluna COD principal
+    if 'COD' not in df.columns:
+        raise KeyError(ERRO_SEM_COD)
+    df['COD'] = pd.to_numeric(df['COD'], errors='coerce')
+    df.dropna(subset=['COD'], inplace=True)
+    df['COD'] = df['COD'].astype(int)
+    return df
+
+def _buscar_distribuicao_limpa(
+    supabase: Client,
+    data_inicio_str: str,
+    data_fim_str: str,
+    colunas: Optional[frozenset]
+) -> pd.DataFrame:
+    colunas_select = "*" if colunas is None else ",".join(sorted(colunas))
+    # Paginação robusta para lidar com o limite de 1000 linhas do Supabase
+    dados = _buscar_distribuicao(supabase, data_inicio_str, data_fim_str, colunas=colunas_select)
+    if not dados:
+        return pd.DataFrame()
+    return _limpar_distribuicao(pd.DataFrame(dados))
+
+CHAVE_COLUNAS_DISTRIBUICAO = "colunas_distribuicao"
+
+def _buscar_colunas_distribuicao(supabase: Client) -> Optional[List[str]]:
+    response = supabase.table(NOME_DA_TABELA).select("*").limit(1).execute()
+    return list(response.data[0]) if response.data else None
+
+def get_colunas_distribuicao(supabase: Client) -> Optional[List[str]]:
+    """Colunas da tabela Distribuição (lidas de uma linha, em cache_referencia); None se estiver vazia."""
+    return cache_referencia.obter(CHAVE_COLUNAS_DISTRIBUICAO, lambda: _buscar_colunas_distribuicao(supabase))
+
+def expandir_colunas_equipe(supabase: Client, colunas: Optional[Iterable[str]]) -> Optional[List[str]]:
+    """
+    'colunas' mais todas as posições de equipe da tabela (CODJ_n/AJUDANTE_n) dos prefixos pedidos:
+    os planos declaram as posições padrão e a tabela pode ter mais. Sem conseguir ler as colunas
+    da tabela, devolve None (todas as colunas): a projeção nunca perde posições de ajudante.
+    """
+    if colunas is None:
+        return None
+    colunas = list(colunas)
+    prefixos = {col.split('_')[0] for col in colunas_equipe(colunas)}
+    if not prefixos:
+        return colunas
+    try:
+        da_tabela = get_colunas_distribuicao(supabase)
+    except Exception as e:
+        print(f"Colunas da Distribuição indisponíveis ({e}), buscando todas as colunas.")
+        return None
+    if da_tabela is None:
+        return None
+    return unir_colunas(colunas, [col for col in colunas_equipe(da_tabela) if col.split('_')[0] in prefixos])
+
 def get_dados_apurados(
     supabase: Client, 
     data_inicio_str: str, 
     data_fim_str: str, 
-    search_str: str
+    search_str: str,
+    colunas: Optional[Iterable[str]] = None
 ) -> Tuple[Optional[pd.DataFrame], Optional[str]]:
     """
     Busca dados do Supabase (Distribuição), limpa e filtra.
+    'colunas' restringe o select às colunas usadas pelo chamador (None = todas);
+    DATA, MAPA (deduplicação), COD e as colunas de pesquisa são sempre incluídas,
+    assim como todas as posições de equipe da tabela (expandir_colunas_equipe).
+    Os dias já buscados vêm de cache_distribuicao; só os dias em falta vão ao Supabase.
     Retorna o DataFrame ou (None, error_message).
     """
     try:
-        dados_completos = []
-        page_size = 1000
-        page = 0
-        
-        while True:
-            # Paginação robusta para lidar com o limite de 1000 linhas do Supabase
-            query = (
-                supabase.table(NOME_DA_TABELA)
-                .select("*")
-                .gte(NOME_COLUNA_DATA, data_inicio_str)
-                .lte(NOME_COLUNA_DATA, data_fim_str)
-                .range(page * page_size, (page + 1) * page_size - 1)
-            )
-            response = query.execute() 
-            
-            if not response.data: 
-                break
-            dados_completos.extend(response.data)
-            page += 1
-            if len(response.data) < page_size: 
-                break
-        
-        if not dados_completos:
-            return None, "Nenhum dado encontrado para o período selecionado."
-        
-        df = pd.DataFrame(dados_completos)
+        colunas_busca = None
+        colunas = expandir_colunas_equipe(supabase, colunas)
+        if colunas is not None:
+            colunas_busca = frozenset(unir_colunas(
+                [NOME_COLUNA_DATA, 'MAPA', 'COD'], colunas, COLUNAS_BUSCA if search_str else []
+            ))
 
-        # Limpeza de Texto
-        for col in df.select_dtypes(include=['object']):
-            df[col] = df[col].apply(limpar_texto)
-        
-        # Validação da coluna COD principal
-        if 'COD' in df.columns:
-            df['COD'] = pd.to_numeric(df['COD'], errors='coerce')
-            df.dropna(subset=['COD'], inplace=True)
-            df['COD'] = df['COD'].astype(int)
+        buscar = functools.partial(_buscar_distribuicao_limpa, supabase)
+        dias = _dias_do_periodo(data_inicio_str, data_fim_str)
+        if dias is None:
+            # Datas fora do formato do cache: busca direta, sem particionar.
+            df = buscar(data_inicio_str, data_fim_str, colunas_busca)
+            df = None if df.empty else df
         else:
-             return None, "A coluna 'COD' principal não foi encontrada."
+            df = _juntar_particoes(_carregar_por_dia(cache_distribuicao, dias, colunas_busca, NOME_COLUNA_DATA, buscar))
+        
+        if df is None:
+            return None, "Nenhum dado encontrado para o período selecionado."
 
         # Filtro de Pesquisa
         if search_str:
             search_clean = limpar_texto(search_str)
-            colunas_busca = ['MOTORISTA', 'MOTORISTA_2', 'AJUDANTE_1', 'AJUDANTE_2', 'AJUDANTE_3']
-            colunas_existentes_busca = [col for col in colunas_busca if col in df.columns]
+            colunas_existentes_busca = [col for col in COLUNAS_BUSCA if col in df.columns]
             mask = pd.Series(False, index=df.index)
             for col in colunas_existentes_busca:
                 mask = mask | df[col].str.contains(search_clean, na=False)
@@ -85,33 +327,51 @@ def get_dados_apurados(
         return df, None
 
     except Exception as e:
+        if isinstance(e, KeyError) and e.args == (ERRO_SEM_COD,):
+            return None, ERRO_SEM_COD
         print(f"Erro ao buscar dados do Supabase (Distribuição): {e}")
         if "permission denied" in str(e):
              return None, "Erro de permissão no Supabase. Execute o comando GRANT para a tabela Distribuição."
         return None, "Erro ao conectar à tabela 'Distribuição'."
 
+# --- CACHE DE DADOS DE REFERÊNCIA (CADASTRO E METAS) ---
+CACHE_REFERENCIA_TTL_SEGUNDOS = float(os.environ.get("CACHE_REFERENCIA_TTL_SEGUNDOS", "300"))
+CACHE_REFERENCIA_STALE_SEGUNDOS = float(os.environ.get("CACHE_REFERENCIA_STALE_SEGUNDOS", "3600"))
+CHAVE_CADASTRO = "cadastro"
+CHAVE_METAS = "metas"
+
+# Valores só de leitura (core.cache.somente_leitura); a versão (hash do conteúdo) muda quando os dados mudam.
+cache_referencia = CacheReferencia(CACHE_REFERENCIA_TTL_SEGUNDOS, CACHE_REFERENCIA_STALE_SEGUNDOS)
+
 # --- FUNÇÃO 2: CADASTRO ---
-@functools.lru_cache(maxsize=128)
+def _buscar_cadastro(supabase: Client) -> Optional[pd.DataFrame]:
+    response = supabase.table("Cadastro").select("*").execute()
+    
+    if not response.data:
+        return None
+    
+    df_cadastro = pd.DataFrame(response.data)
+    df_cadastro.columns = df_cadastro.columns.str.strip()
+
+    # Limpeza e padronização de CPFs para evitar erros no merge de pagamento
+    if 'CPF_M' in df_cadastro.columns:
+        df_cadastro['CPF_M'] = df_cadastro['CPF_M'].astype(str).str.replace(r'[.-]', '', regex=True).fillna('')
+    if 'CPF_J' in df_cadastro.columns:
+        df_cadastro['CPF_J'] = df_cadastro['CPF_J'].astype(str).str.replace(r'[.-]', '', regex=True).fillna('')
+
+    return df_cadastro
+
 def get_cadastro_sincrono(supabase: Client) -> Tuple[Optional[pd.DataFrame], Optional[str]]:
     """
     Busca todos os dados da tabela de cadastro (public.Cadastro).
-    NOTA: O lru_cache pode causar erros se o objeto Client mudar, 
-    mas é mantido aqui apenas para compatibilidade de performance se o cliente for persistente.
+    Servido por cache_referencia (TTL com revalidação em segundo plano): cada chamador recebe
+    uma cópia rasa sobre arrays só de leitura (novas colunas são locais; escrever nos valores falha).
     """
     try:
-        response = supabase.table("Cadastro").select("*").execute()
+        df_cadastro = cache_referencia.obter(CHAVE_CADASTRO, lambda: _buscar_cadastro(supabase))
         
-        if not response.data:
+        if df_cadastro is None:
             return None, "Tabela 'Cadastro' está vazia ou não foi encontrada."
-        
-        df_cadastro = pd.DataFrame(response.data)
-        df_cadastro.columns = df_cadastro.columns.str.strip()
-
-        # Limpeza e padronização de CPFs para evitar erros no merge de pagamento
-        if 'CPF_M' in df_cadastro.columns:
-            df_cadastro['CPF_M'] = df_cadastro['CPF_M'].astype(str).str.replace(r'[.-]', '', regex=True).fillna('')
-        if 'CPF_J' in df_cadastro.columns:
-            df_cadastro['CPF_J'] = df_cadastro['CPF_J'].astype(str).str.replace(r'[.-]', '', regex=True).fillna('')
 
         return df_cadastro, None
 
@@ -119,41 +379,129 @@ def get_cadastro_sincrono(supabase: Client) -> Tuple[Optional[pd.DataFrame], Opt
         print(f"Erro ao buscar dados do Cadastro: {e}")
         return None, "Erro ao conectar à tabela de Cadastro."
 
+def _construir_indice_pessoas(df_cadastro: Optional[pd.DataFrame]) -> Optional[IndicePessoas]:
+    return IndicePessoas(df_cadastro) if df_cadastro is not None else None
+
+def get_pessoas_sincrono(supabase: Client) -> Tuple[Optional[IndicePessoas], Optional[str]]:
+    """
+    Índice de colaboradores (CPF, código, nome, admissão) da versão atual do Cadastro,
+    no contrato (valor, erro) das demais fontes. Reconstruído apenas quando o Cadastro muda.
+    """
+    try:
+        indice = cache_referencia.derivado(
+            "indice_pessoas", CHAVE_CADASTRO, lambda: _buscar_cadastro(supabase), _construir_indice_pessoas
+        )
+        if indice is None:
+            return None, "Tabela 'Cadastro' está vazia ou não foi encontrada."
+        return indice, None
+    except Exception as e:
+        print(f"Erro ao montar o índice de colaboradores: {e}")
+        return None, "Erro ao conectar à tabela de Cadastro."
+
+def get_indice_pessoas(supabase: Client) -> Optional[IndicePessoas]:
+    """Índice de colaboradores do Cadastro atual; None se o Cadastro não puder ser lido."""
+    return get_pessoas_sincrono(supabase)[0]
+
 # --- FUNÇÃO 3: INDICADORES ---
+# (início, fim, colunas ou None) -> (DataFrame, versão do conteúdo); mesma validade do cache por dia
+cache_indicadores = CacheLRU(CACHE_DIAS_MAX_BYTES // 8, CACHE_DIAS_TTL_SEGUNDOS, medir=_tamanho_particao)
+
+def _chave_indicadores(data_inicio_str: str, data_fim_str: str, colunas: Optional[Iterable[str]]) -> tuple:
+    return (data_inicio_str, data_fim_str, None if colunas is None else frozenset(colunas))
+
+def _consulta_indicadores(supabase: Client, data_inicio_str: str, data_fim_str: str, colunas: str = "*"):
+    return (
+        supabase.table("Resultados_Indicadores")
+        .select(colunas)
+        .lte("data_inicio_periodo", data_fim_str)
+        .gte("data_fim_periodo", data_inicio_str)
+        .execute()
+    )
+
+def _buscar_indicadores(
+    supabase: Client,
+    data_inicio_str: str,
+    data_fim_str: str,
+    colunas: Optional[Iterable[str]]
+) -> pd.DataFrame:
+    colunas_select = "*" if colunas is None else ",".join(unir_colunas(["Codigo_M"], colunas))
+    try:
+        response = _consulta_indicadores(supabase, data_inicio_str, data_fim_str, colunas_select)
+    except Exception as e:
+        if colunas_select == "*":
+            raise
+        print(f"Projeção de colunas dos Indicadores falhou ({e}), buscando todas as colunas.")
+        response = _consulta_indicadores(supabase, data_inicio_str, data_fim_str)
+    
+    colunas_esperadas = ["Codigo_M", "dev_pdv", "Rating_tx", "refugo", "data_inicio_periodo", "data_fim_periodo"]
+    
+    if not response.data:
+        # Retorna DataFrame vazio com as colunas esperadas em vez de None
+        return pd.DataFrame(columns=colunas_esperadas)
+    
+    df_indicadores = pd.DataFrame(response.data)
+    df_indicadores.columns = df_indicadores.columns.str.strip()
+    return df_indicadores
+
 def get_indicadores_sincrono(
     supabase: Client, 
     data_inicio_str: str, 
-    data_fim_str: str
+    data_fim_str: str,
+    colunas: Optional[Iterable[str]] = None
 ) -> Tuple[Optional[pd.DataFrame], Optional[str]]:
     """
     Busca os resultados consolidados da tabela 'Resultados_Indicadores'.
+    'colunas' restringe o select às colunas usadas pelo chamador (None = todas; Codigo_M sempre incluída).
     Garante o retorno de colunas mínimas para evitar KeyError no processamento de incentivos.
+    Servido por cache_indicadores (cada chamador recebe uma cópia).
     """
     try:
-        response = (
-            supabase.table("Resultados_Indicadores")
-            .select("*")
-            .lte("data_inicio_periodo", data_fim_str)
-            .gte("data_fim_periodo", data_inicio_str)
-            .execute()
-        )
-        
-        colunas_esperadas = ["Codigo_M", "dev_pdv", "Rating_tx", "refugo", "data_inicio_periodo", "data_fim_periodo"]
-        
-        if not response.data:
-            # Retorna DataFrame vazio com as colunas esperadas em vez de None
-            return pd.DataFrame(columns=colunas_esperadas), None 
-        
-        df_indicadores = pd.DataFrame(response.data)
-        df_indicadores.columns = df_indicadores.columns.str.strip()
-
-        return df_indicadores, None
+        chave = _chave_indicadores(data_inicio_str, data_fim_str, colunas)
+        entrada = cache_indicadores.obter(chave)
+        if entrada is None:
+            df_indicadores = _buscar_indicadores(supabase, data_inicio_str, data_fim_str, colunas)
+            entrada = (df_indicadores, calcular_versao(df_indicadores))
+            cache_indicadores.guardar(chave, entrada)
+        return entrada[0].copy(), None
 
     except Exception as e:
         print(f"Erro ao buscar dados de Indicadores: {e}")
         return None, "Erro ao conectar à tabela de Indicadores."
 
+def versao_indicadores(data_inicio_str: str, data_fim_str: str, colunas: Optional[Iterable[str]] = None) -> Optional[str]:
+    """Versão dos indicadores do período em cache; None se ainda não foram buscados."""
+    entrada = cache_indicadores.espiar(_chave_indicadores(data_inicio_str, data_fim_str, colunas))
+    return entrada[1] if entrada is not None else None
+
 # --- FUNÇÃO 4: CAIXAS ---
+COLUNAS_CAIXAS = ["data", "mapa", "caixas"]
+
+def _buscar_caixas_limpas(
+    supabase: Client,
+    data_inicio_str: str,
+    data_fim_str: str,
+    colunas: Optional[frozenset] = None
+) -> pd.DataFrame:
+    response = (
+        supabase.table("Caixas")
+        .select(", ".join(COLUNAS_CAIXAS))
+        .gte("data", data_inicio_str)
+        .lte("data", data_fim_str)
+        .execute()
+    )
+    
+    if not response.data:
+        return pd.DataFrame(columns=COLUNAS_CAIXAS)
+    
+    df_caixas = pd.DataFrame(response.data)
+    
+    # Converte tipos para garantir o cálculo correto no bônus de caixas
+    df_caixas['mapa'] = df_caixas['mapa'].astype(str)
+    df_caixas['caixas'] = pd.to_numeric(df_caixas['caixas'], errors='coerce')
+    df_caixas.dropna(subset=['mapa', 'caixas'], inplace=True)
+    df_caixas['caixas'] = df_caixas['caixas'].astype(float) 
+    return df_caixas
+
 def get_caixas_sincrono(
     supabase: Client, 
     data_inicio_str: str, 
@@ -162,26 +510,18 @@ def get_caixas_sincrono(
     """
     Busca dados de caixas entregues da tabela 'Caixas'.
     Garante a conversão de tipos para cálculo numérico.
+    Usa o mesmo cache por dia da Distribuição (cache_caixas).
     """
     try:
-        response = (
-            supabase.table("Caixas")
-            .select("data, mapa, caixas")
-            .gte("data", data_inicio_str)
-            .lte("data", data_fim_str)
-            .execute()
-        )
-        
-        if not response.data:
-            return pd.DataFrame(columns=["data", "mapa", "caixas"]), None
-        
-        df_caixas = pd.DataFrame(response.data)
+        buscar = functools.partial(_buscar_caixas_limpas, supabase)
+        dias = _dias_do_periodo(data_inicio_str, data_fim_str)
+        if dias is None:
+            df_caixas = buscar(data_inicio_str, data_fim_str)
+        else:
+            df_caixas = _juntar_particoes(_carregar_por_dia(cache_caixas, dias, None, "data", buscar))
         
-        # Converte tipos para garantir o cálculo correto no bônus de caixas
-        df_caixas['mapa'] = df_caixas['mapa'].astype(str)
-        df_caixas['caixas'] = pd.to_numeric(df_caixas['caixas'], errors='coerce')
-        df_caixas.dropna(subset=['mapa', 'caixas'], inplace=True)
-        df_caixas['caixas'] = df_caixas['caixas'].astype(float) 
+        if df_caixas is None or df_caixas.empty:
+            return pd.DataFrame(columns=COLUNAS_CAIXAS), None
 
         return df_caixas, None
 
@@ -189,7 +529,125 @@ def get_caixas_sincrono(
         print(f"Erro ao buscar dados de Caixas: {e}")
         return None, "Erro ao conectar à tabela de Caixas."
 
+# --- FUNÇÃO 5: METAS ---
+METAS_PADRAO = {
+    "dev_pdv_meta_perc": 0.0, 
+    "dev_pdv_premio": 0.0,
+    "rating_meta_perc": 0.0, 
+    "rating_premio": 0.0,
+    "refugo_meta_perc": 0.0, 
+    "refugo_premio": 0.0,
+    "meta_cx_dias_n1": 365, 
+    "meta_cx_valor_n1": 0.0,
+    "meta_cx_dias_n2": 730, 
+    "meta_cx_valor_n2": 0.0,
+    "meta_cx_dias_n3": 1825, 
+    "meta_cx_valor_n3": 0.0, 
+    "meta_cx_valor_n4": 0.0
+}
+
+def _buscar_metas(supabase: Client) -> dict:
+    # Estrutura inicial de resposta
+    result = {
+        "motorista": METAS_PADRAO.copy(),
+        "ajudante": METAS_PADRAO.copy()
+    }
+
+    # Busca todas as linhas da tabela
+    response = supabase.table("Metas").select("*").execute()
+    
+    if response.data:
+        for row in response.data:
+            tipo = row.get("tipo_colaborador")
+            # Se o tipo for válido (motorista ou ajudante), preenche os dados
+            if tipo in result:
+                for key in result[tipo].keys():
+                    # Se o valor existir no banco, atualiza. Senão, mantém o padrão.
+                    if key in row and row[key] is not None:
+                        try:
+                            result[tipo][key] = float(row[key])
+                        except:
+                            result[tipo][key] = row[key]
+    
+    return result
+
+def get_metas_sincrono(supabase: Client) -> dict:
+    """
+    Busca as metas no Supabase (Tabela 'Metas').
+    Adapta a leitura para a estrutura baseada em linhas (tipo_colaborador).
+    Servido por cache_referencia, como mapeamento só de leitura (MappingProxyType);
+    invalidar_metas() força a releitura após uma gravação.
+    """
+    try:
+        return cache_referencia.obter(CHAVE_METAS, lambda: _buscar_metas(supabase))
+
+    except Exception as e:
+        print(f"Erro ao buscar metas (usando padrão): {e}")
+        return {
+            "motorista": METAS_PADRAO.copy(),
+            "ajudante": METAS_PADRAO.copy()
+        }
+
+def invalidar_metas():
+    """Descarta as metas em cache (chamado após gravar na tabela Metas)."""
+    cache_referencia.invalidar(CHAVE_METAS)
+
+# --- RECARGA DE UM PERÍODO (AQUECIMENTO) ---
+def recarregar_periodo(
+    supabase: Client,
+    data_inicio_str: str,
+    data_fim_str: str,
+    colunas_indicadores: Iterable[Optional[Iterable[str]]] = (None,)
+) -> Optional[str]:
+    """
+    Busca de novo o período inteiro (Distribuição com todas as colunas, Caixas e os Indicadores
+    com cada conjunto de colunas pedido) e substitui o que estiver em cache. Nada é invalidado
+    antes: os pedidos continuam a usar os dados anteriores até à troca.
+    Usado pelo aquecimento (core.scheduler). Devolve a mensagem de erro, ou None.
+    """
+    dias = _dias_do_periodo(data_inicio_str, data_fim_str)
+    if dias is None:
+        return "Período inválido."
+    try:
+        _carregar_por_dia(
+            cache_distribuicao, dias, None, NOME_COLUNA_DATA,
+            functools.partial(_buscar_distribuicao_limpa, supabase), forcar=True
+        )
+        _carregar_por_dia(cache_caixas, dias, None, "data", functools.partial(_buscar_caixas_limpas, supabase), forcar=True)
+        for colunas in colunas_indicadores:
+            df_indicadores = _buscar_indicadores(supabase, data_inicio_str, data_fim_str, colunas)
+            cache_indicadores.guardar(
+                _chave_indicadores(data_inicio_str, data_fim_str, colunas),
+                (df_indicadores, calcular_versao(df_indicadores))
+            )
+        return None
+    except Exception as e:
+        print(f"Erro ao recarregar o período {data_inicio_str}..{data_fim_str}: {e}")
+        return "Erro ao recarregar os dados do período."
+
+def renovar_periodo(
+    supabase: Client,
+    data_inicio_str: str,
+    data_fim_str: str,
+    colunas_indicadores: Iterable[Optional[Iterable[str]]] = (None,)
+) -> Optional[str]:
+    """
+    Como recarregar_periodo, mas descartando antes o que um cálculo ainda poderia ler de cache:
+    Cadastro e Metas (servidos vencidos durante a revalidação) e os Indicadores do período.
+    Usado antes de gravar um snapshot (permanente), que tem de partir dos dados atuais.
+    Devolve a mensagem de erro, ou None.
+    """
+    colunas_indicadores = list(colunas_indicadores)
+    cache_referencia.invalidar(CHAVE_CADASTRO)
+    cache_referencia.invalidar(CHAVE_METAS)
+    for colunas in colunas_indicadores:
+        cache_indicadores.remover(_chave_indicadores(data_inicio_str, data_fim_str, colunas))
+    return recarregar_periodo(supabase, data_inicio_str, data_fim_str, colunas_indicadores)
+
 def clear_cache():
     """Limpa o cache das funções de banco de dados."""
-    get_cadastro_sincrono.cache_clear()
+    cache_referencia.invalidar()
+    cache_distribuicao.limpar()
+    cache_caixas.limpar()
+    cache_indicadores.limpar()
     print("--- CACHE DO BANCO DE DADOS LIMPO ---")
\ No newline at end of file
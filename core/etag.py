@@ -0,0 +1,144 @@
+import datetime
+import gzip
+import hashlib
+import json
+import os
+from typing import Any, Dict, Optional, Tuple
+from fastapi import Request
+from fastapi.responses import Response
+from .cache import CacheLRU
+from .database import (
+    CACHE_DIAS_TTL_SEGUNDOS,
+    CHAVE_CADASTRO,
+    CHAVE_METAS,
+    cache_caixas,
+    cache_distribuicao,
+    cache_referencia,
+    versao_indicadores,
+    versao_periodo,
+)
+from .loader import PlanoDados
+from .serialization import serializar
+
+# Corpos já serializados (JSON e gzip) por ETag
+ETAG_CACHE_MAX_BYTES = int(float(os.environ.get("ETAG_CACHE_MAX_MB", "64")) * 1024 * 1024)
+TAMANHO_MINIMO_GZIP = 1024
+
+def _tamanho_corpos(corpos: Tuple[bytes, Optional[bytes]]) -> int:
+    return len(corpos[0]) + len(corpos[1] or b"")
+
+cache_respostas = CacheLRU(ETAG_CACHE_MAX_BYTES, CACHE_DIAS_TTL_SEGUNDOS, medir=_tamanho_corpos)
+
+def versoes_plano(plano: PlanoDados, data_inicio: str, data_fim: str) -> Optional[Dict[str, str]]:
+    """
+    Versão de cada fonte do plano lida dos caches (sem ir ao Supabase).
+    None se alguma fonte não estiver em cache: nesse caso a versão não é conhecida.
+    """
+    versoes = {}
+    for fonte in plano.fontes:
+        if fonte == "metas":
+            versao = cache_referencia.versao(CHAVE_METAS)
+        elif fonte in ("cadastro", "pessoas"):
+            versao = cache_referencia.versao(CHAVE_CADASTRO)
+        elif fonte == "viagens":
+            versao = versao_periodo(cache_distribuicao, data_inicio, data_fim)
+        elif fonte == "caixas":
+            versao = versao_periodo(cache_caixas, data_inicio, data_fim)
+        else:
+            versao = versao_indicadores(data_inicio, data_fim, plano.colunas("indicadores"))
+        if versao is None:
+            return None
+        versoes[fonte] = versao
+    return versoes
+
+def _corresponde(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # Comparação fraca (RFC 9110): ignora o prefixo W/
+    return any(candidato.strip().removeprefix("W/") == etag.removeprefix("W/") for candidato in if_none_match.split(","))
+
+class ControleEtag:
+    """
+    GET condicional de um relatório. A ETag é a impressão digital das entradas: rota,
+    parâmetros, escopo do usuário, dia do cálculo (antiguidade) e versões das fontes do plano nos caches.
+      1. resposta_antecipada(): antes de qualquer busca ou cálculo, 304 se o cliente já tem
+         essa versão, ou o corpo já serializado se outro pedido o produziu;
+      2. fixar_versao(): logo após carregar as fontes, regista a versão dos dados usados;
+      3. responder(): serializa (e comprime) uma vez, guarda em cache_respostas e devolve com ETag.
+    """
+
+    def __init__(
+        self,
+        request: Request,
+        rota: str,
+        plano: PlanoDados,
+        data_inicio: str,
+        data_fim: str,
+        escopo: str,
+        parametros: Optional[Dict[str, Any]] = None,
+        versoes_extras: Optional[Dict[str, str]] = None,
+        layout: str = "records"
+    ):
+        self.request = request
+        self.layout = layout
+        self.plano = plano
+        self.data_inicio = data_inicio
+        self.data_fim = data_fim
+        self._base = {
+            "rota": rota,
+            "periodo": [data_inicio, data_fim],
+            "escopo": escopo,
+            "parametros": parametros or {},
+            "layout": layout,
+            "extras": versoes_extras or {},
+        }
+        self.etag: Optional[str] = None
+
+    def _calcular(self) -> Optional[str]:
+        versoes = versoes_plano(self.plano, self.data_inicio, self.data_fim)
+        if versoes is None:
+            return None
+        impressao = json.dumps(
+            {**self._base, "hoje": datetime.date.today().isoformat(), "versoes": versoes},
+            sort_keys=True, default=str
+        )
+        return f'W/"{hashlib.sha1(impressao.encode()).hexdigest()[:20]}"'
+
+    def resposta_antecipada(self) -> Optional[Response]:
+        etag = self._calcular()
+        if etag is None:
+            return None
+        if _corresponde(self.request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers=self._cabecalhos(etag))
+        corpos = cache_respostas.obter(etag)
+        return self._resposta(etag, corpos) if corpos is not None else None
+
+    def fixar_versao(self) -> None:
+        # Chamado logo após a carga: as partições usadas ainda são as que estão em cache
+        self.etag = self._calcular()
+
+    def responder(self, conteudo: Any, guardar: bool = True) -> Response:
+        """
+        Resposta JSON (DataFrames no layout do pedido, ver core.serialization);
+        sem versão conhecida ou com guardar=False, sem ETag.
+        """
+        corpo = serializar(conteudo, self.layout)
+        if self.etag is None or not guardar:
+            return Response(corpo, media_type="application/json")
+        corpos = (corpo, gzip.compress(corpo, compresslevel=6) if len(corpo) >= TAMANHO_MINIMO_GZIP else None)
+        cache_respostas.guardar(self.etag, corpos)
+        return self._resposta(self.etag, corpos)
+
+    def _cabecalhos(self, etag: str) -> Dict[str, str]:
+        # private/no-cache: o navegador guarda, mas revalida sempre com If-None-Match
+        return {"ETag": etag, "Cache-Control": "private, no-cache", "Vary": "Accept-Encoding, Authorization"}
+
+    def _resposta(self, etag: str, corpos: Tuple[bytes, Optional[bytes]]) -> Response:
+        corpo, comprimido = corpos
+        cabecalhos = self._cabecalhos(etag)
+        if comprimido is not None and "gzip" in self.request.headers.get("accept-encoding", ""):
+            cabecalhos["Content-Encoding"] = "gzip"
+            return Response(comprimido, media_type="application/json", headers=cabecalhos)
+        return Response(corpo, media_type="application/json", headers=cabecalhos)
@@ -0,0 +1,259 @@
+import io
+import queue
+import threading
+import pandas as pd
+from typing import Any, Dict, Iterator, List
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+from loguru import logger
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Border, Font, Side
+from openpyxl.utils import get_column_letter
+
+MEDIA_TYPE_XLSX = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+# Bytes por bloco enviado ao cliente e blocos em espera antes de o escritor parar (memória limitada)
+TAMANHO_BLOCO = 64 * 1024
+BLOCOS_EM_ESPERA = 8
+
+# Mesmo estilo de cabeçalho do DataFrame.to_excel
+_BORDA_FINA = Side(style="thin")
+_ESTILO_CABECALHO = {
+    "font": Font(bold=True),
+    "border": Border(left=_BORDA_FINA, right=_BORDA_FINA, top=_BORDA_FINA, bottom=_BORDA_FINA),
+    "alignment": Alignment(horizontal="center", vertical="top"),
+}
+
+# Formatos tabulares (?format=): tipo de conteúdo e extensão do arquivo
+FORMATOS_TABELA = {
+    "csv": ("text/csv; charset=utf-8", "csv"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+    "arrow": ("application/vnd.apache.arrow.stream", "arrow"),
+}
+PADRAO_FORMATO = r"^(csv|parquet|arrow)$"
+
+# Linhas por bloco (CSV) / por record batch e row group (Arrow, Parquet)
+LINHAS_POR_BLOCO = 10_000
+
+def registros(df: pd.DataFrame) -> List[Dict[str, Any]]:
+    """Linhas como dicts com tipos Python nativos (as colunas de objetos passam intactas)."""
+    colunas = list(df.columns)
+    valores = [df[col].tolist() for col in colunas]
+    return [dict(zip(colunas, linha)) for linha in zip(*valores)]
+
+def juntar_por_tipo(tabelas: Dict[str, pd.DataFrame]) -> pd.DataFrame:
+    """Uma tabela para exportação: as tabelas empilhadas, com a coluna 'tipo' à frente."""
+    partes = [
+        df if "tipo" in df.columns else df.assign(tipo=tipo)
+        for tipo, df in tabelas.items()
+    ]
+    # Tabelas vazias ficam de fora (o concat com elas muda dtypes); todas vazias: só as colunas
+    juntas = pd.concat([df for df in partes if len(df)] or partes, ignore_index=True)
+    return juntas[["tipo"] + [col for col in juntas.columns if col != "tipo"]]
+
+class ExportacaoCancelada(Exception):
+    """O cliente deixou de ler a resposta; o escritor para."""
+
+def larguras_colunas(df: pd.DataFrame) -> List[int]:
+    """
+    Largura de cada coluna: texto mais longo (cabeçalho incluído) + 2, calculada sobre os
+    dados do DataFrame em vez de percorrer as células da planilha. Vazios contam como "".
+    """
+    larguras = []
+    for col in df.columns:
+        serie = df[col]
+        textos = serie.where(serie.notna(), "").astype(str)
+        maior = int(textos.str.len().max()) if len(textos) else 0
+        larguras.append(max(maior, len(str(col))) + 2)
+    return larguras
+
+def _linhas(df: pd.DataFrame) -> Iterator[tuple]:
+    """Linhas do DataFrame com NaN/None como células vazias, preparadas coluna a coluna."""
+    colunas = [df[col].astype(object).where(df[col].notna(), None).tolist() for col in df.columns]
+    return zip(*colunas)
+
+class _SaidaEmFila(io.RawIOBase):
+    """Arquivo só de escrita (sem seek) que entrega blocos de TAMANHO_BLOCO a uma fila."""
+
+    def __init__(self, fila: "queue.Queue", cancelado: threading.Event):
+        self._fila = fila
+        self._cancelado = cancelado
+        self._buffer = bytearray()
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, dados) -> int:
+        if self._cancelado.is_set() and not self._buffer:
+            # Já cancelado: o que o openpyxl/zipfile ainda escrever ao fechar é descartado
+            return len(dados)
+        self._buffer += dados
+        while len(self._buffer) >= TAMANHO_BLOCO:
+            self._enviar(bytes(self._buffer[:TAMANHO_BLOCO]))
+            del self._buffer[:TAMANHO_BLOCO]
+        return len(dados)
+
+    def descarregar(self) -> None:
+        if self._buffer:
+            self._enviar(bytes(self._buffer))
+            self._buffer.clear()
+
+    def _enviar(self, bloco: bytes) -> None:
+        while True:
+            if self._cancelado.is_set():
+                self._buffer.clear()
+                raise ExportacaoCancelada()
+            try:
+                self._fila.put(bloco, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+def _escrever_xlsx(planilhas: Dict[str, pd.DataFrame], saida: _SaidaEmFila) -> None:
+    workbook = Workbook(write_only=True)
+    for nome, df in planilhas.items():
+        sheet = workbook.create_sheet(title=nome)
+        for indice, largura in enumerate(larguras_colunas(df), start=1):
+            sheet.column_dimensions[get_column_letter(indice)].width = largura
+
+        cabecalho = []
+        for col in df.columns:
+            celula = WriteOnlyCell(sheet, value=str(col))
+            for atributo, estilo in _ESTILO_CABECALHO.items():
+                setattr(celula, atributo, estilo)
+            cabecalho.append(celula)
+        sheet.append(cabecalho)
+        for linha in _linhas(df):
+            sheet.append(linha)
+
+    # As linhas ficam em arquivos temporários do openpyxl; o zip final sai direto para a fila
+    workbook.save(saida)
+    saida.descarregar()
+
+def xlsx_em_blocos(planilhas: Dict[str, pd.DataFrame]) -> Iterator[bytes]:
+    """
+    Gera o .xlsx (uma aba por DataFrame, sem índice) com o openpyxl em modo write-only.
+    O workbook é escrito numa thread e os bytes são entregues à medida que o zip é produzido,
+    com no máximo BLOCOS_EM_ESPERA blocos em memória. Se o consumidor desistir (cliente
+    desconectado), a thread é cancelada.
+    """
+    fila: "queue.Queue" = queue.Queue(maxsize=BLOCOS_EM_ESPERA)
+    cancelado = threading.Event()
+    fim = object()
+
+    def escritor():
+        try:
+            _escrever_xlsx(planilhas, _SaidaEmFila(fila, cancelado))
+            resultado = fim
+        except ExportacaoCancelada:
+            return
+        except Exception as e:
+            logger.error(f"Erro ao gerar o Excel: {e}")
+            resultado = e
+        while not cancelado.is_set():
+            try:
+                fila.put(resultado, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    thread = threading.Thread(target=escritor, name="exportacao-xlsx", daemon=True)
+    thread.start()
+    try:
+        while True:
+            bloco = fila.get()
+            if bloco is fim:
+                return
+            if isinstance(bloco, Exception):
+                raise bloco
+            yield bloco
+    finally:
+        cancelado.set()
+
+def _csv_em_blocos(df: pd.DataFrame) -> Iterator[bytes]:
+    yield df.iloc[:0].to_csv(index=False).encode("utf-8")
+    for inicio in range(0, len(df), LINHAS_POR_BLOCO):
+        yield df.iloc[inicio:inicio + LINHAS_POR_BLOCO].to_csv(index=False, header=False).encode("utf-8")
+
+class _Coletor:
+    """Destino de escrita do pyarrow que guarda os bytes até serem entregues ao cliente."""
+
+    def __init__(self):
+        self._partes: List[bytes] = []
+        self._posicao = 0
+        self.closed = False
+
+    def write(self, dados) -> int:
+        self._partes.append(bytes(dados))
+        self._posicao += len(dados)
+        return len(dados)
+
+    def tell(self) -> int:
+        return self._posicao
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.closed = True
+
+    def retirar(self) -> bytes:
+        dados = b"".join(self._partes)
+        self._partes.clear()
+        return dados
+
+def _importar_pyarrow():
+    """pyarrow só é necessário para parquet/arrow; importado na primeira exportação."""
+    try:
+        import pyarrow
+        import pyarrow.parquet
+        return pyarrow
+    except ImportError:
+        raise HTTPException(status_code=501, detail="Exportação parquet/arrow indisponível: o pacote 'pyarrow' não está instalado.")
+
+def _tabela_arrow(pa, df: pd.DataFrame):
+    """
+    DataFrame -> pyarrow.Table coluna a coluna. Colunas de objetos com tipos misturados
+    (ex.: números e '' do Supabase) que o Arrow não unifica são exportadas como texto.
+    """
+    colunas = []
+    for col in df.columns:
+        serie = df[col]
+        try:
+            colunas.append(pa.array(serie, from_pandas=True))
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            colunas.append(pa.array(serie.where(serie.isna(), serie.astype(str)), from_pandas=True))
+    return pa.Table.from_arrays(colunas, names=[str(col) for col in df.columns])
+
+def _arrow_em_blocos(pa, tabela, formato: str) -> Iterator[bytes]:
+    coletor = _Coletor()
+    destino = pa.PythonFile(coletor, mode="w")
+    if formato == "parquet":
+        escritor = pa.parquet.ParquetWriter(destino, tabela.schema)
+        escrever = lambda lote: escritor.write_table(pa.Table.from_batches([lote], schema=tabela.schema))
+    else:
+        escritor = pa.ipc.new_stream(destino, tabela.schema)
+        escrever = escritor.write_batch
+
+    for lote in tabela.to_batches(max_chunksize=LINHAS_POR_BLOCO):
+        escrever(lote)
+        bloco = coletor.retirar()
+        if bloco:
+            yield bloco
+    escritor.close()
+    yield coletor.retirar()
+
+def tabela_em_blocos(df: pd.DataFrame, formato: str) -> Iterator[bytes]:
+    """DataFrame -> bytes de CSV, Parquet ou Arrow IPC (stream), em blocos de LINHAS_POR_BLOCO linhas."""
+    if formato == "csv":
+        return _csv_em_blocos(df)
+    pa = _importar_pyarrow()
+    # A conversão é feita já, para que erros apareçam antes de a resposta começar
+    return _arrow_em_blocos(pa, _tabela_arrow(pa, df), formato)
+
+def resposta_tabela(df: pd.DataFrame, formato: str, nome_arquivo: str) -> StreamingResponse:
+    """StreamingResponse com o DataFrame no formato pedido, como anexo 'nome_arquivo.<extensão>'."""
+    media_type, extensao = FORMATOS_TABELA[formato]
+    headers = {'Content-Disposition': f'attachment; filename="{nome_arquivo}.{extensao}"'}
+    return StreamingResponse(tabela_em_blocos(df, formato), headers=headers, media_type=media_type)
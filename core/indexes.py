@@ -0,0 +1,159 @@
+import datetime
+import threading
+import pandas as pd
+from typing import Dict, FrozenSet, List, Optional, Set, Tuple
+
+# (papel, coluna de código, coluna de CPF, coluna de nome) no Cadastro
+PAPEIS_CADASTRO = (
+    ("motorista", "Codigo_M", "CPF_M", "Nome_M"),
+    ("ajudante", "Codigo_J", "CPF_J", "Nome_J"),
+)
+
+# Coluna da data de admissão de cada papel
+COLUNAS_ADMISSAO = {"motorista": "Data_M", "ajudante": "Data_J"}
+
+# Valores que o astype(str) do cadastro produz para células vazias; nunca são CPFs válidos.
+_CPFS_VAZIOS = {"", "None", "nan", "NaN", "<NA>"}
+
+def normalizar_cpf(cpf) -> str:
+    """Remove pontos, traços e espaços (ex.: '123.456.789-00' -> '12345678900')."""
+    return str(cpf).replace(".", "").replace("-", "").replace(" ", "").strip()
+
+def normalizar_cpfs(serie: pd.Series) -> pd.Series:
+    """Versão vetorizada de normalizar_cpf."""
+    return serie.astype(str).str.replace(r'[.\-\s]', '', regex=True)
+
+def codigos_por_papel(df_cadastro: pd.DataFrame, col_codigo: str) -> pd.DataFrame:
+    """
+    Linhas do Cadastro que definem cada código inteiro, com a mesma regra dos motores:
+    drop_duplicates no código original e, entre códigos que viram o mesmo inteiro, a última linha.
+    Devolve as linhas com a coluna auxiliar 'codigo_int'.
+    """
+    linhas = df_cadastro[pd.notna(df_cadastro[col_codigo])].drop_duplicates(subset=[col_codigo]).copy()
+    linhas['codigo_int'] = pd.to_numeric(linhas[col_codigo], errors='coerce').fillna(0).astype(int)
+    return linhas.drop_duplicates(subset=['codigo_int'], keep='last')
+
+class IndiceCpf:
+    """
+    Índice CPF normalizado -> [(papel, código, nome)] construído uma vez por versão do Cadastro.
+    Responde em O(1) à autenticação e ao filtro por CPF dos relatórios.
+    """
+
+    def __init__(self, df_cadastro: pd.DataFrame):
+        self._pessoas: Dict[str, List[Tuple[str, Optional[int], str]]] = {}
+        self._codigos: Dict[Tuple[str, str], Set[int]] = {}
+
+        for papel, col_codigo, col_cpf, col_nome in PAPEIS_CADASTRO:
+            if col_cpf not in df_cadastro.columns:
+                continue
+
+            # Qualquer linha com CPF permite o login, mesmo sem código válido.
+            cpfs = normalizar_cpfs(df_cadastro[col_cpf])
+            validos = ~cpfs.isin(_CPFS_VAZIOS)
+            for cpf in cpfs[validos].unique():
+                self._pessoas.setdefault(cpf, [])
+
+            if col_codigo not in df_cadastro.columns:
+                continue
+
+            # Código -> CPF como nos relatórios (o filtro por CPF compara o CPF que o relatório exibe).
+            linhas = codigos_por_papel(df_cadastro, col_codigo)
+            linhas = linhas[linhas['codigo_int'] != 0]
+            cpfs_codigo = normalizar_cpfs(linhas[col_cpf])
+            nomes = linhas[col_nome].astype(str).str.strip() if col_nome in linhas.columns else pd.Series('', index=linhas.index)
+            for cpf, codigo, nome in zip(cpfs_codigo, linhas['codigo_int'], nomes):
+                if cpf in _CPFS_VAZIOS:
+                    continue
+                self._pessoas.setdefault(cpf, []).append((papel, int(codigo), nome))
+                self._codigos.setdefault((cpf, papel), set()).add(int(codigo))
+
+    def __len__(self) -> int:
+        return len(self._pessoas)
+
+    def contem(self, cpf: str) -> bool:
+        return normalizar_cpf(cpf) in self._pessoas
+
+    def buscar(self, cpf: str) -> List[Tuple[str, Optional[int], str]]:
+        """Lista de (papel, código, nome) do CPF; vazia se o CPF não existir ou não tiver código."""
+        return list(self._pessoas.get(normalizar_cpf(cpf), []))
+
+    def codigos(self, cpf: str, papel: str) -> FrozenSet[int]:
+        """Códigos do CPF num papel ('motorista' ou 'ajudante')."""
+        return frozenset(self._codigos.get((normalizar_cpf(cpf), papel), ()))
+
+class IndicePessoas(IndiceCpf):
+    """
+    Índice de colaboradores do Cadastro, construído uma vez por versão: além das consultas
+    por CPF, guarda por papel o código (índice) -> nome, CPF e data de admissão usados pelos
+    motores de caixas e incentivo. Os dias de casa são derivados sob demanda por data de referência.
+    Os DataFrames devolvidos são partilhados entre pedidos e não devem ser alterados.
+    """
+
+    # Datas de referência memorizadas por papel (normalmente só 'hoje')
+    MAX_DATAS_REFERENCIA = 4
+
+    def __init__(self, df_cadastro: pd.DataFrame):
+        super().__init__(df_cadastro)
+        self._colaboradores: Dict[str, pd.DataFrame] = {}
+        self._cpfs: Dict[str, Dict[int, str]] = {}
+        self._dias: Dict[Tuple[str, datetime.date], pd.DataFrame] = {}
+        self._lock_dias = threading.Lock()
+
+        for papel, col_codigo, col_cpf, col_nome in PAPEIS_CADASTRO:
+            if col_codigo not in df_cadastro.columns:
+                linhas = df_cadastro.iloc[:0].assign(codigo_int=pd.Series(dtype=int))
+            else:
+                linhas = codigos_por_papel(df_cadastro, col_codigo)
+                linhas = linhas[linhas['codigo_int'] != 0]
+
+            texto = lambda col: linhas[col].astype(str).str.strip() if col in linhas.columns else ''
+            col_data = COLUNAS_ADMISSAO[papel]
+            if col_data in linhas.columns:
+                admissao = pd.to_datetime(linhas[col_data], errors='coerce')
+                if admissao.dt.tz is not None:
+                    admissao = admissao.dt.tz_localize(None)
+                admissao = admissao.dt.normalize()
+            else:
+                admissao = pd.Series(pd.NaT, index=linhas.index, dtype='datetime64[ns]')
+
+            colaboradores = pd.DataFrame({
+                "nome": texto(col_nome),
+                "cpf": texto(col_cpf),
+                "admissao": admissao,
+            }, index=linhas.index).set_index(linhas['codigo_int'].rename('codigo'))
+            self._colaboradores[papel] = colaboradores
+            self._cpfs[papel] = colaboradores["cpf"].to_dict()
+
+    def colaboradores(self, papel: str, hoje: Optional[datetime.date] = None) -> pd.DataFrame:
+        """
+        Nome, CPF, admissão e 'dias' de casa em 'hoje' (0 sem data de admissão), por código.
+        Os dias são calculados na primeira consulta de cada data e reaproveitados.
+        """
+        hoje = hoje or datetime.date.today()
+        chave = (papel, hoje)
+        with self._lock_dias:
+            resultado = self._dias.get(chave)
+        if resultado is None:
+            colaboradores = self._colaboradores[papel]
+            dias = (pd.Timestamp(hoje) - colaboradores["admissao"]).dt.days
+            resultado = colaboradores.assign(dias=dias.fillna(0).astype(int))
+            with self._lock_dias:
+                if len(self._dias) >= self.MAX_DATAS_REFERENCIA * len(PAPEIS_CADASTRO):
+                    self._dias.pop(next(iter(self._dias)))
+                self._dias[chave] = resultado
+        return resultado
+
+    def cpfs(self, papel: str) -> Dict[int, str]:
+        """Código -> CPF do papel."""
+        return self._cpfs[papel]
+
+def filtrar_por_cpf(
+    motoristas: pd.DataFrame,
+    ajudantes: pd.DataFrame,
+    cpf: str,
+    indice: Optional[IndiceCpf]
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Mantém apenas as linhas (coluna 'cod') dos códigos do CPF; sem índice, nenhuma."""
+    codigos_m = indice.codigos(cpf, "motorista") if indice is not None else frozenset()
+    codigos_a = indice.codigos(cpf, "ajudante") if indice is not None else frozenset()
+    return motoristas[motoristas["cod"].isin(codigos_m)], ajudantes[ajudantes["cod"].isin(codigos_a)]
@@ -0,0 +1,185 @@
+import asyncio
+import time
+import pandas as pd
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+from fastapi.concurrency import run_in_threadpool
+from loguru import logger
+from supabase import Client
+from .database import (
+    get_dados_apurados,
+    get_cadastro_sincrono,
+    get_pessoas_sincrono,
+    get_indicadores_sincrono,
+    get_caixas_sincrono,
+    get_metas_sincrono,
+    METAS_PADRAO,
+    unir_colunas,
+)
+from .scope import EscopoColaborador, get_viagens_do_escopo
+
+# Fontes conhecidas pelo carregador e a chave em que cada uma é devolvida.
+FONTES = {
+    "metas": "metas",
+    "viagens": "df_viagens_bruto",
+    "cadastro": "df_cadastro",
+    "pessoas": "indice_pessoas",
+    "indicadores": "df_indicadores",
+    "caixas": "df_caixas",
+}
+
+# Ordem de prioridade do 'error_message' (mesma do antigo err1 or err2 or err3 or err4).
+ORDEM_ERROS = ("viagens", "cadastro", "pessoas", "indicadores", "caixas")
+
+class PlanoDados:
+    """
+    Entradas declaradas por um endpoint ou motor: as fontes que lê e, por fonte, as colunas
+    usadas (None = todas). O carregador busca apenas as fontes do plano.
+    """
+
+    def __init__(self, entradas: Dict[str, Optional[List[str]]]):
+        desconhecidas = [f for f in entradas if f not in FONTES]
+        if desconhecidas:
+            raise ValueError(f"Fontes de dados desconhecidas: {', '.join(desconhecidas)}")
+        # Ordem de FONTES, para que planos equivalentes sejam iguais
+        self.entradas = {f: entradas[f] for f in FONTES if f in entradas}
+
+    @property
+    def fontes(self) -> Tuple[str, ...]:
+        return tuple(self.entradas)
+
+    def colunas(self, fonte: str) -> Optional[List[str]]:
+        return self.entradas.get(fonte)
+
+    @classmethod
+    def unir(cls, *planos: "PlanoDados") -> "PlanoDados":
+        """Plano de um endpoint que corre vários motores: união das fontes e das colunas."""
+        entradas: Dict[str, Optional[List[str]]] = {}
+        for plano in planos:
+            for fonte, colunas in plano.entradas.items():
+                entradas[fonte] = unir_colunas(entradas[fonte], colunas) if fonte in entradas else colunas
+        return cls(entradas)
+
+    def __eq__(self, outro: object) -> bool:
+        return isinstance(outro, PlanoDados) and self.entradas == outro.entradas
+
+    def __repr__(self) -> str:
+        return f"PlanoDados({self.entradas!r})"
+
+def deduplicar_viagens(df_viagens: Optional[pd.DataFrame]) -> Optional[pd.DataFrame]:
+    """Remove mapas repetidos (uma viagem por MAPA)."""
+    if df_viagens is None:
+        return None
+    if 'MAPA' in df_viagens.columns:
+        return df_viagens.drop_duplicates(subset=['MAPA'])
+    return df_viagens.drop_duplicates()
+
+def _tarefas_fontes(
+    supabase: Client,
+    data_inicio: str,
+    data_fim: str,
+    fontes: Iterable[str],
+    busca: str,
+    colunas_viagens: Optional[List[str]],
+    colunas_indicadores: Optional[List[str]],
+    escopo: Optional[EscopoColaborador] = None
+) -> Dict[str, Tuple[Callable, tuple]]:
+    viagens = (get_dados_apurados, (supabase, data_inicio, data_fim, busca, colunas_viagens))
+    if escopo is not None:
+        viagens = (get_viagens_do_escopo, (supabase, data_inicio, data_fim, escopo, colunas_viagens))
+    tarefas = {
+        "metas": (get_metas_sincrono, (supabase,)),
+        "viagens": viagens,
+        "cadastro": (get_cadastro_sincrono, (supabase,)),
+        "pessoas": (get_pessoas_sincrono, (supabase,)),
+        "indicadores": (get_indicadores_sincrono, (supabase, data_inicio, data_fim, colunas_indicadores)),
+        "caixas": (get_caixas_sincrono, (supabase, data_inicio, data_fim)),
+    }
+    desconhecidas = [f for f in fontes if f not in tarefas]
+    if desconhecidas:
+        raise ValueError(f"Fontes de dados desconhecidas: {', '.join(desconhecidas)}")
+    return {f: tarefas[f] for f in fontes}
+
+def _metas_padrao() -> dict:
+    return {"motorista": METAS_PADRAO.copy(), "ajudante": METAS_PADRAO.copy()}
+
+async def _executar_cronometrado(nome: str, funcao: Callable, args: tuple) -> Tuple[Any, float]:
+    inicio = time.perf_counter()
+    try:
+        resultado = await run_in_threadpool(funcao, *args)
+    except Exception as e:
+        # As funções de core.database já tratam os seus erros; isto é a última rede de segurança.
+        logger.error(f"Erro inesperado ao carregar a fonte '{nome}': {e}")
+        resultado = _metas_padrao() if nome == "metas" else (None, f"Erro ao carregar a fonte '{nome}'.")
+    return resultado, (time.perf_counter() - inicio) * 1000
+
+async def carregar_fontes(
+    supabase: Client,
+    data_inicio: str,
+    data_fim: str,
+    fontes: Iterable[str] = tuple(FONTES),
+    busca: str = "",
+    colunas_viagens: Optional[List[str]] = None,
+    colunas_indicadores: Optional[List[str]] = None,
+    escopo: Optional[EscopoColaborador] = None
+) -> Dict[str, Any]:
+    """
+    Busca em paralelo as fontes independentes de um relatório (metas, viagens,
+    cadastro ou índice de pessoas, indicadores e caixas), cada uma no seu slot do threadpool.
+    'colunas_viagens' e 'colunas_indicadores' são a união das colunas que os motores usam.
+    Devolve o mesmo contrato de _get_dados_completos: DataFrames, 'error_message'
+    com o primeiro erro por ordem de prioridade, 'tempos_ms' por fonte e
+    'fontes_ignoradas' (fontes não pedidas, devolvidas como None).
+    Com 'escopo', as viagens são só as que entram nos números do colaborador (core.scope).
+    """
+    fontes = tuple(dict.fromkeys(fontes))
+    tarefas = _tarefas_fontes(supabase, data_inicio, data_fim, fontes, busca, colunas_viagens, colunas_indicadores, escopo)
+
+    inicio = time.perf_counter()
+    resultados = await asyncio.gather(
+        *(_executar_cronometrado(nome, funcao, args) for nome, (funcao, args) in tarefas.items())
+    )
+    total_ms = (time.perf_counter() - inicio) * 1000
+
+    dados: Dict[str, Any] = {chave: None for chave in FONTES.values()}
+    erros: Dict[str, Optional[str]] = {}
+    tempos_ms: Dict[str, float] = {}
+
+    for nome, (resultado, duracao_ms) in zip(tarefas, resultados):
+        tempos_ms[nome] = round(duracao_ms, 1)
+        if nome == "metas":
+            # Metas nunca falha: em erro devolve os valores padrão.
+            dados["metas"] = resultado
+            continue
+        df, erro = resultado
+        dados[FONTES[nome]] = df
+        erros[nome] = erro
+
+    dados["df_viagens_dedup"] = deduplicar_viagens(dados["df_viagens_bruto"])
+    dados["error_message"] = next((erros[f] for f in ORDEM_ERROS if erros.get(f)), None)
+    dados["tempos_ms"] = tempos_ms
+    dados["fontes_ignoradas"] = [f for f in FONTES if f not in tarefas]
+
+    logger.info(
+        f"Fontes carregadas {data_inicio}..{data_fim} em {total_ms:.1f} ms "
+        + " ".join(f"{nome}={ms}ms" for nome, ms in tempos_ms.items())
+        + (f" (ignoradas: {', '.join(dados['fontes_ignoradas'])})" if dados["fontes_ignoradas"] else "")
+        + (" [escopo do colaborador]" if escopo is not None else "")
+    )
+    return dados
+
+async def carregar_plano(
+    supabase: Client,
+    data_inicio: str,
+    data_fim: str,
+    plano: PlanoDados,
+    busca: str = "",
+    escopo: Optional[EscopoColaborador] = None
+) -> Dict[str, Any]:
+    """carregar_fontes restrito às fontes e colunas declaradas no plano (e ao escopo do colaborador)."""
+    return await carregar_fontes(
+        supabase, data_inicio, data_fim,
+        fontes=plano.fontes, busca=busca,
+        colunas_viagens=plano.colunas("viagens"),
+        colunas_indicadores=plano.colunas("indicadores"),
+        escopo=escopo,
+    )
@@ -0,0 +1,228 @@
+import asyncio
+import datetime
+import json
+import os
+import tempfile
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from fastapi.concurrency import run_in_threadpool
+from loguru import logger
+from starlette.requests import Request
+from supabase import Client
+from .database import get_metas_sincrono, get_pessoas_sincrono, recarregar_periodo
+from .loader import PlanoDados
+
+# Aquecimento em segundo plano: carrega Cadastro e Metas, busca os ciclos 26-25 atual e anterior
+# e pré-calcula os relatórios registados (xadrez, caixas, incentivo), repetindo a cada intervalo.
+# Desligado por padrão (cada rodada recarrega os ciclos inteiros do Supabase): AQUECIMENTO_ATIVO=1 liga.
+AQUECIMENTO_ATIVO = os.environ.get("AQUECIMENTO_ATIVO", "0") == "1"
+# Menor que CACHE_DIAS_TTL_SEGUNDOS: os dias do ciclo são recarregados antes de expirarem
+AQUECIMENTO_INTERVALO_SEGUNDOS = float(os.environ.get("AQUECIMENTO_INTERVALO_MIN", "5")) * 60
+# Ciclos aquecidos, a contar do atual (2 = atual e anterior)
+AQUECIMENTO_CICLOS = int(os.environ.get("AQUECIMENTO_CICLOS", "2"))
+# Trava de arquivo: com vários workers, só o processo que a obtém corre o aquecimento
+AQUECIMENTO_TRAVA = os.environ.get("AQUECIMENTO_TRAVA", os.path.join(tempfile.gettempdir(), "variavel_aquecimento.lock"))
+
+try:
+    import fcntl
+except ImportError:  # Windows: sem trava entre processos
+    fcntl = None
+
+# Ciclo de pagamento: do dia 26 de um mês ao dia 25 do seguinte
+DIA_INICIO_CICLO = 26
+
+# Usuário com que os relatórios são pré-calculados: o resultado fica nos caches de admin
+USUARIO_AGENDADOR = {"username": "agendador", "role": "admin"}
+
+# (supabase, início, fim) -> mensagem de erro ou None
+Aquecimento = Callable[[Client, str, str], Awaitable[Optional[str]]]
+
+def ciclos(hoje: datetime.date, quantidade: int = 2) -> List[Tuple[str, str]]:
+    """Ciclos 26-25 (início, fim) em ISO, do que contém 'hoje' para trás."""
+    ano, mes = hoje.year, hoje.month
+    if hoje.day < DIA_INICIO_CICLO:
+        ano, mes = (ano - 1, 12) if mes == 1 else (ano, mes - 1)
+    periodos = []
+    for _ in range(quantidade):
+        inicio = datetime.date(ano, mes, DIA_INICIO_CICLO)
+        proximo = (ano + 1, 1) if mes == 12 else (ano, mes + 1)
+        fim = datetime.date(proximo[0], proximo[1], DIA_INICIO_CICLO - 1)
+        periodos.append((inicio.isoformat(), fim.isoformat()))
+        ano, mes = (ano - 1, 12) if mes == 1 else (ano, mes - 1)
+    return periodos
+
+def pedido_interno() -> Request:
+    """Request mínimo para chamar uma rota fora de um pedido HTTP (sem cabeçalhos)."""
+    return Request({"type": "http", "method": "GET", "path": "/", "query_string": b"", "headers": []})
+
+def erro_da_resposta(resposta: Any) -> Optional[str]:
+    """Campo 'error' de uma resposta JSON de relatório (Response ou dict), se houver."""
+    if isinstance(resposta, dict):
+        return resposta.get("error")
+    corpo = getattr(resposta, "body", None)
+    if not corpo or getattr(resposta, "media_type", None) != "application/json":
+        return None
+    conteudo = json.loads(corpo)
+    return conteudo.get("error") if isinstance(conteudo, dict) else None
+
+class Agendador:
+    """
+    Tarefa de fundo (iniciada no lifespan da aplicação) que mantém os ciclos recentes quentes.
+    Cada rodada:
+      1. carrega Cadastro (e o índice de pessoas) e Metas em cache_referencia;
+      2. recarrega os dias de cada ciclo (Distribuição, Caixas, Indicadores), substituindo as
+         partições em cache antes de expirarem;
+      3. corre o aquecimento de cada relatório registado, que calcula e guarda a resposta
+         (cache_respostas, cache_resumos). Se os dados não mudaram, a resposta já está em cache.
+    As rodadas são sequenciais (uma fonte de cada vez no Supabase) e um erro numa tarefa
+    não interrompe as outras; o estado de cada uma fica em estado().
+    Com 'caminho_trava', só o processo que obtém a trava (flock não bloqueante) inicia o laço:
+    vários workers da mesma máquina não multiplicam a carga no Supabase.
+    """
+
+    def __init__(
+        self,
+        intervalo_segundos: float,
+        quantidade_ciclos: int,
+        ativo: bool = True,
+        caminho_trava: Optional[str] = None
+    ):
+        self.intervalo_segundos = intervalo_segundos
+        self.quantidade_ciclos = quantidade_ciclos
+        self.ativo = ativo
+        self.caminho_trava = caminho_trava
+        self._trava = None
+        self._relatorios: Dict[str, Tuple[PlanoDados, Aquecimento]] = {}
+        self._tarefa: Optional[asyncio.Task] = None
+        self._rodadas = 0
+        self._ultima_rodada: Optional[Dict[str, Any]] = None
+        self._proxima_rodada: Optional[str] = None
+        self._tarefas: Dict[str, Dict[str, Any]] = {}
+
+    def registar(self, nome: str, plano: PlanoDados, aquecer: Aquecimento) -> None:
+        """Relatório a pré-calcular; o plano diz que colunas dos Indicadores recarregar."""
+        self._relatorios[nome] = (plano, aquecer)
+
+    @property
+    def em_execucao(self) -> bool:
+        return self._tarefa is not None and not self._tarefa.done()
+
+    def _obter_trava(self) -> bool:
+        if self.caminho_trava is None or fcntl is None:
+            return True
+        arquivo = open(self.caminho_trava, "a")
+        try:
+            fcntl.flock(arquivo.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            arquivo.close()
+            return False
+        self._trava = arquivo
+        return True
+
+    def _libertar_trava(self) -> None:
+        if self._trava is not None:
+            # Fechar o arquivo liberta o flock
+            self._trava.close()
+            self._trava = None
+
+    def iniciar(self, supabase: Client) -> None:
+        if not self.ativo or self.em_execucao:
+            return
+        if not self._obter_trava():
+            logger.info(f"Aquecimento já corre noutro processo ({self.caminho_trava}); não iniciado neste.")
+            return
+        self._tarefa = asyncio.create_task(self._laco(supabase))
+        logger.info(
+            f"Aquecimento iniciado: {self.quantidade_ciclos} ciclo(s), a cada {self.intervalo_segundos:.0f} s "
+            f"({', '.join(self._relatorios) or 'sem relatórios'})"
+        )
+
+    async def parar(self) -> None:
+        if self._tarefa is None:
+            self._libertar_trava()
+            return
+        self._tarefa.cancel()
+        try:
+            await self._tarefa
+        except asyncio.CancelledError:
+            pass
+        self._tarefa = None
+        self._proxima_rodada = None
+        self._libertar_trava()
+
+    async def _laco(self, supabase: Client) -> None:
+        while True:
+            try:
+                await self.rodada(supabase)
+            except Exception as e:
+                # Última rede de segurança: o laço nunca termina por um erro
+                logger.error(f"Erro inesperado no aquecimento: {e}")
+            self._proxima_rodada = (
+                datetime.datetime.now() + datetime.timedelta(seconds=self.intervalo_segundos)
+            ).isoformat(timespec="seconds")
+            await asyncio.sleep(self.intervalo_segundos)
+
+    async def _executar(self, nome: str, aquecer: Callable[[], Awaitable[Optional[str]]]) -> None:
+        inicio = time.perf_counter()
+        try:
+            erro = await aquecer()
+        except Exception as e:
+            erro = str(e) or type(e).__name__
+        duracao_ms = round((time.perf_counter() - inicio) * 1000, 1)
+        self._tarefas[nome] = {
+            "ok": erro is None,
+            "erro": erro,
+            "duracao_ms": duracao_ms,
+            "em": datetime.datetime.now().isoformat(timespec="seconds"),
+        }
+        if erro is not None:
+            logger.warning(f"Aquecimento '{nome}' falhou: {erro}")
+
+    async def rodada(self, supabase: Client, hoje: Optional[datetime.date] = None) -> None:
+        """Uma rodada completa de aquecimento (também chamada diretamente nos testes)."""
+        inicio = time.perf_counter()
+        iniciada_em = datetime.datetime.now().isoformat(timespec="seconds")
+        periodos = ciclos(hoje or datetime.date.today(), self.quantidade_ciclos)
+
+        async def referencia():
+            _, erro = await run_in_threadpool(get_pessoas_sincrono, supabase)
+            await run_in_threadpool(get_metas_sincrono, supabase)
+            return erro
+
+        await self._executar("referencia", referencia)
+
+        colunas_indicadores = list({
+            None if colunas is None else tuple(colunas): colunas
+            for plano, _ in self._relatorios.values() if "indicadores" in plano.fontes
+            for colunas in [plano.colunas("indicadores")]
+        }.values())
+        for data_inicio, data_fim in periodos:
+            periodo = f"{data_inicio}..{data_fim}"
+            await self._executar(f"dados {periodo}", lambda: run_in_threadpool(
+                recarregar_periodo, supabase, data_inicio, data_fim, colunas_indicadores
+            ))
+            for nome, (_, aquecer) in self._relatorios.items():
+                await self._executar(f"{nome} {periodo}", lambda: aquecer(supabase, data_inicio, data_fim))
+
+        self._rodadas += 1
+        self._ultima_rodada = {
+            "inicio": iniciada_em,
+            "duracao_ms": round((time.perf_counter() - inicio) * 1000, 1),
+            "ciclos": [list(periodo) for periodo in periodos],
+        }
+        logger.info(f"Aquecimento concluído em {self._ultima_rodada['duracao_ms']} ms ({len(self._tarefas)} tarefas)")
+
+    def estado(self) -> Dict[str, Any]:
+        return {
+            "ativo": self.ativo,
+            "em_execucao": self.em_execucao,
+            "intervalo_segundos": self.intervalo_segundos,
+            "ciclos": self.quantidade_ciclos,
+            "relatorios": list(self._relatorios),
+            "rodadas": self._rodadas,
+            "ultima_rodada": self._ultima_rodada,
+            "proxima_rodada": self._proxima_rodada,
+            "tarefas": self._tarefas,
+        }
+
+agendador = Agendador(AQUECIMENTO_INTERVALO_SEGUNDOS, AQUECIMENTO_CICLOS, AQUECIMENTO_ATIVO, AQUECIMENTO_TRAVA)
@@ -0,0 +1,217 @@
+import os
+import pandas as pd
+from dataclasses import dataclass
+from typing import Callable, Dict, FrozenSet, Iterable, List, Optional, Tuple
+from fastapi.concurrency import run_in_threadpool
+from supabase import Client
+from .analysis import COLUNAS_EQUIPE, colunas_equipe
+from .database import (
+    NOME_COLUNA_DATA,
+    NOME_COLUNA_ID,
+    NOME_DA_TABELA,
+    TAMANHO_PAGINA,
+    _contar_distribuicao,
+    _limpar_distribuicao,
+    cache_distribuicao,
+    expandir_colunas_equipe,
+    get_colunas_distribuicao,
+    get_dados_apurados,
+    get_indice_pessoas,
+    unir_colunas,
+    versao_periodo,
+)
+
+# Execução restrita a um colaborador (usuários não-admin): só as viagens que entram nos seus números.
+# ESCOPO_COLABORADOR_ATIVO=0 volta a calcular a empresa inteira e filtrar pelo CPF no fim.
+ESCOPO_ATIVO = os.environ.get("ESCOPO_COLABORADOR_ATIVO", "1") != "0"
+
+# Valores por filtro 'in' num pedido ao Supabase (limita o tamanho da URL)
+VALORES_POR_FILTRO = 200
+
+@dataclass(frozen=True)
+class EscopoColaborador:
+    """Códigos de um CPF no Cadastro, como motorista e como ajudante."""
+    codigos_motorista: FrozenSet[int]
+    codigos_ajudante: FrozenSet[int]
+
+    @property
+    def vazio(self) -> bool:
+        return not (self.codigos_motorista or self.codigos_ajudante)
+
+def escopo_do_usuario(supabase: Client, cpf: str) -> EscopoColaborador:
+    """Códigos do CPF pelo índice do Cadastro (sem Cadastro, escopo vazio: nenhuma linha)."""
+    indice = get_indice_pessoas(supabase)
+    if indice is None:
+        return EscopoColaborador(frozenset(), frozenset())
+    return EscopoColaborador(indice.codigos(cpf, "motorista"), indice.codigos(cpf, "ajudante"))
+
+async def escopo_da_requisicao(supabase: Client, current_user: dict) -> Optional[EscopoColaborador]:
+    """Escopo do usuário autenticado; None para admin (ou com o modo restrito desligado): empresa inteira."""
+    if current_user["role"] == "admin" or not ESCOPO_ATIVO:
+        return None
+    return await run_in_threadpool(escopo_do_usuario, supabase, current_user["username"])
+
+def _codigos_em(df: pd.DataFrame, colunas: Iterable[str], codigos: Iterable[int]) -> pd.Series:
+    """Linhas em que alguma das colunas (quando existe) tem um dos códigos."""
+    codigos = list(codigos)
+    mascara = pd.Series(False, index=df.index)
+    if not codigos:
+        return mascara
+    for col in colunas:
+        if col in df.columns:
+            mascara |= pd.to_numeric(df[col], errors='coerce').isin(codigos)
+    return mascara
+
+def _codigos_das_linhas(df: pd.DataFrame, colunas: Iterable[str]) -> FrozenSet[int]:
+    valores = [pd.to_numeric(df[col], errors='coerce') for col in colunas if col in df.columns]
+    if not valores:
+        return frozenset()
+    return frozenset(pd.concat(valores).dropna().astype(int).tolist())
+
+def recortar_viagens(df: pd.DataFrame, escopo: EscopoColaborador) -> pd.DataFrame:
+    """
+    Viagens de que dependem os números do colaborador, na ordem original:
+      1. as suas (COD/COD_2 nos códigos de motorista, CODJ_n nos de ajudante);
+      2. como ajudante, o contexto do motorista fixo: todas as viagens dos motoristas com quem
+         andou (total de viagens de cada um) e todas as dos ajudantes desses motoristas (quem
+         é fixo de quem, que decide a regra estrita de visitantes);
+      3. todas as linhas dos MAPAs acima, para que a deduplicação escolha a mesma linha.
+    Os motores aplicados a este recorte dão, para os códigos do escopo, o mesmo que na empresa inteira.
+    """
+    colunas_codj = colunas_equipe(df.columns, 'CODJ')
+    linhas = _codigos_em(df, ['COD', 'COD_2'], escopo.codigos_motorista)
+    if escopo.codigos_ajudante:
+        com_ajudante = _codigos_em(df, colunas_codj, escopo.codigos_ajudante)
+        motoristas = _codigos_das_linhas(df[com_ajudante], ['COD'])
+        dos_motoristas = _codigos_em(df, ['COD'], motoristas)
+        colegas = _codigos_das_linhas(df[dos_motoristas], colunas_codj)
+        linhas |= com_ajudante | dos_motoristas | _codigos_em(df, colunas_codj, colegas)
+    if 'MAPA' in df.columns:
+        linhas |= df['MAPA'].isin(df.loc[linhas, 'MAPA'].unique())
+    return df[linhas]
+
+def _buscar_filtrado(
+    supabase: Client,
+    data_inicio_str: str,
+    data_fim_str: str,
+    colunas: str,
+    filtrar: Callable
+) -> List[dict]:
+    """Todas as páginas de uma consulta filtrada da Distribuição no período, ordenada por (DATA, id)."""
+    linhas, pagina = [], 0
+    while True:
+        consulta = (
+            supabase.table(NOME_DA_TABELA)
+            .select(colunas)
+            .gte(NOME_COLUNA_DATA, data_inicio_str)
+            .lte(NOME_COLUNA_DATA, data_fim_str)
+        )
+        dados = (
+            filtrar(consulta)
+            .order(NOME_COLUNA_DATA)
+            .order(NOME_COLUNA_ID)
+            .range(pagina * TAMANHO_PAGINA, (pagina + 1) * TAMANHO_PAGINA - 1)
+            .execute()
+        ).data or []
+        linhas.extend(dados)
+        if len(dados) < TAMANHO_PAGINA:
+            return linhas
+        pagina += 1
+
+def _valor_postgrest(valor) -> str:
+    """
+    Valor de uma lista 'in' do PostgREST entre aspas, com \\ e " escapados: vírgulas, pontos,
+    parênteses e aspas num valor não quebram o filtro 'or' (que não passa pelo in_() do postgrest).
+    """
+    return '"' + str(valor).replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+def _buscar_por_valores(
+    supabase: Client,
+    data_inicio_str: str,
+    data_fim_str: str,
+    colunas: str,
+    colunas_filtro: List[str],
+    valores: Iterable
+) -> List[dict]:
+    """Linhas em que alguma das 'colunas_filtro' tem um dos valores (filtro 'or' de 'in' do PostgREST)."""
+    valores = sorted(valores, key=str)
+    linhas = []
+    for inicio in range(0, len(valores), VALORES_POR_FILTRO):
+        bloco = ",".join(_valor_postgrest(valor) for valor in valores[inicio:inicio + VALORES_POR_FILTRO])
+        expressao = ",".join(f"{col}.in.({bloco})" for col in colunas_filtro)
+        linhas.extend(_buscar_filtrado(supabase, data_inicio_str, data_fim_str, colunas, lambda c: c.or_(expressao)))
+    return linhas
+
+def _buscar_viagens_escopo(
+    supabase: Client,
+    data_inicio_str: str,
+    data_fim_str: str,
+    escopo: EscopoColaborador,
+    colunas: Optional[List[str]]
+) -> pd.DataFrame:
+    """
+    As viagens de recortar_viagens pedidas ao Supabase por código, em vez do período inteiro
+    (um pedido por etapa do recorte), limpas como em get_dados_apurados e já recortadas.
+    """
+    # Todas as posições de ajudante da tabela entram nos filtros (e na projeção)
+    colunas_codj = colunas_equipe(get_colunas_distribuicao(supabase) or COLUNAS_EQUIPE, 'CODJ')
+    colunas = expandir_colunas_equipe(supabase, colunas)
+    colunas_select = "*"
+    if colunas is not None:
+        colunas_select = ",".join(sorted(set(unir_colunas(
+            [NOME_COLUNA_ID, NOME_COLUNA_DATA, 'MAPA', 'COD', 'COD_2'], colunas_codj, colunas
+        ))))
+    por_id: Dict[int, dict] = {}
+
+    def buscar(colunas_filtro: List[str], valores: Iterable) -> pd.DataFrame:
+        if valores:
+            for linha in _buscar_por_valores(supabase, data_inicio_str, data_fim_str, colunas_select, colunas_filtro, valores):
+                por_id.setdefault(linha[NOME_COLUNA_ID], linha)
+        return pd.DataFrame(list(por_id.values()))
+
+    buscar(['COD', 'COD_2'], escopo.codigos_motorista)
+    df = buscar(colunas_codj, escopo.codigos_ajudante)
+    if escopo.codigos_ajudante and not df.empty:
+        motoristas = _codigos_das_linhas(df[_codigos_em(df, colunas_codj, escopo.codigos_ajudante)], ['COD'])
+        df = buscar(['COD'], motoristas)
+        colegas = _codigos_das_linhas(df[_codigos_em(df, ['COD'], motoristas)], colunas_codj)
+        df = buscar(colunas_codj, colegas - escopo.codigos_ajudante)
+    if not df.empty and 'MAPA' in df.columns:
+        df = buscar(['MAPA'], df['MAPA'].dropna().unique().tolist())
+
+    if df.empty:
+        return df
+    # Mesma ordem (DATA, id) da busca por período: a deduplicação fica com as mesmas linhas
+    df = df.sort_values([NOME_COLUNA_DATA, NOME_COLUNA_ID], key=lambda s: s.astype(str) if s.name == NOME_COLUNA_DATA else s)
+    df = recortar_viagens(_limpar_distribuicao(df.reset_index(drop=True)), escopo)
+    if colunas is not None:
+        # Mesmas colunas (e ordem) da busca por período
+        df = df[[col for col in sorted(unir_colunas([NOME_COLUNA_DATA, 'MAPA', 'COD'], colunas)) if col in df.columns]]
+    return df
+
+def get_viagens_do_escopo(
+    supabase: Client,
+    data_inicio_str: str,
+    data_fim_str: str,
+    escopo: EscopoColaborador,
+    colunas: Optional[Iterable[str]] = None
+) -> Tuple[Optional[pd.DataFrame], Optional[str]]:
+    """
+    Fonte 'viagens' de um usuário não-admin: as viagens de recortar_viagens.
+    Com o período inteiro em cache_distribuicao, o recorte é feito em memória; senão só as
+    viagens do colaborador vão ao Supabase. Se a busca restrita falhar, busca o período inteiro.
+    """
+    colunas = list(colunas) if colunas is not None else None
+    if versao_periodo(cache_distribuicao, data_inicio_str, data_fim_str) is None:
+        try:
+            df = _buscar_viagens_escopo(supabase, data_inicio_str, data_fim_str, escopo, colunas)
+            if df.empty and _contar_distribuicao(supabase, data_inicio_str, data_fim_str) == 0:
+                return None, "Nenhum dado encontrado para o período selecionado."
+            return df, None
+        except Exception as e:
+            print(f"Busca restrita ao colaborador falhou ({e}), buscando o período inteiro.")
+
+    df, erro = get_dados_apurados(supabase, data_inicio_str, data_fim_str, "", colunas)
+    if df is None:
+        return None, erro
+    return recortar_viagens(df, escopo), None
@@ -0,0 +1,97 @@
+import datetime
+import decimal
+import json
+import numpy as np
+import pandas as pd
+from typing import Any, Callable, Iterator, List
+
+try:
+    import orjson
+except ImportError:  # sem orjson: json da biblioteca padrão (mesma saída, mais lento)
+    orjson = None
+
+# Forma das tabelas na resposta JSON (?layout=): lista de objetos por linha ou um array por coluna
+LAYOUTS = ("records", "columnar")
+PADRAO_LAYOUT = r"^(records|columnar)$"
+
+MEDIA_TYPE_NDJSON = "application/x-ndjson"
+
+# Linhas codificadas por bloco no modo NDJSON
+LINHAS_POR_BLOCO_NDJSON = 1000
+
+# Colunas que o orjson serializa direto do array NumPy (sem criar objetos Python)
+_TIPOS_NUMPY_DIRETOS = "biuf"
+
+def _valores(serie: pd.Series) -> List[Any]:
+    """Valores Python de uma coluna; NaN/None/NaT como None."""
+    if serie.dtype.kind in "biu":
+        return serie.tolist()
+    return serie.astype(object).where(serie.notna(), None).tolist()
+
+def _coluna(serie: pd.Series) -> Any:
+    if orjson is not None and serie.dtype.kind in _TIPOS_NUMPY_DIRETOS:
+        # NaN sai como null; o orjson exige um array contíguo
+        return np.ascontiguousarray(serie.to_numpy())
+    return _valores(serie)
+
+def tabela_json(df: pd.DataFrame, layout: str = "records") -> Any:
+    """
+    DataFrame na forma da resposta: 'records' é [{coluna: valor}, ...] (como to_dict('records'),
+    com vazios como null); 'columnar' é {coluna: [valores]}, sem um objeto por linha.
+    """
+    colunas = [str(col) for col in df.columns]
+    if layout == "columnar":
+        return {nome: _coluna(df.iloc[:, i]) for i, nome in enumerate(colunas)}
+    valores = [_valores(df.iloc[:, i]) for i in range(len(colunas))]
+    return [dict(zip(colunas, linha)) for linha in zip(*valores)]
+
+def _conversor(layout: str) -> Callable[[Any], Any]:
+    """Tipos que o encoder não conhece (chamado pelo orjson/json para cada um)."""
+
+    def converter(obj: Any) -> Any:
+        if isinstance(obj, pd.DataFrame):
+            return tabela_json(obj, layout)
+        if isinstance(obj, pd.Series):
+            return _valores(obj)
+        if isinstance(obj, np.ndarray):
+            return obj.tolist()
+        if isinstance(obj, np.generic):
+            return obj.item()
+        if obj is pd.NaT or obj is pd.NA:
+            return None
+        if isinstance(obj, (datetime.date, datetime.time)):
+            return obj.isoformat()
+        if isinstance(obj, decimal.Decimal):
+            return float(obj)
+        if isinstance(obj, (set, frozenset, tuple)):
+            return list(obj)
+        raise TypeError(f"Tipo não serializável em JSON: {type(obj).__name__}")
+
+    return converter
+
+def _codificador(layout: str) -> Callable[[Any], bytes]:
+    if orjson is not None:
+        conversor, opcoes = _conversor(layout), orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+        return lambda conteudo: orjson.dumps(conteudo, default=conversor, option=opcoes)
+    # Mesmos parâmetros do JSONResponse do Starlette
+    codificador = json.JSONEncoder(
+        default=_conversor(layout), ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")
+    )
+    return lambda conteudo: codificador.encode(conteudo).encode("utf-8")
+
+def serializar(conteudo: Any, layout: str = "records") -> bytes:
+    """
+    Corpo JSON (UTF-8, compacto) de uma resposta. DataFrames podem ser passados como valores e
+    são serializados direto das colunas, no layout pedido, sem passar pelo jsonable_encoder.
+    """
+    return _codificador(layout)(conteudo)
+
+def ndjson_em_blocos(df: pd.DataFrame) -> Iterator[bytes]:
+    """
+    Linhas do DataFrame como NDJSON (um objeto JSON por linha), codificadas à medida que são
+    enviadas, em blocos de LINHAS_POR_BLOCO_NDJSON linhas: só um bloco fica em memória.
+    """
+    codificar = _codificador("records")
+    for inicio in range(0, len(df), LINHAS_POR_BLOCO_NDJSON):
+        linhas = tabela_json(df.iloc[inicio:inicio + LINHAS_POR_BLOCO_NDJSON])
+        yield b"".join(codificar(linha) + b"\n" for linha in linhas)
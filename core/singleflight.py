@@ -0,0 +1,85 @@
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+from loguru import logger
+
+class ExecucaoUnica:
+    """
+    Cálculos em curso por chave (rota, período, parâmetros): pedidos idênticos que chegam
+    enquanto um cálculo corre esperam por ele em vez de buscar e calcular de novo.
+    Cada cálculo guarda a versão dos dados com que começou (as versões das fontes nos caches,
+    None se ainda não estavam em cache); um pedido só se junta a um cálculo compatível:
+    mesma versão, ou uma das duas desconhecida (o cálculo em curso está a buscar esses dados).
+    O resultado é partilhado entre os pedidos e não deve ser alterado (filtros criam cópias).
+    Nada fica guardado depois de o cálculo terminar.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # chave -> (versão, tarefa)
+        self._em_curso: Dict[Hashable, Tuple[Any, asyncio.Future]] = {}
+        self._execucoes = 0
+        self._partilhadas = 0
+
+    @staticmethod
+    def _compativel(versao_em_curso: Any, versao: Any) -> bool:
+        return versao_em_curso is None or versao is None or versao_em_curso == versao
+
+    def _tarefa(self, chave: Hashable, versao: Any) -> Optional[asyncio.Future]:
+        with self._lock:
+            entrada = self._em_curso.get(chave)
+        if entrada is None or entrada[1].done() or not self._compativel(entrada[0], versao):
+            return None
+        return entrada[1]
+
+    def em_curso(self, chave: Hashable, versao: Any = None) -> Optional[Awaitable[Any]]:
+        """
+        Resultado de um cálculo em curso compatível com a versão, para ser aguardado
+        (chamar a partir do event loop), ou None se não houver nenhum.
+        """
+        tarefa = self._tarefa(chave, versao)
+        if tarefa is None:
+            return None
+        with self._lock:
+            self._partilhadas += 1
+        logger.debug(f"Pedido juntou-se ao cálculo em curso {chave}")
+        # shield: cancelar o pedido que espera não cancela o cálculo partilhado
+        return asyncio.shield(tarefa)
+
+    async def executar(self, chave: Hashable, versao: Any, calcular: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Resultado de calcular(), partilhado com os pedidos da mesma chave e versão compatível
+        que chegarem enquanto corre. Exceções chegam a todos os que esperavam.
+        Se o pedido que iniciou o cálculo for cancelado (cliente desligou), o cálculo continua
+        para os restantes.
+        """
+        em_curso = self.em_curso(chave, versao)
+        if em_curso is not None:
+            return await em_curso
+        # Sem await entre a consulta e o registo: nenhum outro pedido do event loop se intercala
+        tarefa = asyncio.ensure_future(calcular())
+        with self._lock:
+            self._em_curso[chave] = (versao, tarefa)
+            self._execucoes += 1
+        tarefa.add_done_callback(lambda t: self._terminar(chave, t))
+        return await asyncio.shield(tarefa)
+
+    def _terminar(self, chave: Hashable, tarefa: asyncio.Future) -> None:
+        with self._lock:
+            entrada = self._em_curso.get(chave)
+            if entrada is not None and entrada[1] is tarefa:
+                del self._em_curso[chave]
+        if not tarefa.cancelled() and tarefa.exception() is not None:
+            # Recupera a exceção mesmo que nenhum pedido espere mais por ela
+            logger.debug(f"Cálculo {chave} terminou com erro: {tarefa.exception()!r}")
+
+    def estatisticas(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "em_curso": len(self._em_curso),
+                "execucoes": self._execucoes,
+                "partilhadas": self._partilhadas,
+            }
+
+# Instância única da aplicação (todas as rotas correm no mesmo event loop)
+execucoes = ExecucaoUnica()
@@ -0,0 +1,186 @@
+import datetime
+import hashlib
+import json
+import os
+import re
+import threading
+import pandas as pd
+from pathlib import Path
+from typing import Any, Dict, Optional
+from loguru import logger
+from .cache import calcular_versao, copia_editavel
+from .database import cache_referencia, CHAVE_CADASTRO
+from .export import juntar_por_tipo
+
+# Resultados finais do /pagamento de períodos fechados, um arquivo Parquet por período.
+# Só POST /pagamento/fechar grava; o GET lê um snapshot existente enquanto as versões das
+# fontes em cache forem as do fecho (depois de /refresh ou de dados novos, é ignorado).
+SNAPSHOTS_DIR = Path(os.environ.get("SNAPSHOTS_DIR", Path(__file__).resolve().parent.parent / "snapshots"))
+SNAPSHOTS_ATIVOS = os.environ.get("SNAPSHOTS_ATIVOS", "1") != "0"
+
+# Incrementar quando uma mudança nos motores invalidar os snapshots gravados
+VERSAO_SNAPSHOT = 1
+
+_PADRAO_DATA = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+
+def periodo_fechado(data_inicio: str, data_fim: str, hoje: Optional[datetime.date] = None) -> bool:
+    """Período com datas válidas que terminou antes de hoje (pode ser fechado)."""
+    if not (_PADRAO_DATA.match(data_inicio or "") and _PADRAO_DATA.match(data_fim or "")):
+        return False
+    try:
+        fim = datetime.date.fromisoformat(data_fim)
+        datetime.date.fromisoformat(data_inicio)
+    except ValueError:
+        return False
+    return fim < (hoje or datetime.date.today())
+
+def impressao_entradas(dados: Dict[str, Any]) -> str:
+    """
+    Impressão digital das entradas de um cálculo do pagamento (viagens, Cadastro, indicadores,
+    caixas e metas), gravada no snapshot para saber se um novo fecho mudou alguma coisa.
+    """
+    h = hashlib.sha1(f"v{VERSAO_SNAPSHOT}".encode())
+    for chave in ("df_viagens_dedup", "df_indicadores", "df_caixas", "metas"):
+        valor = dados.get(chave)
+        h.update(f"{chave}={calcular_versao(valor) if valor is not None else '-'};".encode())
+    h.update(f"cadastro={cache_referencia.versao(CHAVE_CADASTRO) or '-'}".encode())
+    return h.hexdigest()[:16]
+
+class Snapshot:
+    def __init__(
+        self,
+        motoristas: pd.DataFrame,
+        ajudantes: pd.DataFrame,
+        metas: dict,
+        impressao: str,
+        fechado_em: str,
+        versoes: Optional[Dict[str, str]] = None
+    ):
+        self.motoristas = motoristas
+        self.ajudantes = ajudantes
+        self.metas = metas
+        self.impressao = impressao
+        self.fechado_em = fechado_em
+        # Versões das fontes em cache no fecho (core.etag.versoes_plano)
+        self.versoes = versoes
+
+    def valido_para(self, versoes: Optional[Dict[str, str]]) -> bool:
+        """Calculado com as fontes nestas versões (desconhecidas = não se sabe: inválido)."""
+        return versoes is not None and self.versoes == versoes
+
+class RepositorioSnapshots:
+    """
+    Snapshots do pagamento num diretório local: <diretório>/pagamento_<início>_<fim>.parquet,
+    com motoristas e ajudantes numa só tabela (coluna 'tipo') e, nos metadados do arquivo,
+    as metas usadas, a impressão digital das entradas, as versões das fontes e a data do fecho.
+    A gravação é atómica (arquivo temporário + rename).
+    """
+
+    def __init__(self, diretorio: Path, ativo: bool = True):
+        self.diretorio = Path(diretorio)
+        self.ativo = ativo
+        self._lock = threading.Lock()
+
+    def _pyarrow(self):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+            return pyarrow
+        except ImportError:
+            if self.ativo:
+                logger.warning("pyarrow não instalado: snapshots do pagamento desativados.")
+                self.ativo = False
+            return None
+
+    def _caminho(self, data_inicio: str, data_fim: str) -> Optional[Path]:
+        # As datas vêm da query string: só datas ISO chegam ao nome do arquivo
+        if not (_PADRAO_DATA.match(data_inicio or "") and _PADRAO_DATA.match(data_fim or "")):
+            return None
+        return self.diretorio / f"pagamento_{data_inicio}_{data_fim}.parquet"
+
+    def _info(self, caminho: Path) -> Optional[Dict[str, Any]]:
+        """Metadados do snapshot (só o esquema do arquivo é lido); None se de outra VERSAO_SNAPSHOT."""
+        pa = self._pyarrow()
+        if pa is None or not caminho.exists():
+            return None
+        info = json.loads(pa.parquet.read_schema(caminho).metadata[b"snapshot"])
+        return info if info.get("versao") == VERSAO_SNAPSHOT else None
+
+    def versao(self, data_inicio: str, data_fim: str, versoes: Optional[Dict[str, str]]) -> Optional[str]:
+        """
+        Versão do snapshot gravado (data de modificação do arquivo), sem ler as tabelas;
+        None se não existir ou se não tiver sido calculado com as fontes nestas versões.
+        """
+        caminho = self._caminho(data_inicio, data_fim)
+        if not self.ativo or caminho is None or versoes is None:
+            return None
+        try:
+            info = self._info(caminho)
+            if info is None or info.get("versoes") != versoes:
+                return None
+            return f"v{VERSAO_SNAPSHOT}-{caminho.stat().st_mtime_ns}"
+        except Exception:
+            return None
+
+    def ler(self, data_inicio: str, data_fim: str) -> Optional[Snapshot]:
+        caminho = self._caminho(data_inicio, data_fim)
+        pa = self._pyarrow() if self.ativo and caminho is not None else None
+        if pa is None or not caminho.exists():
+            return None
+        try:
+            tabela = pa.parquet.read_table(caminho)
+            info = json.loads(tabela.schema.metadata[b"snapshot"])
+            if info.get("versao") != VERSAO_SNAPSHOT:
+                return None
+            df = tabela.to_pandas()
+        except Exception as e:
+            logger.warning(f"Snapshot {caminho.name} ilegível, será recalculado: {e}")
+            return None
+
+        def parte(tipo):
+            return df[df["tipo"] == tipo].drop(columns="tipo").reset_index(drop=True)
+
+        return Snapshot(
+            parte("Motorista"), parte("Ajudante"), info["metas"], info["impressao"], info["fechado_em"], info.get("versoes")
+        )
+
+    def gravar(
+        self,
+        data_inicio: str,
+        data_fim: str,
+        motoristas: pd.DataFrame,
+        ajudantes: pd.DataFrame,
+        metas: dict,
+        impressao: str,
+        versoes: Optional[Dict[str, str]] = None
+    ) -> Optional[Snapshot]:
+        caminho = self._caminho(data_inicio, data_fim)
+        pa = self._pyarrow() if self.ativo and caminho is not None else None
+        if pa is None:
+            return None
+
+        fechado_em = datetime.datetime.now().isoformat(timespec="seconds")
+        # As metas podem vir de cache_referencia (só leitura): gravadas como dict comum
+        metas = copia_editavel(metas)
+        info = {
+            "versao": VERSAO_SNAPSHOT, "impressao": impressao, "metas": metas, "fechado_em": fechado_em, "versoes": versoes
+        }
+        tabela = pa.Table.from_pandas(juntar_por_tipo({"Motorista": motoristas, "Ajudante": ajudantes}), preserve_index=False)
+        tabela = tabela.replace_schema_metadata({
+            **(tabela.schema.metadata or {}),
+            b"snapshot": json.dumps(info, default=str).encode(),
+        })
+
+        with self._lock:
+            self.diretorio.mkdir(parents=True, exist_ok=True)
+            temporario = caminho.with_suffix(f".{threading.get_ident()}.tmp")
+            try:
+                pa.parquet.write_table(tabela, temporario, compression="zstd")
+                os.replace(temporario, caminho)
+            finally:
+                temporario.unlink(missing_ok=True)
+
+        logger.info(f"Snapshot do pagamento {data_inicio}..{data_fim} gravado ({impressao})")
+        return Snapshot(motoristas, ajudantes, metas, impressao, fechado_em, versoes)
+
+repositorio_snapshots = RepositorioSnapshots(SNAPSHOTS_DIR, SNAPSHOTS_ATIVOS)
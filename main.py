@@ -1,8 +1,9 @@
 import os
+from contextlib import asynccontextmanager
 from pathlib import Path
 from typing import List, Optional
 import pandas as pd
-from fastapi import FastAPI, Request, Query
+from fastapi import FastAPI, Request, Query, Depends, HTTPException, status
 from fastapi.responses import Response
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
@@ -12,13 +13,29 @@ from supabase import create_client, Client
 
 # Importações internas do projeto
 from routers import auth, xadrez, incentivo, metas, caixas, pagamento
-from core.database import clear_cache
+from core.database import _buscar_distribuicao, clear_cache
+from core.scheduler import agendador
+from core.security import get_current_user
 
 # --- CARREGAMENTO DO AMBIENTE ---
 env_path = Path(__file__).resolve().parent / ".env"
 load_dotenv(dotenv_path=env_path)
 
-app = FastAPI()
+# --- AQUECIMENTO EM SEGUNDO PLANO ---
+# Ciclos atual e anterior pré-calculados (core.scheduler), iniciado com a aplicação quando
+# AQUECIMENTO_ATIVO=1 e apenas num dos workers (trava em AQUECIMENTO_TRAVA)
+agendador.registar("xadrez", xadrez.PLANO_XADREZ_RESUMO, xadrez.aquecer)
+agendador.registar("caixas", caixas.PLANO_CAIXAS, caixas.aquecer)
+agendador.registar("incentivo", incentivo.PLANO_INCENTIVO, incentivo.aquecer)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if supabase is not None:
+        agendador.iniciar(supabase)
+    yield
+    await agendador.parar()
+
+app = FastAPI(lifespan=lifespan)
 
 # --- CONFIGURAÇÃO DE CORS ---
 origins = [
@@ -78,9 +95,18 @@ def root():
 
 @app.post("/refresh")
 def refresh_data():
+    # Sem versões em cache, os snapshots do pagamento deixam de ser servidos até as fontes
+    # serem recarregadas e conferidas com as do fecho (core.snapshots)
     clear_cache()
     return {"message": "Cache limpo com sucesso."}
 
+@app.get("/aquecimento")
+def estado_aquecimento(current_user: dict = Depends(get_current_user)):
+    """Estado do aquecimento em segundo plano: última rodada e resultado de cada tarefa."""
+    if current_user["role"] != "admin":
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Acesso negado.")
+    return agendador.estado()
+
 # --- ROTA CRÍTICA: XADREZ DETALHADO COM SOMA DE CAIXAS ---
 @app.get("/xadrez/detalhado")
 async def get_xadrez_detalhado(
@@ -94,18 +120,23 @@ async def get_xadrez_detalhado(
     try:
         client = request.state.supabase
         
-        # 1. Busca dados de Distribuição (Viagens)
-        resp_viagens = client.table("Distribuição")\
-            .select("*")\
-            .gte("DATA", data_inicio)\
-            .lte("DATA", data_fim)\
-            .order("DATA", desc=False)\
-            .execute()
+        # Colunas devolvidas pela rota (a coluna 'caixas' vem da tabela Caixas)
+        colunas_final = [
+            'DATA', 'MAPA', 'caixas', 
+            'COD', 'MOTORISTA', 'COD_2', 'MOTORISTA_2',
+            'CODJ_1', 'AJUDANTE_1', 'CODJ_2', 'AJUDANTE_2', 'CODJ_3', 'AJUDANTE_3'
+        ]
+
+        # 1. Busca dados de Distribuição (Viagens), apenas as colunas usadas
+        # (se a projeção falhar, _buscar_distribuicao repete com todas as colunas)
+        viagens = _buscar_distribuicao(
+            client, data_inicio, data_fim, colunas=",".join(c for c in colunas_final if c != 'caixas')
+        )
         
-        if not resp_viagens.data:
+        if not viagens:
             return []
 
-        df_v = pd.DataFrame(resp_viagens.data)
+        df_v = pd.DataFrame(viagens)
 
         # 2. Busca dados de Caixas para o período
         resp_caixas = client.table("Caixas")\
@@ -129,12 +160,6 @@ async def get_xadrez_detalhado(
             df_v['caixas'] = 0
 
         # 4. Organização Final das Colunas (Conforme solicitado)
-        colunas_final = [
-            'DATA', 'MAPA', 'caixas', 
-            'COD', 'MOTORISTA', 'COD_2', 'MOTORISTA_2',
-            'CODJ_1', 'AJUDANTE_1', 'CODJ_2', 'AJUDANTE_2', 'CODJ_3', 'AJUDANTE_3'
-        ]
-        
         # Garante que apenas colunas existentes sejam filtradas
         colunas_existentes = [c for c in colunas_final if c in df_v.columns]
         df_v = df_v[colunas_existentes].fillna(0)
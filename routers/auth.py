@@ -1,7 +1,7 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Request
 from fastapi.security import OAuth2PasswordRequestForm
 from supabase import Client
-from core.database import get_cadastro_sincrono, get_supabase
+from core.database import get_indice_pessoas, get_supabase
 from core.security import create_access_token
 from datetime import timedelta
 import os
@@ -25,22 +25,13 @@ def login_for_access_token(
     
     # 2. Verificar Colaborador
     else:
-        df_cadastro, _ = get_cadastro_sincrono(supabase)
+        pessoas = get_indice_pessoas(supabase)
         
-        if df_cadastro is None or df_cadastro.empty:
+        if pessoas is None:
              raise HTTPException(status_code=400, detail="Erro ao aceder ao cadastro.")
 
-        cpf_limpo = username.replace(".", "").replace("-", "")
-        
-        existe_motorista = False
-        existe_ajudante = False
-
-        if 'CPF_M' in df_cadastro.columns:
-            existe_motorista = df_cadastro['CPF_M'].astype(str).str.replace(r'[.-]', '', regex=True).eq(cpf_limpo).any()
-        if 'CPF_J' in df_cadastro.columns:
-            existe_ajudante = df_cadastro['CPF_J'].astype(str).str.replace(r'[.-]', '', regex=True).eq(cpf_limpo).any()
-
-        if not (existe_motorista or existe_ajudante):
+        # Consulta O(1) no índice montado uma vez por versão do Cadastro
+        if not pessoas.contem(username):
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="CPF não encontrado ou senha incorreta.",
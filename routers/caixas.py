@@ -1,15 +1,39 @@
 import datetime
+import numbers
+import numpy as np
 import pandas as pd
 from fastapi import APIRouter, Request, Depends, HTTPException, Query
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Tuple
 from fastapi.concurrency import run_in_threadpool
-from core.database import get_dados_apurados, get_cadastro_sincrono, get_caixas_sincrono, get_supabase
-from .metas import _get_metas_sincrono
+from core.database import get_supabase
+from core.loader import PlanoDados, carregar_plano
+from core.analysis import COLUNAS_EQUIPE, colunas_equipe
+from core.context import ContextoCalculo
+from core.etag import ControleEtag
+from core.serialization import PADRAO_LAYOUT
+from core.export import PADRAO_FORMATO, juntar_por_tipo, registros, resposta_tabela
+from core.indexes import filtrar_por_cpf
+from core.scope import escopo_da_requisicao
+from core.scheduler import USUARIO_AGENDADOR, erro_da_resposta, pedido_interno
 from core.security import get_current_user
 from supabase import Client
 
 router = APIRouter(prefix="/caixas", tags=["Caixas"])
 
+# Colunas da Distribuição lidas por processar_caixas_sincrono
+# As posições CODJ_n além das padrão são acrescentadas pela busca (core.database.expandir_colunas_equipe)
+COLUNAS_VIAGENS_CAIXAS = ['MAPA', 'COD', 'COD_2'] + colunas_equipe(COLUNAS_EQUIPE, 'CODJ')
+
+# Entradas de processar_caixas_sincrono (fonte -> colunas lidas; None = todas)
+PLANO_CAIXAS = PlanoDados({"metas": None, "viagens": COLUNAS_VIAGENS_CAIXAS, "pessoas": None, "caixas": None})
+
+FAIXAS_ANTIGUIDADE = (
+    # (chave do limite em dias, limite padrão, chave do valor acima do limite)
+    ("meta_cx_dias_n3", 1825, "meta_cx_valor_n4"),
+    ("meta_cx_dias_n2", 730, "meta_cx_valor_n3"),
+    ("meta_cx_dias_n1", 365, "meta_cx_valor_n2"),
+)
+
 def _get_valor_por_caixa(dias_antiguidade: int, metas_colaborador: Dict[str, Any]) -> float:
     try:
         if dias_antiguidade > metas_colaborador.get("meta_cx_dias_n3", 1825):
@@ -22,123 +46,120 @@ def _get_valor_por_caixa(dias_antiguidade: int, metas_colaborador: Dict[str, Any
     except:
         return 0.0
 
-def processar_caixas_sincrono(df_viagens: pd.DataFrame, df_cadastro: pd.DataFrame, df_caixas: pd.DataFrame, metas: Dict[str, Any]):
-    metas_motorista = metas.get("motorista", {})
-    metas_ajudante = metas.get("ajudante", {})
+def _valores_por_caixa(dias: np.ndarray, metas_colaborador: Dict[str, Any]) -> List[Any]:
+    """_get_valor_por_caixa para vários colaboradores de uma vez (faixas por np.select)."""
+    limites = [metas_colaborador.get(chave, padrao) for chave, padrao, _ in FAIXAS_ANTIGUIDADE]
+    if not all(isinstance(limite, numbers.Real) for limite in limites):
+        # Metas com limites não numéricos: mantém o comportamento (e o except) da função escalar
+        return [_get_valor_por_caixa(d, metas_colaborador) for d in dias.tolist()]
+
+    valores = [metas_colaborador.get(chave, 0.0) for _, _, chave in FAIXAS_ANTIGUIDADE]
+    valores.append(metas_colaborador.get("meta_cx_valor_n1", 0.0))
+    faixas = np.select([dias > limite for limite in limites], range(len(limites)), default=len(limites))
+    return [valores[f] for f in faixas.tolist()]
+
+def _codigos_numericos(df: pd.DataFrame, colunas: List[str]) -> np.ndarray:
+    """Matriz viagens x colunas com os códigos como float (NaN onde não há código numérico)."""
+    return np.column_stack(
+        [pd.to_numeric(df[col], errors='coerce').to_numpy(dtype=float) for col in colunas]
+    ) if colunas else np.empty((len(df), 0))
+
+def _somar_caixas_por_codigo(codigos: np.ndarray, caixas: np.ndarray, validos: pd.Index) -> Tuple[List[int], List[float]]:
+    """
+    Soma as caixas de cada viagem para cada código (linhas = viagens, colunas = posições).
+    Percorre a matriz linha a linha, como o antigo laço por viagem: a ordem das somas e a ordem
+    de primeira aparição dos códigos são as mesmas (np.bincount acumula sequencialmente,
+    ao contrário do groupby().sum(), que compensa a soma).
+    """
+    cods = codigos.ravel()
+    pesos = np.repeat(caixas, codigos.shape[1])
+    com_codigo = ~np.isnan(cods) & (cods != 0)
+    cods, pesos = cods[com_codigo].astype(np.int64), pesos[com_codigo]
+
+    no_cadastro = np.isin(cods, validos.to_numpy(dtype=np.int64))
+    ids, unicos = pd.factorize(cods[no_cadastro], sort=False)
+    totais = np.bincount(ids, weights=pesos[no_cadastro], minlength=len(unicos))
+    return unicos.tolist(), totais.tolist()
+
+COLUNAS_RESULTADO_CAIXAS = [
+    "tipo", "cpf", "cod", "nome", "total_caixas", "valor_por_caixa", "total_premio", "antiguidade_dias"
+]
+
+def _tabela_resultado(tipo: str, codigos: List[int], totais: List[float], colaboradores: pd.DataFrame, metas_colaborador: Dict[str, Any]) -> pd.DataFrame:
+    info = colaboradores.loc[codigos] if codigos else colaboradores.iloc[:0]
+    dias = info["dias"].to_numpy(dtype=np.int64)
+    # Valor e prêmio em arrays de objetos: mantêm o tipo da meta (ex.: 1 e não 1.0)
+    valores = np.empty(len(codigos), dtype=object)
+    valores[:] = _valores_por_caixa(dias, metas_colaborador)
+    total_caixas = np.asarray(totais, dtype=float)
+    tabela = pd.DataFrame({
+        "tipo": np.full(len(codigos), tipo, dtype=object),
+        "cpf": info["cpf"].to_numpy(dtype=object),
+        "cod": np.asarray(codigos, dtype=np.int64),
+        "nome": info["nome"].to_numpy(dtype=object),
+        "total_caixas": total_caixas,
+        "valor_por_caixa": valores,
+        "total_premio": total_caixas.astype(object) * valores,
+        "antiguidade_dias": dias,
+    }, columns=COLUNAS_RESULTADO_CAIXAS)
+    return tabela.sort_values("nome", kind="stable", ignore_index=True)
+
+def calcular_caixas(contexto: ContextoCalculo) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Caixas entregues e prêmio por colaborador, como tabelas (motoristas, ajudantes) ordenadas
+    por nome. Cada viagem soma as caixas do seu MAPA para COD, COD_2 e cada CODJ_n presentes
+    no Cadastro; o valor por caixa sai da faixa de antiguidade.
+    """
+    df_viagens, pessoas, df_caixas = contexto.viagens, contexto.pessoas, contexto.caixas
+    metas_motorista = contexto.metas.get("motorista", {})
+    metas_ajudante = contexto.metas.get("ajudante", {})
     hoje = datetime.date.today()
-    
-    # 1. Mapeamento Motoristas
-    motorista_antiguidade_map = {}
-    motorista_info_map = {} 
-    if df_cadastro is not None:
-        df_motoristas = df_cadastro[pd.notna(df_cadastro['Codigo_M'])].drop_duplicates(subset=['Codigo_M']).copy()
-        df_motoristas['Codigo_M_int'] = pd.to_numeric(df_motoristas['Codigo_M'], errors='coerce').fillna(0).astype(int)
-        df_motoristas['Data_M_dt'] = pd.to_datetime(df_motoristas['Data_M'], errors='coerce').dt.date
-        for _, row in df_motoristas.iterrows():
-            cod = row['Codigo_M_int']
-            if cod == 0: continue
-            dias = (hoje - row['Data_M_dt']).days if pd.notna(row['Data_M_dt']) else 0
-            motorista_antiguidade_map[cod] = dias
-            motorista_info_map[cod] = {
-                "nome": str(row.get('Nome_M', '')).strip(), 
-                "cpf": str(row.get('CPF_M', '')).strip()
-            }
-
-    # 2. Mapeamento Ajudantes
-    ajudante_antiguidade_map = {}
-    ajudante_info_map = {}
-    if df_cadastro is not None:
-        df_ajudantes = df_cadastro[pd.notna(df_cadastro['Codigo_J'])].drop_duplicates(subset=['Codigo_J']).copy()
-        df_ajudantes['Codigo_J_int'] = pd.to_numeric(df_ajudantes['Codigo_J'], errors='coerce').fillna(0).astype(int)
-        df_ajudantes['Data_J_dt'] = pd.to_datetime(df_ajudantes['Data_J'], errors='coerce').dt.date
-        for _, row in df_ajudantes.iterrows():
-            cod = row['Codigo_J_int']
-            if cod == 0: continue
-            dias = (hoje - row['Data_J_dt']).days if pd.notna(row['Data_J_dt']) else 0
-            ajudante_antiguidade_map[cod] = dias
-            ajudante_info_map[cod] = {
-                "nome": str(row.get('Nome_J', '')).strip(), 
-                "cpf": str(row.get('CPF_J', '')).strip()
-            }
-
-    # 3. Mapeamento Volumes
+
+    # 1. Colaboradores por código (índice do Cadastro, dias de casa em 'hoje')
+    if pessoas is not None:
+        motoristas = pessoas.colaboradores("motorista", hoje)
+        ajudantes = pessoas.colaboradores("ajudante", hoje)
+    else:
+        motoristas = ajudantes = pd.DataFrame(columns=["nome", "cpf", "dias"])
+
+    if df_viagens is None or df_viagens.empty:
+        return pd.DataFrame(columns=COLUNAS_RESULTADO_CAIXAS), pd.DataFrame(columns=COLUNAS_RESULTADO_CAIXAS)
+
+    # 2. Caixas do MAPA de cada viagem (mesma chave str(MAPA) do Caixas); viagens sem volume não contam
     mapa_caixas_total = {}
     if df_caixas is not None and not df_caixas.empty:
-        df_caixas_limpo = df_caixas.drop_duplicates(subset=['mapa'])
-        mapa_caixas_total = df_caixas_limpo.set_index('mapa')['caixas'].to_dict()
-
-    # 4. Acumulação
-    motorista_caixas_acumuladas = {}
-    ajudante_caixas_acumuladas = {}
-    colunas_ajudantes = [col for col in df_viagens.columns if col.startswith('CODJ_')]
-
-    if df_viagens is not None:
-        for _, viagem in df_viagens.iterrows():
-            mapa_id = str(viagem.get('MAPA', ''))
-            caixas_do_mapa = float(mapa_caixas_total.get(mapa_id, 0))
-            if caixas_do_mapa == 0: continue
-            
-            # Motorista Principal
-            cod_motorista = int(viagem.get('COD', 0))
-            if cod_motorista in motorista_info_map:
-                motorista_caixas_acumuladas[cod_motorista] = motorista_caixas_acumuladas.get(cod_motorista, 0) + caixas_do_mapa
-            
-            # Motorista 2
-            cod_motorista_2 = pd.to_numeric(viagem.get('COD_2'), errors='coerce')
-            if pd.notna(cod_motorista_2):
-                cod_m2 = int(cod_motorista_2)
-                if cod_m2 in motorista_info_map:
-                    motorista_caixas_acumuladas[cod_m2] = motorista_caixas_acumuladas.get(cod_m2, 0) + caixas_do_mapa
-
-            # Ajudantes
-            for col in colunas_ajudantes:
-                cod_aj = pd.to_numeric(viagem.get(col), errors='coerce')
-                if cod_aj and pd.notna(cod_aj):
-                    aj_int = int(cod_aj)
-                    if aj_int in ajudante_info_map:
-                        ajudante_caixas_acumuladas[aj_int] = ajudante_caixas_acumuladas.get(aj_int, 0) + caixas_do_mapa
-
-    # 5. Resultados Motoristas
-    resultado_motoristas = []
-    for cod, total in motorista_caixas_acumuladas.items():
-        info = motorista_info_map.get(cod, {"cpf": "N/A", "nome": f"COD {cod}"})
-        dias = motorista_antiguidade_map.get(cod, 0)
-        valor = _get_valor_por_caixa(dias, metas_motorista)
-        resultado_motoristas.append({
-            "tipo": "Motorista",
-            "cpf": info["cpf"], 
-            "cod": cod, 
-            "nome": info["nome"],
-            "total_caixas": total, 
-            "valor_por_caixa": valor, 
-            "total_premio": total * valor,
-            "antiguidade_dias": dias
-        })
-
-    # 6. Resultados Ajudantes
-    resultado_ajudantes = []
-    for cod, total in ajudante_caixas_acumuladas.items():
-        info = ajudante_info_map.get(cod, {"cpf": "N/A", "nome": f"COD {cod}"})
-        dias = ajudante_antiguidade_map.get(cod, 0)
-        valor = _get_valor_por_caixa(dias, metas_ajudante)
-        resultado_ajudantes.append({
-            "tipo": "Ajudante",
-            "cpf": info["cpf"], 
-            "cod": cod, 
-            "nome": info["nome"],
-            "total_caixas": total, 
-            "valor_por_caixa": valor, 
-            "total_premio": total * valor,
-            "antiguidade_dias": dias
-        })
-
-    return sorted(resultado_motoristas, key=lambda x: x['nome']), sorted(resultado_ajudantes, key=lambda x: x['nome'])
+        mapa_caixas_total = df_caixas.drop_duplicates(subset=['mapa']).set_index('mapa')['caixas'].to_dict()
+    mapas = df_viagens['MAPA'].map(str) if 'MAPA' in df_viagens.columns else pd.Series('', index=df_viagens.index)
+    caixas = mapas.map(mapa_caixas_total).fillna(0).to_numpy(dtype=float)
+    com_caixas = caixas != 0
+    viagens, caixas = df_viagens[com_caixas], caixas[com_caixas]
+
+    # 3. Acumulação: COD e COD_2 (motoristas), CODJ_n (ajudantes), viagem a viagem
+    cod_principal = viagens['COD'].to_numpy(dtype=float) if 'COD' in viagens.columns else np.zeros(len(viagens))
+    cods_motoristas = np.column_stack([cod_principal, _codigos_numericos(viagens, [c for c in ['COD_2'] if c in viagens.columns])])
+    cods_ajudantes = _codigos_numericos(viagens, [col for col in viagens.columns if col.startswith('CODJ_')])
+
+    cods_m, totais_m = _somar_caixas_por_codigo(cods_motoristas, caixas, motoristas.index)
+    cods_a, totais_a = _somar_caixas_por_codigo(cods_ajudantes, caixas, ajudantes.index)
+
+    # 4. Resultados
+    return (
+        _tabela_resultado("Motorista", cods_m, totais_m, motoristas, metas_motorista),
+        _tabela_resultado("Ajudante", cods_a, totais_a, ajudantes, metas_ajudante),
+    )
+
+def processar_caixas_sincrono(contexto: ContextoCalculo):
+    """calcular_caixas como listas de dicts (resposta JSON)."""
+    motoristas, ajudantes = calcular_caixas(contexto)
+    return registros(motoristas), registros(ajudantes)
 
 @router.get("/")
 async def ler_relatorio_caixas(
     request: Request, 
     data_inicio: str = Query(..., pattern=r"^\d{4}-\d{2}-\d{2}$", description="Data no formato YYYY-MM-DD"),
     data_fim: str = Query(..., pattern=r"^\d{4}-\d{2}-\d{2}$", description="Data no formato YYYY-MM-DD"),
+    formato: Optional[str] = Query(None, alias="format", pattern=PADRAO_FORMATO, description="csv, parquet ou arrow (padrão: JSON)"),
+    layout: str = Query("records", pattern=PADRAO_LAYOUT, description="JSON por linha (records) ou por coluna (columnar)"),
     current_user: dict = Depends(get_current_user),
     supabase: Client = Depends(get_supabase)
 ):
@@ -146,30 +167,48 @@ async def ler_relatorio_caixas(
     # Usamos diretamente as datas enviadas pelo filtro
     d_ini_str, d_fim_str = data_inicio, data_fim
 
-    metas = await run_in_threadpool(_get_metas_sincrono, supabase)
-    # Busca dados usando o filtro real
-    df_viagens, err1 = await run_in_threadpool(get_dados_apurados, supabase, d_ini_str, d_fim_str, "")
-    df_cadastro, err2 = await run_in_threadpool(get_cadastro_sincrono, supabase)
-    df_caixas, err3 = await run_in_threadpool(get_caixas_sincrono, supabase, d_ini_str, d_fim_str)
-    
-    error = err1 or err2 or err3
+    etag = None
+    if not formato:
+        # Escopo da ETag: 'admin' ou o usuário (o escopo de dados vem de escopo_da_requisicao)
+        escopo_etag = "admin" if current_user["role"] == "admin" else current_user["username"]
+        etag = ControleEtag(request, "caixas", PLANO_CAIXAS, d_ini_str, d_fim_str, escopo_etag, layout=layout)
+        resposta = etag.resposta_antecipada()
+        if resposta is not None:
+            return resposta
+
+    # Busca dados usando o filtro real (fontes em paralelo)
+    # Não-admin: só as viagens que entram nos números do colaborador (core.scope)
+    escopo = await escopo_da_requisicao(supabase, current_user)
+    dados = await carregar_plano(supabase, d_ini_str, d_fim_str, PLANO_CAIXAS, escopo=escopo)
+    error = dados["error_message"]
+    if etag is not None:
+        etag.fixar_versao()
+    if error and formato:
+        raise HTTPException(status_code=400, detail=error)
     
-    motoristas, ajudantes = [], []
+    motoristas = ajudantes = pd.DataFrame(columns=COLUNAS_RESULTADO_CAIXAS)
     if not error:
-        if df_viagens is not None and not df_viagens.empty and 'MAPA' in df_viagens.columns:
-            df_viagens = df_viagens.drop_duplicates(subset=['MAPA'])
-
-        motoristas, ajudantes = await run_in_threadpool(
-            processar_caixas_sincrono, df_viagens, df_cadastro, df_caixas, metas
-        )
+        motoristas, ajudantes = await run_in_threadpool(calcular_caixas, ContextoCalculo.de_fontes(dados))
 
     if current_user["role"] != "admin":
-        user_cpf = current_user["username"].replace(".", "").replace("-", "")
-        motoristas = [m for m in motoristas if str(m['cpf']).replace(".", "").replace("-", "") == user_cpf]
-        ajudantes = [a for a in ajudantes if str(a['cpf']).replace(".", "").replace("-", "") == user_cpf]
+        # Códigos do CPF pelo índice do Cadastro (mesmo CPF que o relatório exibe)
+        motoristas, ajudantes = filtrar_por_cpf(motoristas, ajudantes, current_user["username"], dados["indice_pessoas"])
+
+    if formato:
+        tabela = juntar_por_tipo({"Motorista": motoristas, "Ajudante": ajudantes})
+        return await run_in_threadpool(resposta_tabela, tabela, formato, f"Caixas_{d_ini_str}_{d_fim_str}")
 
-    return {
+    # DataFrames serializados direto das colunas (core.serialization)
+    return etag.responder({
         "motoristas": motoristas,
         "ajudantes": ajudantes,
         "error": error
-    }
\ No newline at end of file
+    }, guardar=not error)
+
+async def aquecer(supabase: Client, data_inicio: str, data_fim: str) -> Optional[str]:
+    """Aquecimento (core.scheduler): calcula e guarda a resposta de admin do período."""
+    resposta = await ler_relatorio_caixas(
+        pedido_interno(), data_inicio, data_fim, formato=None, layout="records",
+        current_user=USUARIO_AGENDADOR, supabase=supabase
+    )
+    return erro_da_resposta(resposta)
@@ -1,134 +1,182 @@
 import datetime
+import operator
+import numpy as np
 import pandas as pd
-from fastapi import APIRouter, Request, Depends
-from typing import Optional, Dict, Any
+from fastapi import APIRouter, Request, Depends, HTTPException, Query
+from typing import Optional, Dict, Any, Tuple
 from fastapi.concurrency import run_in_threadpool
 from supabase import Client
-from core.database import get_dados_apurados, get_cadastro_sincrono, get_indicadores_sincrono, get_caixas_sincrono, get_supabase
-from core.analysis import gerar_dashboard_e_mapas
-from .metas import _get_metas_sincrono
+from core.database import get_supabase, unir_colunas
+from core.analysis import COLUNAS_XADREZ
+from core.context import ContextoCalculo
+from core.etag import ControleEtag
+from core.serialization import PADRAO_LAYOUT
+from core.export import PADRAO_FORMATO, juntar_por_tipo, registros, resposta_tabela
+from core.indexes import filtrar_por_cpf
+from core.scope import escopo_da_requisicao
+from core.scheduler import USUARIO_AGENDADOR, erro_da_resposta, pedido_interno
+from core.loader import PlanoDados, carregar_plano
 from core.security import get_current_user
 
 router = APIRouter(prefix="/incentivo", tags=["Incentivo"])
 
-# --- FUNÇÃO DE PROCESSAMENTO (Mantida igual, apenas colapsada para brevidade) ---
-def processar_incentivos_sincrono(df_viagens, df_cadastro, df_indicadores, df_caixas, metas):
-    # ... (Mantenha o código original desta função processar_incentivos_sincrono aqui) ...
-    # Se precisar do código completo desta função novamente, me avise, mas ele não muda.
-    # Vou replicar a lógica principal abaixo para garantir que funcione:
-    
-    incentivo_motoristas = []
-    incentivo_ajudantes = []
-    metas_motorista = metas.get("motorista", {})
-    metas_ajudante = metas.get("ajudante", {})
-    premio_motorista_map = {}
-    default_premio_info = {"dev_pdv_val": "N/A", "dev_pdv_passou": False, "rating_val": "N/A", "rating_passou": False, "refugo_val": "N/A", "refugo_passou": False}
-    
-    cpf_motorista_map = {}
-    cpf_ajudante_map = {}
-    indicadores_map = {}
-
-    if df_cadastro is not None and not df_cadastro.empty:
-        df_m = df_cadastro[pd.notna(df_cadastro['Codigo_M'])].drop_duplicates(subset=['Codigo_M'])
-        df_m['Codigo_M_int'] = pd.to_numeric(df_m['Codigo_M'], errors='coerce').fillna(0).astype(int)
-        cpf_motorista_map = df_m.set_index('Codigo_M_int')['CPF_M'].to_dict()
-
-        df_j = df_cadastro[pd.notna(df_cadastro['Codigo_J'])].drop_duplicates(subset=['Codigo_J'])
-        df_j['Codigo_J_int'] = pd.to_numeric(df_j['Codigo_J'], errors='coerce').fillna(0).astype(int)
-        cpf_ajudante_map = df_j.set_index('Codigo_J_int')['CPF_J'].to_dict()
-
-    if df_indicadores is not None and not df_indicadores.empty:
-        # Garante numérico
-        for col in ['dev_pdv', 'Rating_tx', 'refugo']:
-            if col in df_indicadores.columns:
-                df_indicadores[col] = pd.to_numeric(df_indicadores[col], errors='coerce')
-        indicadores_map = df_indicadores.set_index('Codigo_M').to_dict('index')
-
-    if df_viagens is not None and not df_viagens.empty:
-        # Motoristas
-        motoristas_un = df_viagens[['COD', 'MOTORISTA']].drop_duplicates(subset=['COD'])
-        for _, row in motoristas_un.iterrows():
-            cod = int(row['COD'])
-            ind = indicadores_map.get(cod, {})
-            
-            # Valores (multiplica por 100 se necessário, ajuste conforme seu dado no banco)
-            # Se no banco já está 0.11 (11%), multiplicar por 100 é correto.
-            dev = ind.get('dev_pdv')
-            dev = dev * 100 if pd.notna(dev) else None
-            
-            rat = ind.get('Rating_tx')
-            rat = rat * 100 if pd.notna(rat) else None
-            
-            ref = ind.get('refugo')
-            ref = ref * 100 if pd.notna(ref) else None
-
-            # Metas
-            pass_dev = (dev is not None and dev <= metas_motorista.get("dev_pdv_meta_perc", 0))
-            pass_rat = (rat is not None and rat >= metas_motorista.get("rating_meta_perc", 0))
-            pass_ref = (ref is not None and ref <= metas_motorista.get("refugo_meta_perc", 0))
-
-            premio_dev = metas_motorista.get("dev_pdv_premio", 0) if pass_dev else 0.0
-            premio_rat = metas_motorista.get("rating_premio", 0) if pass_rat else 0.0
-            premio_ref = metas_motorista.get("refugo_premio", 0) if pass_ref else 0.0
-
-            info = {
-                "dev_pdv_val": f"{dev:.2f}%" if dev is not None else "N/A", "dev_pdv_passou": pass_dev,
-                "rating_val": f"{rat:.2f}%" if rat is not None else "N/A", "rating_passou": pass_rat,
-                "refugo_val": f"{ref:.2f}%" if ref is not None else "N/A", "refugo_passou": pass_ref
-            }
-            premio_motorista_map[cod] = info
-
-            incentivo_motoristas.append({
-                "cpf": cpf_motorista_map.get(cod, ""),
-                "cod": cod,
-                "nome": str(row['MOTORISTA']).strip(),
-                "dev_pdv_val": info["dev_pdv_val"], "dev_pdv_premio_val": premio_dev,
-                "rating_val": info["rating_val"], "rating_premio_val": premio_rat,
-                "refugo_val": info["refugo_val"], "refugo_premio_val": premio_ref,
-                "total_premio": premio_dev + premio_rat + premio_ref
-            })
-
-        # Ajudantes (Herança)
-        res_xadrez = gerar_dashboard_e_mapas(df_viagens)
-        motorista_fixo_map = res_xadrez["mapas"].get("motorista_fixo_map", {})
-        df_melted = res_xadrez["df_melted"]
-        
-        # --- CORREÇÃO: Filtrar apenas ajudantes visíveis no Xadrez ---
-        ids_visiveis = set(res_xadrez.get("ids_visiveis", []))
-
-        if not df_melted.empty:
-            ajudantes_unicos = df_melted.drop_duplicates(subset=['AJUDANTE_COD'])
-            for _, aj in ajudantes_unicos.iterrows():
-                cod_aj = aj['AJUDANTE_COD']
-                
-                # Se não estiver na lista de visíveis (Fixo ou Visitante Qualificado), pula
-                if cod_aj not in ids_visiveis:
-                    continue
-
-                cod_mot_pai = motorista_fixo_map.get(cod_aj)
-                dados_pai = premio_motorista_map.get(cod_mot_pai, default_premio_info) if cod_mot_pai else default_premio_info
-                
-                p_dev = metas_ajudante.get("dev_pdv_premio", 0) if dados_pai["dev_pdv_passou"] else 0.0
-                p_rat = metas_ajudante.get("rating_premio", 0) if dados_pai["rating_passou"] else 0.0
-                p_ref = metas_ajudante.get("refugo_premio", 0) if dados_pai["refugo_passou"] else 0.0
-                
-                incentivo_ajudantes.append({
-                    "cpf": cpf_ajudante_map.get(cod_aj, ""),
-                    "cod": cod_aj,
-                    "nome": aj['AJUDANTE_NOME'],
-                    "dev_pdv_val": dados_pai["dev_pdv_val"], "dev_pdv_premio_val": p_dev,
-                    "rating_val": dados_pai["rating_val"], "rating_premio_val": p_rat,
-                    "refugo_val": dados_pai["refugo_val"], "refugo_premio_val": p_ref,
-                    "total_premio": p_dev + p_rat + p_ref
-                })
-
-    return sorted(incentivo_motoristas, key=lambda x: x['nome']), sorted(incentivo_ajudantes, key=lambda x: x['nome'])
+# Colunas da Distribuição lidas por processar_incentivos_sincrono (inclui o xadrez, para a herança)
+COLUNAS_VIAGENS_INCENTIVO = unir_colunas(['COD', 'MOTORISTA'], COLUNAS_XADREZ)
+
+# KPIs do incentivo: (prefixo na resposta, coluna em Resultados_Indicadores, chave da meta, chave do prêmio, passa se)
+KPIS_INCENTIVO = (
+    ("dev_pdv", "dev_pdv", "dev_pdv_meta_perc", "dev_pdv_premio", operator.le),
+    ("rating", "Rating_tx", "rating_meta_perc", "rating_premio", operator.ge),
+    ("refugo", "refugo", "refugo_meta_perc", "refugo_premio", operator.le),
+)
+
+# Entradas de processar_incentivos_sincrono (fonte -> colunas lidas; None = todas). Não usa Caixas.
+COLUNAS_INDICADORES_INCENTIVO = ['Codigo_M'] + [col for _, col, _, _, _ in KPIS_INCENTIVO]
+PLANO_INCENTIVO = PlanoDados({
+    "metas": None,
+    "viagens": COLUNAS_VIAGENS_INCENTIVO,
+    "pessoas": None,
+    "indicadores": COLUNAS_INDICADORES_INCENTIVO,
+})
+
+def _indicadores_por_motorista(df_indicadores: Optional[pd.DataFrame], codigos: pd.Index) -> pd.DataFrame:
+    """
+    Valores dos KPIs em % (x100) alinhados aos códigos de motorista; NaN sem indicador.
+    Com mais de uma linha para o mesmo Codigo_M vale a última.
+    """
+    colunas = [col for _, col, _, _, _ in KPIS_INCENTIVO]
+    if df_indicadores is None or df_indicadores.empty or 'Codigo_M' not in df_indicadores.columns:
+        return pd.DataFrame(np.nan, index=codigos, columns=colunas)
+
+    indicadores = df_indicadores.drop_duplicates(subset=['Codigo_M'], keep='last').set_index('Codigo_M')
+    percentuais = pd.DataFrame({
+        col: pd.to_numeric(indicadores[col], errors='coerce') * 100 if col in indicadores.columns else np.nan
+        for col in colunas
+    }, index=indicadores.index)
+    return percentuais.reindex(codigos)
+
+def _avaliar_kpis(percentuais: pd.DataFrame, metas_motorista: Dict[str, Any]) -> pd.DataFrame:
+    """
+    Texto, aprovação e prêmio de cada KPI por motorista, coluna a coluna.
+    Os prêmios ficam em arrays de objetos para manter o tipo da meta (ex.: 100 e não 100.0).
+    """
+    avaliacao = {}
+    total = None
+    for prefixo, col, chave_meta, chave_premio, passa in KPIS_INCENTIVO:
+        valores = percentuais[col]
+        tem_valor = valores.notna().to_numpy()
+        passou = tem_valor & passa(valores.to_numpy(), metas_motorista.get(chave_meta, 0))
+        premio = np.full(len(valores), 0.0, dtype=object)
+        premio[passou] = metas_motorista.get(chave_premio, 0)
+
+        avaliacao[f"{prefixo}_val"] = np.where(tem_valor, valores.map("{:.2f}%".format, na_action='ignore'), "N/A")
+        avaliacao[f"{prefixo}_passou"] = passou
+        avaliacao[f"{prefixo}_premio_val"] = premio
+        total = premio if total is None else total + premio
+    avaliacao["total_premio"] = total
+    return pd.DataFrame(avaliacao, index=percentuais.index)
+
+def _premios_herdados(avaliacao_pai: pd.DataFrame, metas_ajudante: Dict[str, Any]) -> pd.DataFrame:
+    """Prêmios do ajudante a partir das aprovações do motorista fixo (False quando não há pai)."""
+    premios = {}
+    total = None
+    for prefixo, _, _, chave_premio, _ in KPIS_INCENTIVO:
+        passou = avaliacao_pai[f"{prefixo}_passou"].to_numpy(dtype=bool)
+        premio = np.full(len(passou), 0.0, dtype=object)
+        premio[passou] = metas_ajudante.get(chave_premio, 0)
+        premios[f"{prefixo}_premio_val"] = premio
+        total = premio if total is None else total + premio
+    premios["total_premio"] = total
+    return pd.DataFrame(premios, index=avaliacao_pai.index)
+
+COLUNAS_RESPOSTA = [
+    "cpf", "cod", "nome",
+    "dev_pdv_val", "dev_pdv_premio_val",
+    "rating_val", "rating_premio_val",
+    "refugo_val", "refugo_premio_val",
+    "total_premio",
+]
+
+def _ordenar_por_nome(df: pd.DataFrame) -> pd.DataFrame:
+    return df[COLUNAS_RESPOSTA].sort_values("nome", kind="stable", ignore_index=True)
+
+def calcular_incentivos(contexto: ContextoCalculo) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Prêmios de KPI (dev. PDV, rating, refugo) por motorista, avaliados como colunas sobre os
+    indicadores alinhados aos motoristas do período. Cada ajudante visível no xadrez herda as
+    aprovações do seu motorista fixo (motorista_fixo_map), com os prêmios da meta de ajudante.
+    O xadrez vem do contexto (calculado uma vez por requisição). Devolve as tabelas
+    (motoristas, ajudantes) ordenadas por nome.
+    """
+    df_viagens, pessoas, df_indicadores = contexto.viagens, contexto.pessoas, contexto.indicadores
+    metas_motorista = contexto.metas.get("motorista", {})
+    metas_ajudante = contexto.metas.get("ajudante", {})
+
+    # CPFs por código vindos do índice do Cadastro (montado uma vez por versão)
+    cpf_motorista_map = pessoas.cpfs("motorista") if pessoas is not None else {}
+    cpf_ajudante_map = pessoas.cpfs("ajudante") if pessoas is not None else {}
+
+    vazia = pd.DataFrame(columns=COLUNAS_RESPOSTA)
+    if df_viagens is None or df_viagens.empty:
+        return vazia, vazia.copy()
+
+    # Motoristas
+    motoristas = df_viagens[['COD', 'MOTORISTA']].drop_duplicates(subset=['COD'])
+    codigos = pd.Index(motoristas['COD'].astype(int).to_numpy(), name='cod')
+
+    # Valores (multiplica por 100: no banco 0.11 significa 11%)
+    avaliacao = _avaliar_kpis(_indicadores_por_motorista(df_indicadores, codigos), metas_motorista)
+    df_motoristas = avaliacao.assign(
+        cpf=codigos.map(lambda cod: cpf_motorista_map.get(cod, "")),
+        cod=codigos,
+        nome=motoristas['MOTORISTA'].astype(str).str.strip().to_numpy(),
+    )
+
+    # Ajudantes (Herança)
+    res_xadrez = contexto.xadrez
+    motorista_fixo_map = res_xadrez["mapas"].get("motorista_fixo_map", {})
+    df_melted = res_xadrez["df_melted"]
+
+    # --- CORREÇÃO: Filtrar apenas ajudantes visíveis no Xadrez ---
+    ids_visiveis = set(res_xadrez.get("ids_visiveis", []))
+
+    df_ajudantes = vazia
+    if not df_melted.empty:
+        ajudantes = df_melted.drop_duplicates(subset=['AJUDANTE_COD'])
+        ajudantes = ajudantes[ajudantes['AJUDANTE_COD'].isin(ids_visiveis)]
+
+        # Junção com a avaliação do motorista fixo; sem pai (ou pai 0) os KPIs ficam "N/A"/reprovados
+        pais = ajudantes['AJUDANTE_COD'].map(motorista_fixo_map)
+        pais = pais.where(pais.notna() & (pais != 0))
+        avaliacao_unica = avaliacao[~avaliacao.index.duplicated(keep='last')]
+        avaliacao_pai = avaliacao_unica.reindex(pais.to_numpy())
+        sem_pai = avaliacao_unica.index.get_indexer(pais.to_numpy()) < 0
+        for prefixo, _, _, _, _ in KPIS_INCENTIVO:
+            avaliacao_pai.loc[sem_pai, f"{prefixo}_val"] = "N/A"
+            avaliacao_pai.loc[sem_pai, f"{prefixo}_passou"] = False
+
+        cods_ajudante = ajudantes['AJUDANTE_COD'].to_numpy()
+        df_ajudantes = _premios_herdados(avaliacao_pai, metas_ajudante).assign(
+            **{f"{prefixo}_val": avaliacao_pai[f"{prefixo}_val"].to_numpy() for prefixo, _, _, _, _ in KPIS_INCENTIVO},
+            cpf=[cpf_ajudante_map.get(cod, "") for cod in cods_ajudante.tolist()],
+            cod=cods_ajudante,
+            nome=ajudantes['AJUDANTE_NOME'].to_numpy(),
+        )
+
+    return _ordenar_por_nome(df_motoristas), _ordenar_por_nome(df_ajudantes)
+
+def processar_incentivos_sincrono(contexto: ContextoCalculo):
+    """calcular_incentivos como listas de dicts (resposta JSON)."""
+    motoristas, ajudantes = calcular_incentivos(contexto)
+    return registros(motoristas), registros(ajudantes)
 
 @router.get("/")
 async def ler_relatorio_incentivo(
     request: Request, 
     data_inicio: str,
     data_fim: str,
+    formato: Optional[str] = Query(None, alias="format", pattern=PADRAO_FORMATO, description="csv, parquet ou arrow (padrão: JSON)"),
+    layout: str = Query("records", pattern=PADRAO_LAYOUT, description="JSON por linha (records) ou por coluna (columnar)"),
     current_user: dict = Depends(get_current_user),
     supabase: Client = Depends(get_supabase)
 ):
@@ -136,37 +184,49 @@ async def ler_relatorio_incentivo(
     # O filtro no banco agora usa .lte e .gte para achar sobreposição de períodos.
     d_ini_str, d_fim_str = data_inicio, data_fim
 
-    metas = await run_in_threadpool(_get_metas_sincrono, supabase)
-    # Busca Viagens (Xadrez)
-    df_viagens, err1 = await run_in_threadpool(get_dados_apurados, supabase, d_ini_str, d_fim_str, "")
-    # Busca Cadastro
-    df_cadastro, err2 = await run_in_threadpool(get_cadastro_sincrono, supabase)
-    # Busca Indicadores (KPIs) - Agora com busca flexível
-    df_indicadores, err3 = await run_in_threadpool(get_indicadores_sincrono, supabase, d_ini_str, d_fim_str)
-    # Busca Caixas (para completar contexto se necessário, mas aqui é só incentivo)
-    df_caixas, err4 = await run_in_threadpool(get_caixas_sincrono, supabase, d_ini_str, d_fim_str)
-    
-    error = err1 or err2 or err3 or err4
+    etag = None
+    if not formato:
+        # Escopo da ETag: 'admin' ou o usuário (o escopo de dados vem de escopo_da_requisicao)
+        escopo_etag = "admin" if current_user["role"] == "admin" else current_user["username"]
+        etag = ControleEtag(request, "incentivo", PLANO_INCENTIVO, d_ini_str, d_fim_str, escopo_etag, layout=layout)
+        resposta = etag.resposta_antecipada()
+        if resposta is not None:
+            return resposta
+
+    # Busca Metas, Viagens (Xadrez), índice do Cadastro e Indicadores (KPIs) em paralelo
+    # Não-admin: só as viagens que entram nos números do colaborador (core.scope)
+    escopo = await escopo_da_requisicao(supabase, current_user)
+    dados = await carregar_plano(supabase, d_ini_str, d_fim_str, PLANO_INCENTIVO, escopo=escopo)
+    error = dados["error_message"]
+    if etag is not None:
+        etag.fixar_versao()
+    if error and formato:
+        raise HTTPException(status_code=400, detail=error)
     
-    motoristas, ajudantes = [], []
-    if not error and df_viagens is not None:
-        if 'MAPA' in df_viagens.columns: 
-            df_viagens_dedup = df_viagens.drop_duplicates(subset=['MAPA'])
-        else:
-            df_viagens_dedup = df_viagens.drop_duplicates()
-
-        motoristas, ajudantes = await run_in_threadpool(
-            processar_incentivos_sincrono, df_viagens_dedup, df_cadastro, df_indicadores, df_caixas, metas
-        )
+    motoristas = ajudantes = pd.DataFrame(columns=COLUNAS_RESPOSTA)
+    if not error and dados["df_viagens_dedup"] is not None:
+        motoristas, ajudantes = await run_in_threadpool(calcular_incentivos, ContextoCalculo.de_fontes(dados))
 
     # Filtro de Segurança
     if current_user["role"] != "admin":
-        cpf_user = current_user["username"].replace(".", "").replace("-", "")
-        motoristas = [m for m in motoristas if str(m.get("cpf", "")).replace(".", "").replace("-", "") == cpf_user]
-        ajudantes = [a for a in ajudantes if str(a.get("cpf", "")).replace(".", "").replace("-", "") == cpf_user]
+        # Códigos do CPF pelo índice do Cadastro (mesmo CPF que o relatório exibe)
+        motoristas, ajudantes = filtrar_por_cpf(motoristas, ajudantes, current_user["username"], dados["indice_pessoas"])
+
+    if formato:
+        tabela = juntar_por_tipo({"Motorista": motoristas, "Ajudante": ajudantes})
+        return await run_in_threadpool(resposta_tabela, tabela, formato, f"Incentivo_{d_ini_str}_{d_fim_str}")
 
-    return {
+    # DataFrames serializados direto das colunas (core.serialization)
+    return etag.responder({
         "motoristas": motoristas,
         "ajudantes": ajudantes,
         "error": error
-    }
\ No newline at end of file
+    }, guardar=not error)
+
+async def aquecer(supabase: Client, data_inicio: str, data_fim: str) -> Optional[str]:
+    """Aquecimento (core.scheduler): calcula e guarda a resposta de admin do período."""
+    resposta = await ler_relatorio_incentivo(
+        pedido_interno(), data_inicio, data_fim, formato=None, layout="records",
+        current_user=USUARIO_AGENDADOR, supabase=supabase
+    )
+    return erro_da_resposta(resposta)
@@ -2,60 +2,16 @@ from fastapi import APIRouter, Request, Depends, Body, HTTPException, status
 from core.security import get_current_user
 from fastapi.concurrency import run_in_threadpool
 from supabase import Client
+from core.database import METAS_PADRAO, get_metas_sincrono, invalidar_metas
 import traceback
 
 router = APIRouter(prefix="/metas", tags=["Metas"])
 
 # --- DEFINIÇÃO DOS VALORES PADRÃO ---
-DEFAULTS = {
-    "dev_pdv_meta_perc": 0.0, 
-    "dev_pdv_premio": 0.0,
-    "rating_meta_perc": 0.0, 
-    "rating_premio": 0.0,
-    "refugo_meta_perc": 0.0, 
-    "refugo_premio": 0.0,
-    "meta_cx_dias_n1": 365, 
-    "meta_cx_valor_n1": 0.0,
-    "meta_cx_dias_n2": 730, 
-    "meta_cx_valor_n2": 0.0,
-    "meta_cx_dias_n3": 1825, 
-    "meta_cx_valor_n3": 0.0, 
-    "meta_cx_valor_n4": 0.0
-}
-
-def _get_metas_sincrono(supabase: Client) -> dict:
-    """
-    Busca as metas no Supabase (Tabela 'Metas').
-    Adapta a leitura para a estrutura baseada em linhas (tipo_colaborador).
-    """
-    # Estrutura inicial de resposta
-    result = {
-        "motorista": DEFAULTS.copy(),
-        "ajudante": DEFAULTS.copy()
-    }
-
-    try:
-        # Busca todas as linhas da tabela
-        response = supabase.table("Metas").select("*").execute()
-        
-        if response.data:
-            for row in response.data:
-                tipo = row.get("tipo_colaborador")
-                # Se o tipo for válido (motorista ou ajudante), preenche os dados
-                if tipo in result:
-                    for key in result[tipo].keys():
-                        # Se o valor existir no banco, atualiza. Senão, mantém o padrão.
-                        if key in row and row[key] is not None:
-                            try:
-                                result[tipo][key] = float(row[key])
-                            except:
-                                result[tipo][key] = row[key]
-        
-        return result
-
-    except Exception as e:
-        print(f"Erro ao buscar metas (usando padrão): {e}")
-        return result
+# A leitura das metas vive em core.database para ser partilhada pelo carregador
+# concorrente (core.loader); os nomes abaixo mantêm compatibilidade com os routers.
+DEFAULTS = METAS_PADRAO
+_get_metas_sincrono = get_metas_sincrono
 
 # --- ROTAS ---
 
@@ -97,6 +53,9 @@ async def update_metas_json(
             supabase.table("Metas").upsert(record_to_save).execute()
             
     except Exception as e:
+        # Mesmo numa gravação parcial as metas em cache já não são confiáveis.
+        invalidar_metas()
+
         print(f"\n--- ERRO CRÍTICO AO SALVAR METAS ---\n")
         print(traceback.format_exc())
         print(f"\n--- FIM DO ERRO ---\n")
@@ -106,4 +65,6 @@ async def update_metas_json(
         
         raise HTTPException(status_code=500, detail=f"Erro ao salvar metas: {str(e)}")
     
+    # Write-through: a próxima leitura já vê as metas novas, sem precisar de /refresh.
+    invalidar_metas()
     return {"message": "Metas atualizadas com sucesso"}
\ No newline at end of file
@@ -1,156 +1,215 @@
 import datetime
+import numpy as np
 import pandas as pd
-import io
 import traceback
-from fastapi import APIRouter, Request, Depends, HTTPException, status
+from fastapi import APIRouter, Request, Depends, HTTPException, Query, status
 from fastapi.responses import StreamingResponse
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Tuple
 from fastapi.concurrency import run_in_threadpool
 from supabase import Client
 from jose import jwt, JWTError 
 
 # Importações internas
 from core.security import get_current_user, SECRET_KEY, ALGORITHM
-from core.database import get_dados_apurados, get_cadastro_sincrono, get_caixas_sincrono, get_indicadores_sincrono
-from .incentivo import processar_incentivos_sincrono
-from .caixas import processar_caixas_sincrono
-from .metas import _get_metas_sincrono
+from core.loader import PlanoDados, carregar_plano
+from core.context import ContextoCalculo
+from core.etag import ControleEtag, versoes_plano
+from core.serialization import PADRAO_LAYOUT
+from core.export import xlsx_em_blocos, MEDIA_TYPE_XLSX, juntar_por_tipo, resposta_tabela
+from core.indexes import filtrar_por_cpf
+from core.scope import EscopoColaborador, escopo_da_requisicao
+from core.database import get_indice_pessoas, renovar_periodo
+from core.snapshots import periodo_fechado, impressao_entradas, repositorio_snapshots
+from core.singleflight import execucoes
+from .incentivo import calcular_incentivos, PLANO_INCENTIVO
+from .caixas import calcular_caixas, PLANO_CAIXAS
 
 router = APIRouter(tags=["Pagamento"])
 
+# O pagamento corre os dois motores: busca a união das suas entradas
+PLANO_PAGAMENTO = PlanoDados.unir(PLANO_INCENTIVO, PLANO_CAIXAS)
+
 def get_supabase(request: Request) -> Client:
     return request.state.supabase
 
-async def _get_dados_completos(data_inicio: str, data_fim: str, supabase: Client) -> Dict[str, Any]:
+async def _get_dados_completos(
+    data_inicio: str, data_fim: str, supabase: Client, escopo: Optional[EscopoColaborador] = None
+) -> Dict[str, Any]:
     # --- CORREÇÃO: FILTRO ÚNICO GLOBAL ---
     # O sistema agora respeita estritamente o filtro do usuário.
     # Não há mais cálculo automático de ciclo.
-    d_ini_real, d_fim_real = data_inicio, data_fim
-    d_ini_kpi, d_fim_kpi = data_inicio, data_fim
-
-    # Buscar Metas
-    metas = await run_in_threadpool(_get_metas_sincrono, supabase)
-    
-    # 1. Viagens (Usa Filtro REAL)
-    df_viagens, err1 = await run_in_threadpool(get_dados_apurados, supabase, d_ini_real, d_fim_real, "")
-    
-    # 2. Cadastro
-    df_cadastro, err2 = await run_in_threadpool(get_cadastro_sincrono, supabase)
-    
-    # 3. Indicadores (Usa data de CICLO, pois a tabela exige match exato do período)
-    df_indicadores, err3 = await run_in_threadpool(get_indicadores_sincrono, supabase, d_ini_kpi, d_fim_kpi)
-    
-    # 4. Caixas (Usa Filtro REAL)
-    df_caixas, err4 = await run_in_threadpool(get_caixas_sincrono, supabase, d_ini_real, d_fim_real)
-    
-    # --- DEDUPLICAÇÃO DE MAPAS ---
-    df_viagens_dedup = None
-    if df_viagens is not None:
-        if 'MAPA' in df_viagens.columns: 
-            df_viagens_dedup = df_viagens.drop_duplicates(subset=['MAPA'])
-        else: 
-            df_viagens_dedup = df_viagens.drop_duplicates()
+    # As fontes do plano são independentes e são buscadas em paralelo (core.loader).
+    return await carregar_plano(supabase, data_inicio, data_fim, PLANO_PAGAMENTO, escopo=escopo)
 
-    return {
-        "metas": metas,
-        "df_viagens_bruto": df_viagens,
-        "df_viagens_dedup": df_viagens_dedup,
-        "df_cadastro": df_cadastro,
-        "df_indicadores": df_indicadores,
-        "df_caixas": df_caixas,
-        "error_message": err1 or err2 or err3 or err4
-    }
+COLUNAS_RESULTADO = ['cod', 'premio_kpi', 'premio_caixas', 'total_a_pagar', 'nome', 'cpf']
 
-def _merge_resultados(m_kpi, a_kpi, m_cx, a_cx):
-    cols_kpi = ['cod', 'nome', 'cpf', 'total_premio']
-    cols_cx = ['cod', 'nome', 'cpf', 'total_premio']
-
-    # Converte para DataFrame e renomeia coluna de valor para evitar colisão
-    df_m_kpi = pd.DataFrame(m_kpi).reindex(columns=cols_kpi).rename(columns={"total_premio": "premio_kpi"}) if m_kpi else pd.DataFrame(columns=cols_kpi)
-    df_a_kpi = pd.DataFrame(a_kpi).reindex(columns=cols_kpi).rename(columns={"total_premio": "premio_kpi"}) if a_kpi else pd.DataFrame(columns=cols_kpi)
-    df_m_cx = pd.DataFrame(m_cx).reindex(columns=cols_cx).rename(columns={"total_premio": "premio_caixas"}) if m_cx else pd.DataFrame(columns=cols_cx)
-    df_a_cx = pd.DataFrame(a_cx).reindex(columns=cols_cx).rename(columns={"total_premio": "premio_caixas"}) if a_cx else pd.DataFrame(columns=cols_cx)
-
-    # Garante 0.0 onde for nulo
-    if 'premio_kpi' in df_m_kpi.columns: df_m_kpi['premio_kpi'] = df_m_kpi['premio_kpi'].fillna(0)
-    if 'premio_caixas' in df_m_cx.columns: df_m_cx['premio_caixas'] = df_m_cx['premio_caixas'].fillna(0)
-
-    # Garante tipo numérico para o COD (chave de merge)
-    for df in [df_m_kpi, df_m_cx, df_a_kpi, df_a_cx]:
-        if not df.empty and 'cod' in df.columns:
-            df['cod'] = pd.to_numeric(df['cod'], errors='coerce').fillna(0).astype(int)
-
-    # Merge Outer (mantém quem tem só KPI ou só Caixa)
-    df_m = pd.merge(df_m_kpi, df_m_cx, on='cod', how='outer', suffixes=('_kpi', '_cx'))
-    df_a = pd.merge(df_a_kpi, df_a_cx, on='cod', how='outer', suffixes=('_kpi', '_cx'))
-    
-    for df in [df_m, df_a]:
-        if 'premio_kpi' not in df.columns: df['premio_kpi'] = 0.0
-        if 'premio_caixas' not in df.columns: df['premio_caixas'] = 0.0
-        
-        df['premio_kpi'] = df['premio_kpi'].fillna(0)
-        df['premio_caixas'] = df['premio_caixas'].fillna(0)
-        df['total_a_pagar'] = df['premio_kpi'] + df['premio_caixas']
-        
-        # Consolida Nome e CPF (pega do lado que tiver informação)
-        df['nome'] = df.apply(lambda row: row.get('nome_kpi') if pd.notna(row.get('nome_kpi')) else row.get('nome_cx', ''), axis=1)
-        df['cpf'] = df.apply(lambda row: row.get('cpf_kpi') if pd.notna(row.get('cpf_kpi')) else row.get('cpf_cx', ''), axis=1)
-        
-        # Remove colunas auxiliares
-        cols_to_drop = ['nome_kpi', 'nome_cx', 'cpf_kpi', 'cpf_cx']
-        df.drop(columns=[c for c in cols_to_drop if c in df.columns], inplace=True)
+def _resultado_por_codigo(resultado, coluna_premio: str) -> pd.DataFrame:
+    """
+    Nome, CPF e prêmio de um motor (tabela ou lista de dicts) indexados pelo código
+    (com código repetido vale a primeira linha).
+    """
+    df = pd.DataFrame(resultado, columns=['cod', 'nome', 'cpf', 'total_premio'])
+    codigos = pd.to_numeric(df['cod'], errors='coerce').fillna(0).astype(int)
+    lado = pd.DataFrame({
+        'nome': df['nome'].to_numpy(dtype=object),
+        'cpf': df['cpf'].to_numpy(dtype=object),
+        coluna_premio: pd.to_numeric(df['total_premio'], errors='coerce').fillna(0).to_numpy(dtype=float),
+    }, index=pd.Index(codigos.to_numpy(dtype=np.int64), name='cod'))
+    return lado[~lado.index.duplicated(keep='first')]
 
-        df.fillna('', inplace=True)
+def _unir_por_codigo(kpi: pd.DataFrame, cx: pd.DataFrame) -> pd.DataFrame:
+    """
+    Junção externa por código (quem tem só KPI ou só caixas também entra), em ordem crescente
+    de código. Nome e CPF vêm do KPI e, na falta, das caixas; prêmios ausentes valem 0.
+    """
+    # union só ordena quando os índices diferem: com os mesmos códigos devolveria a ordem dos motores
+    codigos = kpi.index.union(cx.index).sort_values()
+    kpi, cx = kpi.reindex(codigos), cx.reindex(codigos)
+    premio_kpi = kpi['premio_kpi'].fillna(0.0)
+    premio_caixas = cx['premio_caixas'].fillna(0.0)
+    return pd.DataFrame({
+        'cod': codigos.to_numpy(dtype=np.int64),
+        'premio_kpi': premio_kpi.to_numpy(),
+        'premio_caixas': premio_caixas.to_numpy(),
+        'total_a_pagar': (premio_kpi + premio_caixas).to_numpy(),
+        'nome': kpi['nome'].combine_first(cx['nome']).fillna('').to_numpy(dtype=object),
+        'cpf': kpi['cpf'].combine_first(cx['cpf']).fillna('').to_numpy(dtype=object),
+    }, columns=COLUNAS_RESULTADO)
 
+def _merge_resultados(m_kpi, a_kpi, m_cx, a_cx):
+    """Prêmios de KPI e de caixas por colaborador (motoristas e ajudantes) e o total a pagar."""
+    df_m = _unir_por_codigo(_resultado_por_codigo(m_kpi, 'premio_kpi'), _resultado_por_codigo(m_cx, 'premio_caixas'))
+    df_a = _unir_por_codigo(_resultado_por_codigo(a_kpi, 'premio_kpi'), _resultado_por_codigo(a_cx, 'premio_caixas'))
     return df_m, df_a
 
+def _calcular_pagamento(dados: Dict[str, Any]) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    # Um só contexto: incentivo e caixas partilham deduplicação, xadrez e índice de pessoas
+    contexto = ContextoCalculo.de_fontes(dados)
+    m_kpi, a_kpi = calcular_incentivos(contexto)
+    m_cx, a_cx = calcular_caixas(contexto)
+    return _merge_resultados(m_kpi, a_kpi, m_cx, a_cx)
+
+async def _obter_pagamento(
+    data_inicio: str,
+    data_fim: str,
+    supabase: Client,
+    refechar: bool = False,
+    escopo: Optional[EscopoColaborador] = None
+) -> Dict[str, Any]:
+    """
+    Tabelas do pagamento (df_m, df_a). Um período fechado com snapshot gravado por
+    POST /pagamento/fechar é servido dele, desde que as fontes em cache estejam nas versões
+    do fecho; senão (ou sem snapshot) é calculado a partir das fontes, sem gravar nada.
+    Com refechar=True as fontes são recarregadas antes (core.database.renovar_periodo), a
+    empresa inteira é calculada e o snapshot é gravado.
+    Com 'escopo' (não-admin) o cálculo só cobre o colaborador.
+    O resultado pode ser partilhado com pedidos simultâneos (core.singleflight): não alterar.
+    """
+    versao = versoes_plano(PLANO_PAGAMENTO, data_inicio, data_fim)
+    if refechar:
+        # Chave própria: o refecho não aproveita um GET que partiu dos dados em cache
+        return await execucoes.executar(
+            ("pagamento-fecho", data_inicio, data_fim), versao,
+            lambda: _calcular_e_gravar(data_inicio, data_fim, supabase, None, gravar=True)
+        )
+
+    if versao is not None and periodo_fechado(data_inicio, data_fim):
+        snapshot = await run_in_threadpool(repositorio_snapshots.ler, data_inicio, data_fim)
+        if snapshot is not None and snapshot.valido_para(versao):
+            return {"df_m": snapshot.motoristas, "df_a": snapshot.ajudantes, "indice_pessoas": None,
+                    "error_message": None, "snapshot": snapshot}
+
+    if escopo is not None:
+        # Cálculo da empresa inteira já em curso para o período: serve também este colaborador
+        # (o filtro por CPF é aplicado depois, por pedido)
+        completo = execucoes.em_curso(("pagamento", data_inicio, data_fim, None), versao)
+        if completo is not None:
+            return await completo
+    # Pedidos idênticos simultâneos (ex.: fecho do ciclo) partilham a mesma busca e cálculo
+    return await execucoes.executar(
+        ("pagamento", data_inicio, data_fim, escopo), versao,
+        lambda: _calcular_e_gravar(data_inicio, data_fim, supabase, escopo)
+    )
+
+async def _calcular_e_gravar(
+    data_inicio: str, data_fim: str, supabase: Client, escopo: Optional[EscopoColaborador], gravar: bool = False
+) -> Dict[str, Any]:
+    if gravar:
+        # O snapshot é permanente: parte dos dados atuais, não dos caches (dias, Cadastro, Metas, Indicadores)
+        erro = await run_in_threadpool(
+            renovar_periodo, supabase, data_inicio, data_fim, [PLANO_PAGAMENTO.colunas("indicadores")]
+        )
+        if erro:
+            return {"df_m": None, "df_a": None, "indice_pessoas": None, "error_message": erro, "snapshot": None}
+    dados = await _get_dados_completos(data_inicio, data_fim, supabase, escopo)
+    resultado = {"indice_pessoas": dados["indice_pessoas"], "error_message": dados["error_message"], "snapshot": None}
+    resultado["df_m"], resultado["df_a"] = await run_in_threadpool(_calcular_pagamento, dados)
+    if gravar and not dados["error_message"]:
+        # Versões das fontes que acabaram de ser carregadas: o GET só serve o snapshot enquanto forem estas
+        resultado["snapshot"] = await run_in_threadpool(
+            repositorio_snapshots.gravar, data_inicio, data_fim,
+            resultado["df_m"], resultado["df_a"], dados["metas"], impressao_entradas(dados),
+            versoes_plano(PLANO_PAGAMENTO, data_inicio, data_fim)
+        )
+    return resultado
+
+async def _filtrar_usuario(resultado: Dict[str, Any], username: str, supabase: Client) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Linhas do CPF do usuário (o índice do Cadastro é buscado à parte quando veio do snapshot)."""
+    pessoas = resultado["indice_pessoas"]
+    if pessoas is None:
+        pessoas = await run_in_threadpool(get_indice_pessoas, supabase)
+    return filtrar_por_cpf(resultado["df_m"], resultado["df_a"], username, pessoas)
+
+def _controle_etag(request: Request, data_inicio: str, data_fim: str, current_user: dict, layout: str) -> ControleEtag:
+    """
+    ETag do /pagamento: a das fontes do PLANO_PAGAMENTO e, se o pedido vai ser servido de um
+    snapshot (gravado com essas versões), também a versão do arquivo.
+    """
+    escopo_etag = "admin" if current_user["role"] == "admin" else current_user["username"]
+    versao_snapshot = None
+    if periodo_fechado(data_inicio, data_fim):
+        versao_snapshot = repositorio_snapshots.versao(
+            data_inicio, data_fim, versoes_plano(PLANO_PAGAMENTO, data_inicio, data_fim)
+        )
+    extras = {"snapshot": versao_snapshot} if versao_snapshot is not None else None
+    return ControleEtag(
+        request, "pagamento", PLANO_PAGAMENTO, data_inicio, data_fim, escopo_etag, versoes_extras=extras, layout=layout
+    )
+
 @router.get("/pagamento")
 async def ler_relatorio_pagamento(
     request: Request, 
     data_inicio: str,
     data_fim: str,
+    layout: str = Query("records", pattern=PADRAO_LAYOUT, description="JSON por linha (records) ou por coluna (columnar)"),
     current_user: dict = Depends(get_current_user),
     supabase: Client = Depends(get_supabase)
 ):
     try:
-        dados = await _get_dados_completos(data_inicio, data_fim, supabase)
-        
-        if dados["error_message"]:
-             return {"motoristas": [], "ajudantes": [], "error": dados["error_message"]}
+        resposta = _controle_etag(request, data_inicio, data_fim, current_user, layout).resposta_antecipada()
+        if resposta is not None:
+            return resposta
 
-        m_kpi, a_kpi = await run_in_threadpool(
-            processar_incentivos_sincrono,
-            dados["df_viagens_dedup"], dados["df_cadastro"], 
-            dados["df_indicadores"], None, dados["metas"]
-        )
-        
-        m_cx, a_cx = await run_in_threadpool(
-            processar_caixas_sincrono,
-            dados["df_viagens_dedup"], dados["df_cadastro"], 
-            dados["df_caixas"], dados["metas"]
-        )
+        escopo = await escopo_da_requisicao(supabase, current_user)
+        resultado = await _obter_pagamento(data_inicio, data_fim, supabase, escopo=escopo)
         
-        df_m, df_a = await run_in_threadpool(_merge_resultados, m_kpi, a_kpi, m_cx, a_cx)
+        if resultado["error_message"]:
+             return {"motoristas": [], "ajudantes": [], "error": resultado["error_message"]}
+
+        df_m, df_a = resultado["df_m"], resultado["df_a"]
         
         # Filtro de Segurança
         if current_user["role"] != "admin":
-            cpf_user = str(current_user["username"]).replace(".", "").replace("-", "").strip()
-            
-            if not df_m.empty:
-                df_m['cpf_clean'] = df_m['cpf'].astype(str).str.replace(r'[.\-\s]', '', regex=True)
-                df_m = df_m[df_m['cpf_clean'] == cpf_user]
-                df_m.drop(columns=['cpf_clean'], inplace=True)
-                
-            if not df_a.empty:
-                df_a['cpf_clean'] = df_a['cpf'].astype(str).str.replace(r'[.\-\s]', '', regex=True)
-                df_a = df_a[df_a['cpf_clean'] == cpf_user]
-                df_a.drop(columns=['cpf_clean'], inplace=True)
-
-        return {
-            "motoristas": df_m.to_dict('records'),
-            "ajudantes": df_a.to_dict('records'),
+            df_m, df_a = await _filtrar_usuario(resultado, current_user["username"], supabase)
+
+        # Versão dos dados efetivamente usados
+        etag = _controle_etag(request, data_inicio, data_fim, current_user, layout)
+        etag.fixar_versao()
+        return etag.responder({
+            "motoristas": df_m,
+            "ajudantes": df_a,
             "error": None
-        }
+        })
     except Exception as e:
         print(f"\n--- ERRO CRÍTICO EM /PAGAMENTO ---\n")
         print(traceback.format_exc())
@@ -161,6 +220,7 @@ async def exportar_relatorio_pagamento(
     data_inicio: str,
     data_fim: str,
     token: str, 
+    formato: str = Query("xlsx", alias="format", pattern=r"^(xlsx|csv|parquet|arrow)$", description="xlsx (padrão), csv, parquet ou arrow"),
     supabase: Client = Depends(get_supabase)
 ):
     try:
@@ -173,34 +233,19 @@ async def exportar_relatorio_pagamento(
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token expirado ou inválido")
 
     try:
-        dados = await _get_dados_completos(data_inicio, data_fim, supabase)
-        
-        m_kpi, a_kpi = await run_in_threadpool(
-            processar_incentivos_sincrono,
-            dados["df_viagens_dedup"], dados["df_cadastro"], 
-            dados["df_indicadores"], None, dados["metas"]
-        )
-        
-        m_cx, a_cx = await run_in_threadpool(
-            processar_caixas_sincrono,
-            dados["df_viagens_dedup"], dados["df_cadastro"], 
-            dados["df_caixas"], dados["metas"]
-        )
-        
-        df_m, df_a = await run_in_threadpool(_merge_resultados, m_kpi, a_kpi, m_cx, a_cx)
+        escopo = await escopo_da_requisicao(supabase, {"username": username, "role": role})
+        resultado = await _obter_pagamento(data_inicio, data_fim, supabase, escopo=escopo)
+        if resultado["error_message"]:
+            raise HTTPException(status_code=400, detail=resultado["error_message"])
+        df_m, df_a = resultado["df_m"], resultado["df_a"]
         
         if role != "admin":
-            cpf_user = str(username).replace(".", "").replace("-", "").strip()
-            
-            if not df_m.empty:
-                df_m['cpf_clean'] = df_m['cpf'].astype(str).str.replace(r'[.\-\s]', '', regex=True)
-                df_m = df_m[df_m['cpf_clean'] == cpf_user]
-                df_m.drop(columns=['cpf_clean'], inplace=True)
-                
-            if not df_a.empty:
-                df_a['cpf_clean'] = df_a['cpf'].astype(str).str.replace(r'[.\-\s]', '', regex=True)
-                df_a = df_a[df_a['cpf_clean'] == cpf_user]
-                df_a.drop(columns=['cpf_clean'], inplace=True)
+            df_m, df_a = await _filtrar_usuario(resultado, username, supabase)
+
+        if formato != "xlsx":
+            # Integrações/BI: nomes de coluna crus, motoristas e ajudantes numa só tabela
+            tabela = juntar_por_tipo({"Motorista": df_m, "Ajudante": df_a})
+            return await run_in_threadpool(resposta_tabela, tabela, formato, f"Pagamento_{data_inicio}_{data_fim}")
 
         mapa_colunas = {
             "cod": "CÓDIGO",
@@ -213,38 +258,53 @@ async def exportar_relatorio_pagamento(
         
         colunas_finais = ["cod", "nome", "cpf", "premio_caixas", "premio_kpi", "total_a_pagar"]
         
-        if not df_m.empty:
-            df_m_final = df_m[colunas_finais].rename(columns=mapa_colunas)
-        else:
-            df_m_final = pd.DataFrame(columns=mapa_colunas.values())
-
-        if not df_a.empty:
-            df_a_final = df_a[colunas_finais].rename(columns=mapa_colunas)
-        else:
-            df_a_final = pd.DataFrame(columns=mapa_colunas.values())
-
-        output = io.BytesIO()
-        with pd.ExcelWriter(output, engine='openpyxl') as writer:
-            df_m_final.to_excel(writer, sheet_name='Motoristas', index=False)
-            df_a_final.to_excel(writer, sheet_name='Ajudantes', index=False)
-            
-            for sheet in writer.sheets.values():
-                for column in sheet.columns:
-                    try:
-                        max_length = max(len(str(cell.value or "")) for cell in column)
-                        adjusted_width = (max_length + 2)
-                        sheet.column_dimensions[column[0].column_letter].width = adjusted_width
-                    except:
-                        pass
-
-        output.seek(0)
-        
+        # _merge_resultados devolve sempre as mesmas colunas, mesmo sem linhas
+        df_m_final = df_m[colunas_finais].rename(columns=mapa_colunas)
+        df_a_final = df_a[colunas_finais].rename(columns=mapa_colunas)
+
+        # Write-only e em blocos: os bytes seguem para o cliente à medida que o arquivo é gerado
+        conteudo = xlsx_em_blocos({'Motoristas': df_m_final, 'Ajudantes': df_a_final})
         headers = {
             'Content-Disposition': f'attachment; filename="Pagamento_{data_inicio}_{data_fim}.xlsx"'
         }
-        return StreamingResponse(output, headers=headers, media_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+        return StreamingResponse(conteudo, headers=headers, media_type=MEDIA_TYPE_XLSX)
 
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Erro na exportação Excel: {e}")
         traceback.print_exc()
-        raise HTTPException(status_code=500, detail="Erro interno ao gerar o arquivo Excel.")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail="Erro interno ao gerar o arquivo Excel.")
+
+@router.post("/pagamento/fechar")
+async def fechar_periodo_pagamento(
+    data_inicio: str = Query(..., pattern=r"^\d{4}-\d{2}-\d{2}$", description="Data no formato YYYY-MM-DD"),
+    data_fim: str = Query(..., pattern=r"^\d{4}-\d{2}-\d{2}$", description="Data no formato YYYY-MM-DD"),
+    current_user: dict = Depends(get_current_user),
+    supabase: Client = Depends(get_supabase)
+):
+    """(Re)fecha um período terminado: recalcula das fontes e substitui o snapshot gravado."""
+    if current_user["role"] != "admin":
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Acesso negado. Apenas Gestores podem fechar períodos.")
+    if not periodo_fechado(data_inicio, data_fim):
+        raise HTTPException(status_code=400, detail="O período ainda não terminou.")
+
+    anterior = await run_in_threadpool(repositorio_snapshots.ler, data_inicio, data_fim)
+    resultado = await _obter_pagamento(data_inicio, data_fim, supabase, refechar=True)
+    if resultado["error_message"]:
+        raise HTTPException(status_code=400, detail=resultado["error_message"])
+    snapshot = resultado["snapshot"]
+    if snapshot is None:
+        raise HTTPException(status_code=501, detail="Snapshots indisponíveis: o pacote 'pyarrow' não está instalado.")
+
+    return {
+        "data_inicio": data_inicio,
+        "data_fim": data_fim,
+        "fechado_em": snapshot.fechado_em,
+        "impressao": snapshot.impressao,
+        "impressao_anterior": anterior.impressao if anterior is not None else None,
+        "alterado": anterior is None or anterior.impressao != snapshot.impressao,
+        "motoristas": len(snapshot.motoristas),
+        "ajudantes": len(snapshot.ajudantes),
+        "metas": snapshot.metas,
+    }
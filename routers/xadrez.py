@@ -1,23 +1,124 @@
 import datetime
-from fastapi import APIRouter, Request, Depends
-from typing import Optional
+import os
+import pandas as pd
+from fastapi import APIRouter, Request, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from typing import List, Optional, Tuple
 from fastapi.concurrency import run_in_threadpool
 from supabase import Client
-from core.database import get_dados_apurados, get_supabase
-from core.analysis import gerar_dashboard_e_mapas
+from core.cache import CacheLRU
+from core.database import CACHE_DIAS_TTL_SEGUNDOS, cache_distribuicao, get_supabase, versao_periodo
+from core.loader import PlanoDados, carregar_plano
+from core.analysis import COLUNAS_XADREZ
+from core.context import ContextoCalculo
+from core.etag import ControleEtag, versoes_plano
+from core.serialization import MEDIA_TYPE_NDJSON, PADRAO_LAYOUT, ndjson_em_blocos
+from core.export import resposta_tabela
+from core.singleflight import execucoes
+from core.scheduler import USUARIO_AGENDADOR, erro_da_resposta, pedido_interno
 from core.security import get_current_user
 
 router = APIRouter(prefix="/xadrez", tags=["Xadrez"])
 
-def processar_xadrez_sincrono(df, view_mode):
+# O resumo devolve todas as colunas da viagem; o modo equipas só lê as do xadrez.
+PLANO_XADREZ_EQUIPAS = PlanoDados({"viagens": COLUNAS_XADREZ})
+PLANO_XADREZ_RESUMO = PlanoDados({"viagens": None})
+
+# Resumo: ordenação padrão, colunas separadas por vírgula, '-' para decrescente (ex.: MOTORISTA,-DATA)
+ORDENACAO_PADRAO = "MOTORISTA"
+PADRAO_ORDENACAO = r"^-?\w+(,-?\w+)*$"
+LIMITE_PAGINA_MAXIMO = 10_000
+
+# Formatos do xadrez: os arquivos tabulares e NDJSON (uma viagem por linha, em streaming)
+PADRAO_FORMATO_XADREZ = r"^(csv|parquet|arrow|ndjson)$"
+
+# (início, fim, busca, ordenação, versão das viagens) -> resumo ordenado
+XADREZ_CACHE_MAX_BYTES = int(float(os.environ.get("XADREZ_CACHE_MAX_MB", "128")) * 1024 * 1024)
+cache_resumos = CacheLRU(XADREZ_CACHE_MAX_BYTES, CACHE_DIAS_TTL_SEGUNDOS)
+
+def tabela_xadrez(contexto: ContextoCalculo, view_mode) -> pd.DataFrame:
+    """Xadrez como tabela para exportação: uma linha por motorista (equipas) ou as viagens por motorista (resumo)."""
+    if view_mode == 'equipas_fixas':
+        return pd.DataFrame(contexto.xadrez["dashboard_data"])
+    return contexto.viagens.sort_values(by='MOTORISTA')
+
+def _chaves_ordenacao(ordenacao: str) -> Tuple[List[str], List[bool]]:
+    """'MOTORISTA,-DATA' -> (['MOTORISTA', 'DATA'], [True, False])."""
+    chaves = ordenacao.split(",")
+    return [chave.lstrip("-") for chave in chaves], [not chave.startswith("-") for chave in chaves]
+
+def resumo_xadrez(contexto: ContextoCalculo, ordenacao: str = ORDENACAO_PADRAO) -> pd.DataFrame:
+    """
+    Viagens ordenadas (por padrão, por motorista), com vazios como '' (modo resumo).
+    ValueError se a ordenação pedir colunas inexistentes ou não ordenáveis.
+    """
+    colunas, ascendente = _chaves_ordenacao(ordenacao)
+    faltantes = [col for col in colunas if col not in contexto.viagens.columns]
+    if faltantes:
+        raise ValueError(f"Colunas de ordenação inexistentes: {', '.join(faltantes)}")
+    try:
+        resumo_df = contexto.viagens.sort_values(by=colunas, ascending=ascendente)
+    except TypeError:
+        raise ValueError(f"Não é possível ordenar por '{ordenacao}': a coluna tem valores de tipos diferentes.")
+    resumo_df.fillna('', inplace=True)
+    return resumo_df
+
+def _chave_resumo(data_inicio: str, data_fim: str, busca: str, ordenacao: str) -> Optional[tuple]:
+    # Sem versão das viagens em cache, o resumo ordenado não pode ser reaproveitado
+    versao = versao_periodo(cache_distribuicao, data_inicio, data_fim)
+    return None if versao is None else (data_inicio, data_fim, busca, ordenacao, versao)
+
+async def _resumo_ordenado(
+    supabase: Client, data_inicio: str, data_fim: str, busca: str, ordenacao: str
+) -> Tuple[Optional[pd.DataFrame], Optional[str]]:
+    """
+    Resumo ordenado do período, servido de cache_resumos quando as viagens não mudaram:
+    as páginas seguintes são só um fatiamento (sem busca nem ordenação).
+    """
+    chave = _chave_resumo(data_inicio, data_fim, busca, ordenacao)
+    resumo = cache_resumos.obter(chave) if chave is not None else None
+    if resumo is not None:
+        return resumo, None
+
+    # Primeiras páginas pedidas ao mesmo tempo (sem resumo em cache): uma só busca e ordenação
+    return await execucoes.executar(
+        ("xadrez-resumo", data_inicio, data_fim, busca, ordenacao),
+        versoes_plano(PLANO_XADREZ_RESUMO, data_inicio, data_fim),
+        lambda: _calcular_resumo(supabase, data_inicio, data_fim, busca, ordenacao)
+    )
+
+async def _calcular_resumo(
+    supabase: Client, data_inicio: str, data_fim: str, busca: str, ordenacao: str
+) -> Tuple[Optional[pd.DataFrame], Optional[str]]:
+    dados = await carregar_plano(supabase, data_inicio, data_fim, PLANO_XADREZ_RESUMO, busca=busca)
+    if dados["error_message"] or dados["df_viagens_dedup"] is None:
+        return None, dados["error_message"]
+    try:
+        resumo = await run_in_threadpool(resumo_xadrez, ContextoCalculo.de_fontes(dados), ordenacao)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    chave = _chave_resumo(data_inicio, data_fim, busca, ordenacao)
+    if chave is not None:
+        cache_resumos.guardar(chave, resumo)
+    return resumo, None
+
+async def _dashboard_equipas(
+    supabase: Client, data_inicio: str, data_fim: str, busca: str
+) -> Tuple[list, Optional[str]]:
+    """Dashboard das equipas fixas e o erro da carga (lista vazia em erro)."""
+    dados = await carregar_plano(supabase, data_inicio, data_fim, PLANO_XADREZ_EQUIPAS, busca=busca)
+    if dados["error_message"] or dados["df_viagens_dedup"] is None:
+        return [], dados["error_message"]
+    _, dashboard = await run_in_threadpool(processar_xadrez_sincrono, ContextoCalculo.de_fontes(dados), 'equipas_fixas')
+    return dashboard, None
+
+def processar_xadrez_sincrono(contexto: ContextoCalculo, view_mode):
     resumo_viagens, dashboard_equipas = [], None
     if view_mode == 'equipas_fixas':
-        resultado_xadrez = gerar_dashboard_e_mapas(df)
-        dashboard_equipas = resultado_xadrez["dashboard_data"]
+        dashboard_equipas = contexto.xadrez["dashboard_data"]
     else: 
-        resumo_df = df.sort_values(by='MOTORISTA')
-        resumo_df.fillna('', inplace=True)
-        resumo_viagens = resumo_df.to_dict('records')
+        resumo_viagens = resumo_xadrez(contexto).to_dict('records')
     return resumo_viagens, dashboard_equipas
 
 @router.get("/")
@@ -27,6 +128,11 @@ async def ler_relatorio_xadrez(
     data_inicio: Optional[str] = None,
     data_fim: Optional[str] = None,
     search_query: Optional[str] = None,
+    formato: Optional[str] = Query(None, alias="format", pattern=PADRAO_FORMATO_XADREZ, description="csv, parquet, arrow ou ndjson (padrão: JSON)"),
+    layout: str = Query("records", pattern=PADRAO_LAYOUT, description="resumo por linha (records) ou por coluna (columnar)"),
+    sort: Optional[str] = Query(None, pattern=PADRAO_ORDENACAO, description="Resumo: colunas de ordenação, '-' para decrescente (padrão: MOTORISTA)"),
+    limit: Optional[int] = Query(None, ge=1, le=LIMITE_PAGINA_MAXIMO, description="Resumo: viagens por página (padrão: todas)"),
+    offset: int = Query(0, ge=0, description="Resumo: viagens a saltar"),
     current_user: dict = Depends(get_current_user),
     supabase: Client = Depends(get_supabase)
 ):
@@ -35,22 +141,75 @@ async def ler_relatorio_xadrez(
     data_fim = data_fim or hoje.isoformat()
     search_str = search_query or ""
     
-    df, error = await run_in_threadpool(get_dados_apurados, supabase, data_inicio, data_fim, search_str)
-    
-    resumo, dashboard = [], []
-    if not error and df is not None:
-        if 'MAPA' in df.columns: 
-            df = df.drop_duplicates(subset=['MAPA'])
-        else: 
-            df = df.drop_duplicates()
-        
-        resumo, dashboard = await run_in_threadpool(processar_xadrez_sincrono, df, view_mode)
-
-    return {
+    plano = PLANO_XADREZ_EQUIPAS if view_mode == 'equipas_fixas' else PLANO_XADREZ_RESUMO
+    paginado = view_mode != 'equipas_fixas' and formato in (None, "ndjson")
+    ordenacao = sort or ORDENACAO_PADRAO
+
+    etag = None
+    if not formato:
+        # O xadrez não é filtrado por usuário: mesma resposta para todos
+        parametros = {"view_mode": view_mode, "busca": search_str}
+        if paginado:
+            parametros.update(sort=ordenacao, limit=limit, offset=offset)
+        etag = ControleEtag(request, "xadrez", plano, data_inicio, data_fim, "todos", parametros, layout=layout)
+        resposta = etag.resposta_antecipada()
+        if resposta is not None:
+            return resposta
+
+    if paginado:
+        resumo, error = await _resumo_ordenado(supabase, data_inicio, data_fim, search_str, ordenacao)
+        pagina = resumo.iloc[offset:offset + limit if limit else None] if resumo is not None else None
+        if formato == "ndjson":
+            if pagina is None:
+                raise HTTPException(status_code=400, detail=error or "Nenhum dado encontrado para o período selecionado.")
+            return StreamingResponse(ndjson_em_blocos(pagina), media_type=MEDIA_TYPE_NDJSON)
+
+        etag.fixar_versao()
+        return etag.responder({
+            "data_inicio": data_inicio,
+            "data_fim": data_fim,
+            "view_mode": view_mode,
+            "dashboard": None if pagina is not None else [],
+            "resumo": pagina if pagina is not None else [],
+            "paginacao": {"total": len(resumo) if resumo is not None else 0, "offset": offset, "limit": limit},
+            "error": error
+        }, guardar=not error)
+
+    if formato:
+        dados = await carregar_plano(supabase, data_inicio, data_fim, plano, busca=search_str)
+        df, error = dados["df_viagens_dedup"], dados["error_message"]
+        if error or df is None:
+            raise HTTPException(status_code=400, detail=error or "Nenhum dado encontrado para o período selecionado.")
+        tabela = await run_in_threadpool(tabela_xadrez, ContextoCalculo.de_fontes(dados), view_mode)
+        if formato == "ndjson":
+            return StreamingResponse(ndjson_em_blocos(tabela), media_type=MEDIA_TYPE_NDJSON)
+        return await run_in_threadpool(resposta_tabela, tabela, formato, f"Xadrez_{data_inicio}_{data_fim}")
+
+    # O xadrez é o mesmo para todos: pedidos simultâneos do período partilham busca e cálculo
+    dashboard, error = await execucoes.executar(
+        ("xadrez-equipas", data_inicio, data_fim, search_str),
+        versoes_plano(plano, data_inicio, data_fim),
+        lambda: _dashboard_equipas(supabase, data_inicio, data_fim, search_str)
+    )
+    etag.fixar_versao()
+
+    return etag.responder({
         "data_inicio": data_inicio,
         "data_fim": data_fim,
         "view_mode": view_mode,
         "dashboard": dashboard,
-        "resumo": resumo,
+        "resumo": [],
         "error": error
-    }
\ No newline at end of file
+    }, guardar=not error)
+
+async def aquecer(supabase: Client, data_inicio: str, data_fim: str) -> Optional[str]:
+    """Aquecimento (core.scheduler): equipas e resumo padrão do período, como os pediria um admin."""
+    for view_mode in ("equipas_fixas", "resumo"):
+        resposta = await ler_relatorio_xadrez(
+            pedido_interno(), view_mode, data_inicio, data_fim, search_query=None, formato=None,
+            layout="records", sort=None, limit=None, offset=0, current_user=USUARIO_AGENDADOR, supabase=supabase
+        )
+        erro = erro_da_resposta(resposta)
+        if erro:
+            return erro
+    return None
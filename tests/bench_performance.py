@@ -0,0 +1,274 @@
+"""
+Microbenchmarks dos caminhos quentes (não é coletado pelo pytest).
+
+Uso:
+    python tests/bench_performance.py            # todos
+    python tests/bench_performance.py login      # apenas um
+"""
+import os
+import sys
+import time
+import random
+import tracemalloc
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import pandas as pd
+
+from core.analysis import limpar_texto, limpar_serie, _preparar_dataframe_ajudantes, _calcular_mapas_referencia
+from core.indexes import IndiceCpf, IndicePessoas
+
+
+def _cronometrar(funcao, repeticoes):
+    inicio = time.perf_counter()
+    for _ in range(repeticoes):
+        funcao()
+    return (time.perf_counter() - inicio) / repeticoes
+
+
+def _formatar(segundos):
+    if segundos < 1e-3:
+        return f"{segundos * 1e6:10.2f} µs"
+    return f"{segundos * 1e3:10.2f} ms"
+
+
+def _relatorio(nome, antes, depois):
+    fator = antes / depois if depois else float("inf")
+    print(f"{nome:<44} antes {_formatar(antes)}   depois {_formatar(depois)}   {fator:8.1f}x")
+
+
+def _cadastro_sintetico(n_motoristas=1500, n_ajudantes=2500, seed=7):
+    rnd = random.Random(seed)
+    linhas = []
+    for cod in range(1, n_motoristas + 1):
+        linhas.append({"Codigo_M": cod, "Nome_M": f"MOTORISTA {cod}", "CPF_M": f"{rnd.randrange(10**10, 10**11)}",
+                       "Data_M": "2019-03-01", "Codigo_J": None, "Nome_J": None, "CPF_J": None, "Data_J": None})
+    for cod in range(10001, 10001 + n_ajudantes):
+        linhas.append({"Codigo_M": None, "Nome_M": None, "CPF_M": None, "Data_M": None,
+                       "Codigo_J": cod, "Nome_J": f"AJUDANTE {cod}", "CPF_J": f"{rnd.randrange(10**10, 10**11)}",
+                       "Data_J": "2021-07-15"})
+    df = pd.DataFrame(linhas)
+    # Mesma preparação de core.database._buscar_cadastro
+    for col in ("CPF_M", "CPF_J"):
+        df[col] = df[col].astype(str).str.replace(r'[.-]', '', regex=True).fillna('')
+    return df
+
+
+def bench_login():
+    """/token: varredura regex do Cadastro por login vs. índice de CPFs por versão."""
+    df_cadastro = _cadastro_sintetico()
+    cpfs = list(df_cadastro["CPF_J"].iloc[-200:])
+
+    def login_antigo(cpf):
+        cpf_limpo = cpf.replace(".", "").replace("-", "")
+        existe_m = df_cadastro['CPF_M'].astype(str).str.replace(r'[.-]', '', regex=True).eq(cpf_limpo).any()
+        existe_j = df_cadastro['CPF_J'].astype(str).str.replace(r'[.-]', '', regex=True).eq(cpf_limpo).any()
+        return existe_m or existe_j
+
+    indice = IndiceCpf(df_cadastro)
+    assert all(login_antigo(c) == indice.contem(c) for c in cpfs)
+
+    antes = _cronometrar(lambda: [login_antigo(c) for c in cpfs], 3) / len(cpfs)
+    depois = _cronometrar(lambda: [indice.contem(c) for c in cpfs], 50) / len(cpfs)
+    construcao = _cronometrar(lambda: IndiceCpf(df_cadastro), 5)
+    _relatorio(f"login por CPF ({len(df_cadastro)} no cadastro)", antes, depois)
+    print(f"{'  construção do índice (1x por versão)':<44} {_formatar(construcao)}")
+
+
+def _distribuicao_sintetica(n_viagens=50_000, n_motoristas=300, n_ajudantes=500, seed=11):
+    """Mês de viagens no formato cru do Supabase (nomes com acentos, repetidos milhares de vezes)."""
+    rnd = random.Random(seed)
+    nomes_m = [f"Motorista João {i} da Conceição" for i in range(n_motoristas)]
+    nomes_a = [f"Ajudante José {i} Araújo" for i in range(n_ajudantes)]
+    linhas = []
+    for i in range(n_viagens):
+        m = rnd.randrange(n_motoristas)
+        linha = {"id": i, "DATA": f"2025-01-{i % 28 + 1:02d}", "MAPA": 100000 + i, "COD": m + 1,
+                 "MOTORISTA": nomes_m[m], "COD_2": None, "MOTORISTA_2": None}
+        fixos = [(m * 3 + k) % n_ajudantes for k in range(3)]
+        for k in range(1, 4):
+            if rnd.random() < 0.15:
+                linha[f"CODJ_{k}"], linha[f"AJUDANTE_{k}"] = None, None
+                continue
+            a = fixos[k - 1] if rnd.random() < 0.8 else rnd.randrange(n_ajudantes)
+            linha[f"CODJ_{k}"], linha[f"AJUDANTE_{k}"] = 10001 + a, nomes_a[a]
+        linhas.append(linha)
+    return pd.DataFrame(linhas)
+
+
+def bench_limpeza_texto():
+    """get_dados_apurados: limpar_texto via .apply em cada célula vs. limpar_serie (valores distintos)."""
+    df = _distribuicao_sintetica()
+    colunas = list(df.select_dtypes(include=["object"]).columns)
+
+    def antes():
+        return {c: df[c].apply(limpar_texto) for c in colunas}
+
+    def depois():
+        return {c: limpar_serie(df[c]) for c in colunas}
+
+    a, d = antes(), depois()
+    assert all(a[c].equals(d[c]) for c in colunas)
+    _relatorio(f"limpeza de texto ({len(df)} linhas, {len(colunas)} colunas)", _cronometrar(antes, 3), _cronometrar(depois, 3))
+
+
+def _pico_memoria(funcao):
+    tracemalloc.start()
+    try:
+        funcao()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def bench_ajudantes():
+    """_preparar_dataframe_ajudantes: concat de uma cópia por posição + apply vs. reshape único."""
+    from test_analysis import _preparar_dataframe_ajudantes_legado
+
+    df = _distribuicao_sintetica(n_viagens=200_000)
+    for c in df.select_dtypes(include=["object"]).columns:
+        df[c] = limpar_serie(df[c])
+
+    antes = lambda: _preparar_dataframe_ajudantes_legado(df)
+    depois = lambda: _preparar_dataframe_ajudantes(df)
+    pd.testing.assert_frame_equal(antes(), depois())
+
+    _relatorio(f"expansão de ajudantes ({len(df)} viagens)", _cronometrar(antes, 3), _cronometrar(depois, 3))
+    mb_antes, mb_depois = _pico_memoria(antes) / 2**20, _pico_memoria(depois) / 2**20
+    print(f"{'  pico de memória (tracemalloc)':<44} antes {mb_antes:10.1f} MB   depois {mb_depois:10.1f} MB")
+
+
+def bench_mapas():
+    """_calcular_mapas_referencia: mode() por grupo em três groupby vs. contagem ordenada única."""
+    from test_analysis import _calcular_mapas_referencia_legado
+
+    df = _distribuicao_sintetica(n_viagens=100_000)
+    df_melted = _preparar_dataframe_ajudantes(df)
+
+    antes = lambda: _calcular_mapas_referencia_legado(df_melted, df)
+    depois = lambda: _calcular_mapas_referencia(df_melted, df)
+    assert antes() == depois()
+    _relatorio(f"mapas de referência ({len(df_melted)} linhas)", _cronometrar(antes, 3), _cronometrar(depois, 3))
+
+
+def bench_caixas():
+    """processar_caixas_sincrono: iterrows com to_numeric por célula vs. motor colunar."""
+    from test_caixas import _processar_caixas_legado
+    from core.context import ContextoCalculo
+    from routers.caixas import processar_caixas_sincrono
+
+    df_viagens = _distribuicao_sintetica(n_viagens=100_000)
+    df_cadastro = _cadastro_sintetico(n_motoristas=300, n_ajudantes=500)
+    rnd = random.Random(5)
+    df_caixas = pd.DataFrame([{"mapa": str(m), "caixas": float(rnd.randrange(0, 400))} for m in df_viagens["MAPA"]])
+    metas = {"motorista": {"meta_cx_valor_n1": 0.1, "meta_cx_valor_n2": 0.2}, "ajudante": {"meta_cx_valor_n1": 0.05}}
+    pessoas = IndicePessoas(df_cadastro)
+
+    antes = lambda: _processar_caixas_legado(df_viagens, df_cadastro, df_caixas, metas)
+    depois = lambda: processar_caixas_sincrono(ContextoCalculo(viagens=df_viagens, pessoas=pessoas, caixas=df_caixas, metas=metas))
+    assert antes() == depois()
+    _relatorio(f"caixas ({len(df_viagens)} viagens)", _cronometrar(antes, 1), _cronometrar(depois, 5))
+
+
+def bench_pagamento():
+    """_merge_resultados: merges externos + apply por linha vs. junção por índice de código."""
+    from test_pagamento import _merge_resultados_legado
+    from routers.pagamento import _merge_resultados
+
+    rnd = random.Random(3)
+    def registros(codigos):
+        return [{"cod": c, "nome": f"COLABORADOR {c}", "cpf": f"{c:011d}", "total_premio": rnd.choice([0.0, 50.0, 100.0])}
+                for c in codigos]
+    m_kpi, m_cx = registros(range(0, 6000)), registros(range(1000, 7000))
+    a_kpi, a_cx = registros(range(10000, 18000)), registros(range(12000, 20000))
+
+    antes = lambda: _merge_resultados_legado(m_kpi, a_kpi, m_cx, a_cx)
+    depois = lambda: _merge_resultados(m_kpi, a_kpi, m_cx, a_cx)
+    for esperado, resultado in zip(antes(), depois()):
+        pd.testing.assert_frame_equal(resultado, esperado, check_dtype=False)
+    _relatorio(f"merge do pagamento ({len(m_kpi) + len(a_kpi)} + {len(m_cx) + len(a_cx)} linhas)", _cronometrar(antes, 3), _cronometrar(depois, 10))
+
+
+def bench_exportacao():
+    """/pagamento/exportar: openpyxl normal em BytesIO + varredura de células vs. write-only em blocos."""
+    import io
+    from openpyxl import load_workbook
+    from core.export import xlsx_em_blocos
+
+    n = 20_000
+    rnd = random.Random(9)
+    roster = pd.DataFrame({
+        "CÓDIGO": range(1, n + 1),
+        "NOME": [f"COLABORADOR {i} DA SILVA" for i in range(n)],
+        "CPF": [f"{rnd.randrange(10**10, 10**11)}" for _ in range(n)],
+        "PRÊMIO CAIXAS (R$)": [rnd.randrange(0, 40000) / 100 for _ in range(n)],
+        "PRÊMIO KPI (R$)": [rnd.choice([0.0, 50.0, 100.0]) for _ in range(n)],
+    })
+    roster["TOTAL A PAGAR (R$)"] = roster["PRÊMIO CAIXAS (R$)"] + roster["PRÊMIO KPI (R$)"]
+    planilhas = {"Motoristas": roster, "Ajudantes": roster.iloc[:0]}
+
+    def antes():
+        output = io.BytesIO()
+        with pd.ExcelWriter(output, engine='openpyxl') as writer:
+            for nome, df in planilhas.items():
+                df.to_excel(writer, sheet_name=nome, index=False)
+            for sheet in writer.sheets.values():
+                for column in sheet.columns:
+                    max_length = max(len(str(cell.value or "")) for cell in column)
+                    sheet.column_dimensions[column[0].column_letter].width = max_length + 2
+        return output.getvalue()
+
+    def depois():
+        # Consome os blocos como o StreamingResponse, sem juntar o arquivo
+        return sum(len(bloco) for bloco in xlsx_em_blocos(planilhas))
+
+    lido = load_workbook(io.BytesIO(b"".join(xlsx_em_blocos(planilhas))), read_only=True)
+    assert sum(1 for _ in lido["Motoristas"].iter_rows()) == n + 1
+
+    t_antes, t_depois = _cronometrar(antes, 1), _cronometrar(depois, 3)
+    _relatorio(f"exportação xlsx ({n} linhas)", t_antes, t_depois)
+    print(f"{'  vazão':<44} antes {n / t_antes:10.0f} l/s  depois {n / t_depois:10.0f} l/s")
+    mb_antes, mb_depois = _pico_memoria(antes) / 2**20, _pico_memoria(depois) / 2**20
+    print(f"{'  pico de memória (tracemalloc)':<44} antes {mb_antes:10.1f} MB   depois {mb_depois:10.1f} MB")
+
+
+def bench_serializacao():
+    """/xadrez resumo: to_dict('records') + jsonable_encoder + json vs. serialização direta das colunas."""
+    from fastapi.encoders import jsonable_encoder
+    from fastapi.responses import JSONResponse
+    from core.serialization import serializar
+
+    resumo = pd.DataFrame(_distribuicao_sintetica()).sort_values(by='MOTORISTA').fillna('')
+    n = len(resumo)
+
+    def antes():
+        return JSONResponse(jsonable_encoder({"resumo": resumo.to_dict('records')})).body
+
+    def depois():
+        return serializar({"resumo": resumo})
+
+    def colunar():
+        return serializar({"resumo": resumo}, layout="columnar")
+
+    t_antes, t_depois, t_colunar = _cronometrar(antes, 1), _cronometrar(depois, 3), _cronometrar(colunar, 3)
+    _relatorio(f"serialização resumo ({n} viagens)", t_antes, t_depois)
+    _relatorio("  layout=columnar", t_antes, t_colunar)
+    print(f"{'  tamanho do corpo':<44} records {len(depois()) / 2**20:8.1f} MB   columnar {len(colunar()) / 2**20:8.1f} MB")
+
+
+BENCHMARKS = {
+    "login": bench_login,
+    "limpeza": bench_limpeza_texto,
+    "ajudantes": bench_ajudantes,
+    "mapas": bench_mapas,
+    "caixas": bench_caixas,
+    "pagamento": bench_pagamento,
+    "exportacao": bench_exportacao,
+    "serializacao": bench_serializacao,
+}
+
+if __name__ == "__main__":
+    escolhidos = sys.argv[1:] or list(BENCHMARKS)
+    for nome in escolhidos:
+        BENCHMARKS[nome]()
@@ -0,0 +1,152 @@
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.analysis import limpar_texto, limpar_serie, _preparar_dataframe_ajudantes, _calcular_mapas_referencia, gerar_dashboard_e_mapas
+
+
+def test_limpar_serie_igual_ao_apply():
+    serie = pd.Series(
+        ["João", "joão", None, "JOÃO / Maria", 7, np.nan, "ação", "João", 2.5, "  espaço "],
+        index=range(100, 110), name="MOTORISTA", dtype=object
+    )
+
+    esperado = serie.apply(limpar_texto)
+    resultado = limpar_serie(serie)
+
+    pd.testing.assert_series_equal(resultado, esperado)
+    assert [type(v) for v in resultado] == [type(v) for v in esperado]
+
+
+def test_limpar_serie_mantem_inferencia_de_dtype():
+    for valores in ([True, False], [1, 2], [None, None], []):
+        serie = pd.Series(valores, dtype=object)
+        pd.testing.assert_series_equal(limpar_serie(serie), serie.apply(limpar_texto))
+
+
+def test_limpar_serie_valores_nao_hasheaveis():
+    serie = pd.Series([{"a": 1}, "é"], dtype=object)
+
+    assert limpar_serie(serie).tolist() == [{"a": 1}, "E"]
+
+
+def _preparar_dataframe_ajudantes_legado(df):
+    """Implementação anterior (uma cópia por coluna + apply), mantida como referência."""
+    ajudantes_dfs = []
+    for aj_col in sorted(df.filter(regex=r'^AJUDANTE_\d+$').columns):
+        num = aj_col.split('_')[-1]
+        cod_col = f'CODJ_{num}'
+        if cod_col in df.columns:
+            temp_df = df[['COD', 'MOTORISTA', aj_col, cod_col]].copy()
+            temp_df.rename(columns={'COD': 'MOTORISTA_COD', 'MOTORISTA': 'MOTORISTA_NOME',
+                                    aj_col: 'AJUDANTE_NOME', cod_col: 'AJUDANTE_COD'}, inplace=True)
+            temp_df['POSICAO'] = f'AJUDANTE {num}'
+            ajudantes_dfs.append(temp_df)
+    df_m = pd.concat(ajudantes_dfs)
+    df_m['AJUDANTE_NOME'] = df_m['AJUDANTE_NOME'].astype(str)
+    df_m['AJUDANTE_NOME'] = df_m['AJUDANTE_NOME'].apply(lambda x: x.split('/')[0].strip() if '/' in x else x)
+    df_m = df_m[df_m['AJUDANTE_NOME'].str.strip() != '']
+    df_m['AJUDANTE_COD'] = pd.to_numeric(df_m['AJUDANTE_COD'], errors='coerce')
+    df_m.dropna(subset=['AJUDANTE_COD'], inplace=True)
+    df_m['AJUDANTE_COD'] = df_m['AJUDANTE_COD'].astype(int)
+    return df_m.drop_duplicates()
+
+
+def test_preparar_ajudantes_igual_a_implementacao_anterior():
+    df = pd.DataFrame({
+        "COD": [1, 2, 2, 3, 4],
+        "MOTORISTA": ["ANA", "BRUNO", "BRUNO", "CARLA", "DIEGO"],
+        "AJUDANTE_1": ["JOAO / MARIA", "PEDRO", "PEDRO", None, "   "],
+        "CODJ_1": [501, 502, 502, 503, 504],
+        "AJUDANTE_2": ["LUIS", "", "RITA/", "SARA", np.nan],
+        "CODJ_2": ["505", 506, "x", None, 507],
+        "AJUDANTE_10": ["TIAGO", "UGO", None, None, "VERA"],
+        "CODJ_10": [508.0, np.nan, np.nan, np.nan, 509.0],
+        # Sem CODJ_3: a posição é ignorada
+        "AJUDANTE_3": ["XICO", "XICO", "XICO", "XICO", "XICO"],
+    }, index=[10, 11, 12, 13, 14])
+
+    esperado = _preparar_dataframe_ajudantes_legado(df)
+    resultado = _preparar_dataframe_ajudantes(df)
+
+    pd.testing.assert_frame_equal(resultado, esperado)
+
+
+def test_preparar_ajudantes_sem_pares():
+    df = pd.DataFrame({"COD": [1], "MOTORISTA": ["ANA"], "AJUDANTE_1": ["JOAO"]})
+
+    resultado = _preparar_dataframe_ajudantes(df)
+
+    assert resultado.empty
+    assert list(resultado.columns) == ['MOTORISTA_COD', 'MOTORISTA_NOME', 'AJUDANTE_NOME', 'AJUDANTE_COD', 'POSICAO']
+
+
+def _calcular_mapas_referencia_legado(df_melted, df_original):
+    """Implementação anterior (mode() por grupo), mantida como referência."""
+    return {
+        "motorista_fixo_map": df_melted.groupby('AJUDANTE_COD')['MOTORISTA_COD'].apply(
+            lambda x: x.mode().iloc[0] if not x.mode().empty else None).to_dict(),
+        "posicao_fixa_map": df_melted.groupby('AJUDANTE_COD')['POSICAO'].apply(
+            lambda x: x.mode().iloc[0] if not x.mode().empty else 'AJUDANTE 1').to_dict(),
+        "nome_ajudante_map": df_melted.groupby('AJUDANTE_COD')['AJUDANTE_NOME'].apply(
+            lambda x: x.mode().iloc[0] if not x.mode().empty else '').to_dict(),
+        "contagem_viagens_motorista": df_original['COD'].value_counts().to_dict(),
+        "motorista_nome_map": df_original.drop_duplicates(subset=['COD']).set_index('COD')['MOTORISTA'].to_dict(),
+    }
+
+
+def test_mapas_referencia_igual_a_implementacao_anterior():
+    df_melted = pd.DataFrame({
+        # 501: empate 2x2 entre motoristas 7 e 3 -> vence o menor; 502 só com nome nulo
+        "MOTORISTA_COD": [7, 3, 7, 3, 9, 9, 4],
+        "MOTORISTA_NOME": ["G", "C", "G", "C", "I", "I", "D"],
+        "AJUDANTE_NOME": ["ZECA", "ZECA", "ANA", "ANA", None, None, "BIA"],
+        "AJUDANTE_COD": [501, 501, 501, 501, 502, 502, 490],
+        "POSICAO": ["AJUDANTE 2", "AJUDANTE 1", "AJUDANTE 2", "AJUDANTE 1", "AJUDANTE 3", "AJUDANTE 3", "AJUDANTE 1"],
+    })
+    df_original = pd.DataFrame({"COD": [7, 3, 9, 4, 7], "MOTORISTA": ["G", "C", "I", "D", "G"]})
+
+    esperado = _calcular_mapas_referencia_legado(df_melted, df_original)
+    resultado = _calcular_mapas_referencia(df_melted, df_original)
+
+    assert resultado == esperado
+    for nome in ("motorista_fixo_map", "posicao_fixa_map", "nome_ajudante_map"):
+        assert list(resultado[nome]) == list(esperado[nome])
+        assert [type(v) for v in resultado[nome].values()] == [type(v) for v in esperado[nome].values()]
+
+
+def test_dashboard_classifica_fixos_e_visitantes():
+    def viagem(cod, nome, *equipe):
+        linha = {"COD": cod, "MOTORISTA": nome, "COD_2": None, "MOTORISTA_2": None}
+        for i, (codj, ajudante) in enumerate(equipe, start=1):
+            linha[f"CODJ_{i}"], linha[f"AJUDANTE_{i}"] = codj, ajudante
+        return linha
+
+    vazio = (None, None)
+    df = pd.DataFrame([
+        viagem(1, "ANA", (501, "ALEX"), (502, "BETO"), (503, "CAIO")),
+        viagem(1, "ANA", (502, "BETO"), (501, "ALEX"), vazio),
+        viagem(1, "ANA", vazio, vazio, (501, "ALEX")),
+        viagem(2, "BIA", (502, "BETO / XICO"), (504, "DANI"), vazio),
+        viagem(2, "BIA", (502, "BETO"), vazio, (504, "DANI")),
+        viagem(2, "BIA", vazio, (502, "BETO"), (503, "CAIO")),
+        viagem(2, "BIA", vazio, vazio, vazio),
+        viagem(2, "BIA", vazio, vazio, vazio),
+    ])
+
+    resultado = gerar_dashboard_e_mapas(df)
+    linha_ana, linha_bia = resultado["dashboard_data"]
+
+    # 502 empata entre os motoristas 1 e 2 (2 linhas cada): o fixo é o menor código
+    assert resultado["mapas"]["motorista_fixo_map"] == {501: 1, 502: 1, 503: 1, 504: 2}
+    assert linha_ana["MOTORISTA"] == "ANA (3)"
+    assert (linha_ana["AJUDANTE_1"], linha_ana["CODJ_1"]) == ("ALEX (3) / BETO (2)", 501)
+    assert (linha_ana["AJUDANTE_3"], linha_ana["CODJ_3"]) == ("CAIO (1)", 503)
+    assert linha_ana["VISITANTES"] == []
+    # BIA: 504 é fixo; 502 (2 de 5 viagens, abaixo de 40%) é visitante acima do limite de 1 viagem; 503 fica oculto
+    assert (linha_bia["AJUDANTE_2"], linha_bia["CODJ_2"]) == ("DANI (2)", 504)
+    assert linha_bia["VISITANTES"] == ["BETO (2x)"]
+    assert sorted(resultado["ids_visiveis"]) == [501, 502, 503, 504]
@@ -0,0 +1,144 @@
+import os
+import sys
+import threading
+import time
+import pandas as pd
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.cache import CacheLRU, CacheReferencia, calcular_versao, copia_editavel
+
+
+def test_cache_lru_expulsa_pelo_tamanho():
+    cache = CacheLRU(max_bytes=10, ttl_segundos=60, medir=len)
+    cache.guardar("a", "aaaa")
+    cache.guardar("b", "bbbb")
+    cache.obter("a")  # 'a' passa a ser o mais recente
+    cache.guardar("c", "cccc")
+
+    assert cache.obter("b") is None
+    assert cache.obter("a") == "aaaa"
+    assert cache.obter("c") == "cccc"
+    assert cache.estatisticas()["bytes"] == 8
+
+
+def test_cache_lru_expira_pelo_ttl():
+    cache = CacheLRU(max_bytes=100, ttl_segundos=0, medir=len)
+    cache.guardar("a", "x")
+    time.sleep(0.01)
+
+    assert cache.obter("a") is None
+
+
+def test_referencia_entrega_dataframe_so_de_leitura():
+    cache = CacheReferencia(ttl_segundos=60, janela_stale_segundos=60)
+    carregar = lambda: pd.DataFrame({"CPF_M": ["1", "2"], "Codigo_M": [10, 20], "Data": pd.array([1, None], dtype="Int64")})
+
+    primeiro = cache.obter("cadastro", carregar)
+    versao = cache.versao("cadastro")
+    with pytest.raises(ValueError):
+        primeiro.loc[0, "CPF_M"] = "x"
+    with pytest.raises(ValueError):
+        primeiro.iloc[1, 1] = 99
+    with pytest.raises(ValueError):
+        primeiro["Codigo_M"].to_numpy()[0] = 5
+    # Colunas novas ou trocadas ficam só na cópia do chamador
+    primeiro["CPF_M"] = "alterado"
+    primeiro["extra"] = 1
+
+    segundo = cache.obter("cadastro", carregar)
+    assert segundo["CPF_M"].tolist() == ["1", "2"] and "extra" not in segundo.columns
+    assert segundo["Data"].dtype == "Int64"
+    assert cache.versao("cadastro") == versao
+
+
+def test_referencia_entrega_metas_so_de_leitura():
+    cache = CacheReferencia(ttl_segundos=60, janela_stale_segundos=60)
+    metas = cache.obter("metas", lambda: {"motorista": {"dev_pdv_premio": 100}, "faixas": [1, 2]})
+
+    with pytest.raises(TypeError):
+        metas["motorista"] = {}
+    with pytest.raises(TypeError):
+        metas["motorista"]["dev_pdv_premio"] = 0
+    assert metas == {"motorista": {"dev_pdv_premio": 100}, "faixas": (1, 2)}
+    assert copia_editavel(metas) == {"motorista": {"dev_pdv_premio": 100}, "faixas": [1, 2]}
+    assert cache.versao("metas") == calcular_versao(copia_editavel(metas))
+
+
+def test_referencia_serve_valor_antigo_e_revalida_em_segundo_plano():
+    cache = CacheReferencia(ttl_segundos=0, janela_stale_segundos=60)
+    versoes = iter([{"v": 1}, {"v": 2}])
+    recarregado = threading.Event()
+
+    def carregar():
+        valor = next(versoes)
+        if valor["v"] == 2:
+            recarregado.set()
+        return valor
+
+    assert cache.obter("metas", carregar) == {"v": 1}
+    versao_antiga = cache.versao("metas")
+    time.sleep(0.01)
+
+    # Expirado mas dentro da janela: devolve o antigo e recarrega sem bloquear
+    assert cache.obter("metas", carregar) == {"v": 1}
+    assert recarregado.wait(2)
+    for _ in range(100):
+        if cache.versao("metas") != versao_antiga:
+            break
+        time.sleep(0.01)
+    assert cache.versao("metas") != versao_antiga
+
+
+def test_referencia_invalidar_descarta_carga_em_curso():
+    cache = CacheReferencia(ttl_segundos=60, janela_stale_segundos=60)
+    liberar = threading.Event()
+    iniciou = threading.Event()
+
+    def carregar_lento():
+        iniciou.set()
+        liberar.wait(2)
+        return {"v": "antigo"}
+
+    t = threading.Thread(target=cache.obter, args=("metas", carregar_lento))
+    t.start()
+    iniciou.wait(2)
+    cache.invalidar("metas")
+    liberar.set()
+    t.join()
+
+    assert cache.versao("metas") is None
+    assert cache.obter("metas", lambda: {"v": "novo"}) == {"v": "novo"}
+
+
+def test_referencia_invalidar_outra_chave_nao_descarta_a_carga():
+    cache = CacheReferencia(ttl_segundos=60, janela_stale_segundos=60)
+    liberar = threading.Event()
+    iniciou = threading.Event()
+
+    def carregar_lento():
+        iniciou.set()
+        liberar.wait(2)
+        return {"v": "cadastro"}
+
+    t = threading.Thread(target=cache.obter, args=("cadastro", carregar_lento))
+    t.start()
+    iniciou.wait(2)
+    cache.invalidar("metas")
+    liberar.set()
+    t.join()
+
+    assert cache.versao("cadastro") is not None
+    # Sem chave: invalida também as cargas em curso de todas as chaves
+    iniciou.clear()
+    liberar.clear()
+    cache.invalidar()
+    t = threading.Thread(target=cache.obter, args=("cadastro", carregar_lento))
+    t.start()
+    iniciou.wait(2)
+    cache.invalidar()
+    liberar.set()
+    t.join()
+
+    assert cache.versao("cadastro") is None
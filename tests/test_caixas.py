@@ -0,0 +1,171 @@
+import os
+import sys
+import datetime
+import random
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.context import ContextoCalculo
+from core.indexes import IndicePessoas
+from routers.caixas import processar_caixas_sincrono, _get_valor_por_caixa, _valores_por_caixa
+
+
+def _processar_caixas_legado(df_viagens, df_cadastro, df_caixas, metas):
+    """Implementação anterior (iterrows por viagem), mantida como referência."""
+    metas_motorista = metas.get("motorista", {})
+    metas_ajudante = metas.get("ajudante", {})
+    hoje = datetime.date.today()
+    
+    # 1. Mapeamento Motoristas
+    motorista_antiguidade_map = {}
+    motorista_info_map = {} 
+    if df_cadastro is not None:
+        df_motoristas = df_cadastro[pd.notna(df_cadastro['Codigo_M'])].drop_duplicates(subset=['Codigo_M']).copy()
+        df_motoristas['Codigo_M_int'] = pd.to_numeric(df_motoristas['Codigo_M'], errors='coerce').fillna(0).astype(int)
+        df_motoristas['Data_M_dt'] = pd.to_datetime(df_motoristas['Data_M'], errors='coerce').dt.date
+        for _, row in df_motoristas.iterrows():
+            cod = row['Codigo_M_int']
+            if cod == 0: continue
+            dias = (hoje - row['Data_M_dt']).days if pd.notna(row['Data_M_dt']) else 0
+            motorista_antiguidade_map[cod] = dias
+            motorista_info_map[cod] = {
+                "nome": str(row.get('Nome_M', '')).strip(), 
+                "cpf": str(row.get('CPF_M', '')).strip()
+            }
+
+    # 2. Mapeamento Ajudantes
+    ajudante_antiguidade_map = {}
+    ajudante_info_map = {}
+    if df_cadastro is not None:
+        df_ajudantes = df_cadastro[pd.notna(df_cadastro['Codigo_J'])].drop_duplicates(subset=['Codigo_J']).copy()
+        df_ajudantes['Codigo_J_int'] = pd.to_numeric(df_ajudantes['Codigo_J'], errors='coerce').fillna(0).astype(int)
+        df_ajudantes['Data_J_dt'] = pd.to_datetime(df_ajudantes['Data_J'], errors='coerce').dt.date
+        for _, row in df_ajudantes.iterrows():
+            cod = row['Codigo_J_int']
+            if cod == 0: continue
+            dias = (hoje - row['Data_J_dt']).days if pd.notna(row['Data_J_dt']) else 0
+            ajudante_antiguidade_map[cod] = dias
+            ajudante_info_map[cod] = {
+                "nome": str(row.get('Nome_J', '')).strip(), 
+                "cpf": str(row.get('CPF_J', '')).strip()
+            }
+
+    # 3. Mapeamento Volumes
+    mapa_caixas_total = {}
+    if df_caixas is not None and not df_caixas.empty:
+        df_caixas_limpo = df_caixas.drop_duplicates(subset=['mapa'])
+        mapa_caixas_total = df_caixas_limpo.set_index('mapa')['caixas'].to_dict()
+
+    # 4. Acumulação
+    motorista_caixas_acumuladas = {}
+    ajudante_caixas_acumuladas = {}
+    colunas_ajudantes = [col for col in df_viagens.columns if col.startswith('CODJ_')]
+
+    if df_viagens is not None:
+        for _, viagem in df_viagens.iterrows():
+            mapa_id = str(viagem.get('MAPA', ''))
+            caixas_do_mapa = float(mapa_caixas_total.get(mapa_id, 0))
+            if caixas_do_mapa == 0: continue
+            
+            # Motorista Principal
+            cod_motorista = int(viagem.get('COD', 0))
+            if cod_motorista in motorista_info_map:
+                motorista_caixas_acumuladas[cod_motorista] = motorista_caixas_acumuladas.get(cod_motorista, 0) + caixas_do_mapa
+            
+            # Motorista 2
+            cod_motorista_2 = pd.to_numeric(viagem.get('COD_2'), errors='coerce')
+            if pd.notna(cod_motorista_2):
+                cod_m2 = int(cod_motorista_2)
+                if cod_m2 in motorista_info_map:
+                    motorista_caixas_acumuladas[cod_m2] = motorista_caixas_acumuladas.get(cod_m2, 0) + caixas_do_mapa
+
+            # Ajudantes
+            for col in colunas_ajudantes:
+                cod_aj = pd.to_numeric(viagem.get(col), errors='coerce')
+                if cod_aj and pd.notna(cod_aj):
+                    aj_int = int(cod_aj)
+                    if aj_int in ajudante_info_map:
+                        ajudante_caixas_acumuladas[aj_int] = ajudante_caixas_acumuladas.get(aj_int, 0) + caixas_do_mapa
+
+    # 5. Resultados Motoristas
+    resultado_motoristas = []
+    for cod, total in motorista_caixas_acumuladas.items():
+        info = motorista_info_map.get(cod, {"cpf": "N/A", "nome": f"COD {cod}"})
+        dias = motorista_antiguidade_map.get(cod, 0)
+        valor = _get_valor_por_caixa(dias, metas_motorista)
+        resultado_motoristas.append({
+            "tipo": "Motorista",
+            "cpf": info["cpf"], 
+            "cod": cod, 
+            "nome": info["nome"],
+            "total_caixas": total, 
+            "valor_por_caixa": valor, 
+            "total_premio": total * valor,
+            "antiguidade_dias": dias
+        })
+
+    # 6. Resultados Ajudantes
+    resultado_ajudantes = []
+    for cod, total in ajudante_caixas_acumuladas.items():
+        info = ajudante_info_map.get(cod, {"cpf": "N/A", "nome": f"COD {cod}"})
+        dias = ajudante_antiguidade_map.get(cod, 0)
+        valor = _get_valor_por_caixa(dias, metas_ajudante)
+        resultado_ajudantes.append({
+            "tipo": "Ajudante",
+            "cpf": info["cpf"], 
+            "cod": cod, 
+            "nome": info["nome"],
+            "total_caixas": total, 
+            "valor_por_caixa": valor, 
+            "total_premio": total * valor,
+            "antiguidade_dias": dias
+        })
+
+    return sorted(resultado_motoristas, key=lambda x: x['nome']), sorted(resultado_ajudantes, key=lambda x: x['nome'])
+
+
+def _dados(n_viagens=400, seed=3):
+    rnd = random.Random(seed)
+    hoje = datetime.date.today()
+    cadastro = [
+        {"Codigo_M": m, "Nome_M": f"MOTORISTA {m % 7}", "CPF_M": f"{m:011d}", "Data_M": (hoje - datetime.timedelta(days=m * 97)).isoformat(),
+         "Codigo_J": None, "Nome_J": None, "CPF_J": None, "Data_J": None}
+        for m in range(1, 30)
+    ] + [
+        {"Codigo_M": None, "Nome_M": None, "CPF_M": None, "Data_M": None, "Codigo_J": a, "Nome_J": f"AJUDANTE {a % 5}",
+         "CPF_J": f"{a:011d}", "Data_J": rnd.choice([None, (hoje - datetime.timedelta(days=rnd.randrange(3000))).isoformat()])}
+        for a in range(500, 540)
+    ]
+    viagens = []
+    for i in range(n_viagens):
+        viagens.append({
+            "DATA": "2025-01-10", "MAPA": 9000 + i % 300, "COD": rnd.randrange(1, 35),
+            "COD_2": rnd.choice([None, None, rnd.randrange(1, 35), "abc", "12"]),
+            **{f"CODJ_{k}": rnd.choice([None, 0, rnd.randrange(495, 545), "x"]) for k in (1, 2, 3)},
+        })
+    caixas = pd.DataFrame([{"mapa": str(9000 + m), "caixas": rnd.choice([0.0, 10.0, 25.5, 0.1, 7.0])} for m in range(0, 300, 2)])
+    metas = {
+        "motorista": {"meta_cx_valor_n1": 0.1, "meta_cx_valor_n2": 0.2, "meta_cx_valor_n3": 0.3, "meta_cx_valor_n4": 1},
+        "ajudante": {"meta_cx_dias_n1": 100, "meta_cx_valor_n1": 0.05, "meta_cx_valor_n2": 0.06},
+    }
+    return pd.DataFrame(viagens), pd.DataFrame(cadastro), caixas, metas
+
+
+def test_caixas_igual_a_implementacao_anterior():
+    df_viagens, df_cadastro, df_caixas, metas = _dados()
+
+    esperado = _processar_caixas_legado(df_viagens, df_cadastro, df_caixas, metas)
+    contexto = ContextoCalculo(viagens=df_viagens, pessoas=IndicePessoas(df_cadastro), caixas=df_caixas, metas=metas)
+    resultado = processar_caixas_sincrono(contexto)
+
+    assert resultado == esperado
+    tipos = lambda listas: [[type(v) for v in item.values()] for lista in listas for item in lista]
+    assert tipos(resultado) == tipos(esperado)
+
+
+def test_faixas_de_antiguidade_iguais_a_funcao_escalar():
+    dias = pd.Series([0, 365, 366, 730, 731, 1825, 1826, 5000]).to_numpy()
+    for metas in ({}, {"meta_cx_valor_n1": 1, "meta_cx_valor_n2": 2.5, "meta_cx_valor_n3": 3, "meta_cx_valor_n4": 4},
+                  {"meta_cx_dias_n1": 0.5, "meta_cx_valor_n2": 9}, {"meta_cx_dias_n2": None, "meta_cx_valor_n4": 4}):
+        assert _valores_por_caixa(dias, metas) == [_get_valor_por_caixa(d, metas) for d in dias.tolist()]
@@ -0,0 +1,42 @@
+import os
+import sys
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core import context as modulo_contexto
+from core.analysis import gerar_dashboard_e_mapas
+from core.context import ContextoCalculo
+
+
+def _viagens():
+    return pd.DataFrame({
+        "MAPA": [1, 1, 2, 3],
+        "COD": [10, 10, 10, 20],
+        "MOTORISTA": ["ANA", "ANA", "ANA", "BIA"],
+        "CODJ_1": [501, 501, 502, 501],
+        "AJUDANTE_1": ["JOAO", "JOAO", "PEDRO", "JOAO"],
+    })
+
+
+def test_contexto_calcula_cada_artefacto_uma_vez(monkeypatch):
+    chamadas = []
+    original = modulo_contexto._preparar_dataframe_ajudantes
+    monkeypatch.setattr(modulo_contexto, "_preparar_dataframe_ajudantes", lambda df: chamadas.append(1) or original(df))
+
+    contexto = ContextoCalculo(viagens_bruto=_viagens())
+
+    assert list(contexto.viagens["MAPA"]) == [1, 2, 3]
+    assert contexto.xadrez is contexto.xadrez
+    assert contexto.mapas["motorista_fixo_map"] == {501: 10, 502: 10}
+    assert contexto.xadrez["df_melted"] is contexto.df_melted
+    assert len(chamadas) == 1
+
+
+def test_contexto_xadrez_igual_ao_calculo_direto():
+    contexto = ContextoCalculo(viagens_bruto=_viagens())
+    direto = gerar_dashboard_e_mapas(contexto.viagens)
+
+    assert contexto.xadrez["dashboard_data"] == direto["dashboard_data"]
+    assert contexto.xadrez["ids_visiveis"] == direto["ids_visiveis"]
+    assert contexto.xadrez["mapas"] == direto["mapas"]
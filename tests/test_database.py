@@ -0,0 +1,216 @@
+import os
+import re
+import sys
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import core.database as database
+
+
+class _Resposta:
+    def __init__(self, data, count=None):
+        self.data = data
+        self.count = count
+
+
+class _Consulta:
+    """Imitação mínima do query builder do Supabase (apenas o que core.database usa)."""
+
+    def __init__(self, cliente, tabela):
+        self.cliente = cliente
+        self.tabela = tabela
+        self.filtros = []
+        self.ordem = []
+        self.intervalo = None
+        self.colunas = "*"
+        self.contar = False
+        self.cabecalho = False
+
+    def select(self, colunas="*", count=None, head=None):
+        self.colunas, self.contar, self.cabecalho = colunas, bool(count), bool(head)
+        return self
+
+    def gte(self, coluna, valor):
+        self.filtros.append(lambda r: str(r.get(coluna)) >= valor)
+        return self
+
+    def lte(self, coluna, valor):
+        self.filtros.append(lambda r: str(r.get(coluna)) <= valor)
+        return self
+
+    def in_(self, coluna, valores):
+        valores = {str(v) for v in valores}
+        self.filtros.append(lambda r: str(r.get(coluna)) in valores)
+        return self
+
+    def or_(self, expressao):
+        # Só a forma usada por core.scope: 'col.in.("v1","v2"),col2.in.(...)', valores entre aspas
+        # ou simples, como o PostgREST os lê
+        valor = r'"(?:[^"\\]|\\.)*"|[^,()"]+'
+        condicoes = [
+            (col, {re.sub(r'\\(.)', r'\1', v[1:-1]) if v.startswith('"') else v for v in re.findall(valor, lista)})
+            for col, lista in re.findall(rf'(\w+)\.in\.\(((?:{valor})(?:,(?:{valor}))*)\)', expressao)
+        ]
+        self.filtros.append(lambda r: any(str(r.get(col)) in vals for col, vals in condicoes))
+        return self
+
+    def order(self, coluna, desc=False):
+        self.ordem.append(coluna)
+        return self
+
+    def limit(self, quantidade):
+        return self.range(0, quantidade - 1)
+
+    def range(self, inicio, fim):
+        self.intervalo = (inicio, fim)
+        return self
+
+    def execute(self):
+        self.cliente.chamadas.append((self.tabela, self.colunas, self.intervalo))
+        linhas = [r for r in self.cliente.tabelas.get(self.tabela, []) if all(f(r) for f in self.filtros)]
+        if self.ordem:
+            linhas.sort(key=lambda r: tuple(r[c] for c in self.ordem))
+        total = len(linhas)
+        if self.intervalo:
+            linhas = linhas[self.intervalo[0]:self.intervalo[1] + 1]
+        if self.colunas != "*":
+            nomes = [c.strip() for c in self.colunas.split(",")]
+            linhas = [{c: r.get(c) for c in nomes} for r in linhas]
+        return _Resposta([] if self.cabecalho else [dict(r) for r in linhas], total if self.contar else None)
+
+
+class ClienteFalso:
+    def __init__(self, tabelas):
+        self.tabelas = tabelas
+        self.chamadas = []
+
+    def table(self, nome):
+        return _Consulta(self, nome)
+
+
+@pytest.fixture(autouse=True)
+def _cache_limpo():
+    database.clear_cache()
+    yield
+    database.clear_cache()
+
+
+def _distribuicao(n):
+    # Inserção fora de ordem para garantir que a ordenação (DATA, id) é aplicada.
+    return [
+        {"id": i, "DATA": f"2025-01-{(i * 11) % 28 + 1:02d}", "MAPA": 1000 + i, "COD": i % 40 + 1,
+         "MOTORISTA": f"Motorista {i % 40}", "CODJ_1": 500 + i % 13, "AJUDANTE_1": f"Ajudante {i % 13}"}
+        for i in reversed(range(n))
+    ]
+
+
+def test_busca_paralela_igual_a_sequencial():
+    cliente = ClienteFalso({database.NOME_DA_TABELA: _distribuicao(2500)})
+    paralelo = database._buscar_distribuicao(cliente, "2025-01-01", "2025-01-31", paginas_paralelas=4)
+    sequencial = database._buscar_distribuicao(cliente, "2025-01-01", "2025-01-31", paginas_paralelas=1)
+
+    assert paralelo == sequencial
+    assert len({r["id"] for r in paralelo}) == 2500
+    assert [(r["DATA"], r["id"]) for r in paralelo] == sorted((r["DATA"], r["id"]) for r in paralelo)
+
+
+def test_busca_continua_se_contagem_ficar_desatualizada(monkeypatch):
+    cliente = ClienteFalso({database.NOME_DA_TABELA: _distribuicao(2100)})
+    monkeypatch.setattr(database, "_contar_distribuicao", lambda *args: 1000)
+
+    linhas = database._buscar_distribuicao(cliente, "2025-01-01", "2025-01-31")
+
+    assert len(linhas) == 2100
+
+
+def test_get_dados_apurados_periodo_vazio():
+    cliente = ClienteFalso({database.NOME_DA_TABELA: []})
+    df, erro = database.get_dados_apurados(cliente, "2025-01-01", "2025-01-31", "")
+
+    assert df is None
+    assert erro == "Nenhum dado encontrado para o período selecionado."
+
+
+def _chamadas_distribuicao(cliente):
+    return [c for c in cliente.chamadas if c[0] == database.NOME_DA_TABELA]
+
+
+def test_cache_por_dia_busca_apenas_dias_em_falta():
+    cliente = ClienteFalso({database.NOME_DA_TABELA: _distribuicao(600)})
+
+    database.get_dados_apurados(cliente, "2025-01-01", "2025-01-15", "")
+    chamadas_antes = len(_chamadas_distribuicao(cliente))
+    df_completo, _ = database.get_dados_apurados(cliente, "2025-01-10", "2025-01-25", "")
+    novas = _chamadas_distribuicao(cliente)[chamadas_antes:]
+
+    # Só o intervalo 16..25 foi buscado (contagem + página)
+    assert len(novas) == 2
+    assert set(df_completo["DATA"]) == {f"2025-01-{d:02d}" for d in range(10, 26)}
+    database.clear_cache()
+    sem_cache, _ = database.get_dados_apurados(ClienteFalso(cliente.tabelas), "2025-01-10", "2025-01-25", "")
+    assert df_completo.equals(sem_cache)
+
+
+def test_cache_por_dia_rebusca_quando_faltam_colunas():
+    cliente = ClienteFalso({database.NOME_DA_TABELA: _distribuicao(300)})
+
+    database.get_dados_apurados(cliente, "2025-01-01", "2025-01-31", "", colunas=["COD"])
+    df, _ = database.get_dados_apurados(cliente, "2025-01-01", "2025-01-31", "", colunas=["CODJ_1"])
+
+    assert {"COD", "CODJ_1"} <= set(df.columns)
+    assert "AJUDANTE_1" not in df.columns
+
+
+def test_clear_cache_invalida_particoes():
+    cliente = ClienteFalso({database.NOME_DA_TABELA: _distribuicao(300)})
+    database.get_dados_apurados(cliente, "2025-01-01", "2025-01-31", "")
+    cliente.tabelas[database.NOME_DA_TABELA].append(
+        {"id": 999, "DATA": "2025-01-02", "MAPA": 9999, "COD": 1, "MOTORISTA": "Novo",
+         "CODJ_1": None, "AJUDANTE_1": None}
+    )
+
+    em_cache, _ = database.get_dados_apurados(cliente, "2025-01-01", "2025-01-31", "")
+    database.clear_cache()
+    atualizado, _ = database.get_dados_apurados(cliente, "2025-01-01", "2025-01-31", "")
+
+    assert len(atualizado) == len(em_cache) + 1
+
+
+def test_projecao_inclui_todas_as_posicoes_de_equipe():
+    from core.analysis import COLUNAS_XADREZ
+    from routers.caixas import COLUNAS_VIAGENS_CAIXAS
+    linhas = _distribuicao(300)
+    for r in linhas[::7]:
+        r["CODJ_4"], r["AJUDANTE_4"] = 777, "Ajudante Quatro"
+    cliente = ClienteFalso({database.NOME_DA_TABELA: linhas})
+
+    df_caixas, _ = database.get_dados_apurados(cliente, "2025-01-01", "2025-01-31", "", colunas=COLUNAS_VIAGENS_CAIXAS)
+    df_xadrez, _ = database.get_dados_apurados(cliente, "2025-01-01", "2025-01-31", "", colunas=COLUNAS_XADREZ)
+
+    assert "CODJ_4" in df_caixas.columns and "AJUDANTE_4" not in df_caixas.columns
+    assert {"CODJ_4", "AJUDANTE_4"} <= set(df_xadrez.columns)
+    assert (df_xadrez["CODJ_4"] == 777).sum() == len(linhas[::7])
+
+
+def test_renovar_periodo_nao_deixa_referencias_em_cache():
+    cliente = ClienteFalso({
+        database.NOME_DA_TABELA: _distribuicao(50),
+        "Cadastro": [{"Codigo_M": 1, "Nome_M": "Ana", "CPF_M": "1", "Codigo_J": None, "Nome_J": None, "CPF_J": None}],
+        "Metas": [{"tipo_colaborador": "motorista", "meta_cx_valor_n1": 0.1}],
+        "Caixas": [],
+        "Resultados_Indicadores": [{"Codigo_M": 1, "dev_pdv": 0.01,
+                                    "data_inicio_periodo": "2025-01-01", "data_fim_periodo": "2025-01-31"}],
+    })
+    database.get_cadastro_sincrono(cliente)
+    database.get_metas_sincrono(cliente)
+    database.get_indicadores_sincrono(cliente, "2025-01-01", "2025-01-31")
+    cliente.tabelas["Cadastro"][0]["Nome_M"] = "Ana Maria"
+    cliente.tabelas["Metas"][0]["meta_cx_valor_n1"] = 0.2
+    cliente.tabelas["Resultados_Indicadores"][0]["dev_pdv"] = 0.02
+
+    assert database.renovar_periodo(cliente, "2025-01-01", "2025-01-31") is None
+
+    assert database.get_cadastro_sincrono(cliente)[0]["Nome_M"].tolist() == ["Ana Maria"]
+    assert database.get_metas_sincrono(cliente)["motorista"]["meta_cx_valor_n1"] == 0.2
+    assert database.get_indicadores_sincrono(cliente, "2025-01-01", "2025-01-31")[0]["dev_pdv"].tolist() == [0.02]
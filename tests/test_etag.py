@@ -0,0 +1,119 @@
+import os
+import sys
+import gzip
+import json
+import pytest
+from starlette.requests import Request
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import core.database as database
+import core.etag as etag_modulo
+from core.etag import ControleEtag, versoes_plano
+from core.loader import PlanoDados
+from test_database import ClienteFalso, _distribuicao
+
+PLANO = PlanoDados({"viagens": None})
+
+
+@pytest.fixture(autouse=True)
+def _caches_limpos():
+    database.clear_cache()
+    etag_modulo.cache_respostas.limpar()
+    yield
+    database.clear_cache()
+    etag_modulo.cache_respostas.limpar()
+
+
+def _pedido(**cabecalhos):
+    return Request({
+        "type": "http", "method": "GET", "path": "/", "query_string": b"",
+        "headers": [(k.replace("_", "-").encode(), v.encode()) for k, v in cabecalhos.items()],
+    })
+
+
+def _controle(pedido, escopo="admin"):
+    return ControleEtag(pedido, "teste", PLANO, "2025-01-01", "2025-01-15", escopo)
+
+
+def test_sem_dados_em_cache_nao_ha_etag():
+    controle = _controle(_pedido())
+
+    assert versoes_plano(PLANO, "2025-01-01", "2025-01-15") is None
+    assert controle.resposta_antecipada() is None
+    controle.fixar_versao()
+    resposta = controle.responder({"a": 1})
+    assert "etag" not in resposta.headers
+    assert json.loads(resposta.body) == {"a": 1}
+
+
+def test_versao_acompanha_as_particoes():
+    cliente = ClienteFalso({database.NOME_DA_TABELA: _distribuicao(300)})
+    database.get_dados_apurados(cliente, "2025-01-01", "2025-01-15", "")
+    versao = database.versao_periodo(database.cache_distribuicao, "2025-01-01", "2025-01-15")
+
+    assert versao is not None
+    assert database.versao_periodo(database.cache_distribuicao, "2025-01-01", "2025-01-20") is None
+
+    # Mesmos dados buscados de novo: mesma versão; dados alterados: outra
+    database.clear_cache()
+    database.get_dados_apurados(cliente, "2025-01-01", "2025-01-15", "")
+    assert database.versao_periodo(database.cache_distribuicao, "2025-01-01", "2025-01-15") == versao
+    cliente.tabelas[database.NOME_DA_TABELA][0]["MOTORISTA"] = "Outro"
+    database.clear_cache()
+    database.get_dados_apurados(cliente, "2025-01-01", "2025-01-15", "")
+    assert database.versao_periodo(database.cache_distribuicao, "2025-01-01", "2025-01-15") != versao
+
+
+def test_get_condicional_e_corpo_em_cache():
+    cliente = ClienteFalso({database.NOME_DA_TABELA: _distribuicao(300)})
+    database.get_dados_apurados(cliente, "2025-01-01", "2025-01-15", "")
+    conteudo = {"linhas": [{"cod": i, "nome": f"Colaborador {i}"} for i in range(200)]}
+
+    primeiro = _controle(_pedido())
+    assert primeiro.resposta_antecipada() is None
+    primeiro.fixar_versao()
+    resposta = primeiro.responder(conteudo)
+    etag = resposta.headers["etag"]
+    assert etag.startswith('W/"')
+    assert json.loads(resposta.body) == conteudo
+
+    # Cliente com a mesma versão: 304 sem corpo
+    nao_modificado = _controle(_pedido(if_none_match=etag)).resposta_antecipada()
+    assert nao_modificado.status_code == 304
+    assert nao_modificado.headers["etag"] == etag
+
+    # Outro cliente: corpo já serializado, comprimido se aceitar gzip
+    comprimida = _controle(_pedido(accept_encoding="gzip, br")).resposta_antecipada()
+    assert comprimida.headers["content-encoding"] == "gzip"
+    assert json.loads(gzip.decompress(comprimida.body)) == conteudo
+
+    # Outro escopo (usuário) tem outra ETag
+    assert _controle(_pedido(if_none_match=etag), escopo="12345678900").resposta_antecipada() is None
+
+
+def test_resposta_com_erro_nao_e_guardada():
+    cliente = ClienteFalso({database.NOME_DA_TABELA: _distribuicao(300)})
+    database.get_dados_apurados(cliente, "2025-01-01", "2025-01-15", "")
+
+    controle = _controle(_pedido())
+    controle.fixar_versao()
+    resposta = controle.responder({"error": "falhou"}, guardar=False)
+
+    assert "etag" not in resposta.headers
+    assert _controle(_pedido()).resposta_antecipada() is None
+
+
+def test_indicadores_servidos_do_cache():
+    linhas = [{"Codigo_M": i, "dev_pdv": 0.01 * i, "data_inicio_periodo": "2025-01-01", "data_fim_periodo": "2025-01-31"} for i in range(5)]
+    cliente = ClienteFalso({"Resultados_Indicadores": linhas})
+
+    assert database.versao_indicadores("2025-01-01", "2025-01-31", ["dev_pdv"]) is None
+    df, erro = database.get_indicadores_sincrono(cliente, "2025-01-01", "2025-01-31", ["dev_pdv"])
+    df.loc[0, "dev_pdv"] = 99
+    de_novo, _ = database.get_indicadores_sincrono(cliente, "2025-01-01", "2025-01-31", ["dev_pdv"])
+
+    assert erro is None
+    assert len(cliente.chamadas) == 1
+    assert de_novo.loc[0, "dev_pdv"] == 0
+    assert database.versao_indicadores("2025-01-01", "2025-01-31", ["dev_pdv"]) is not None
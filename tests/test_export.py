@@ -0,0 +1,107 @@
+import os
+import io
+import sys
+import threading
+import pytest
+import numpy as np
+import pandas as pd
+from openpyxl import load_workbook
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import core.export as export
+
+
+def _roster(n):
+    return pd.DataFrame({
+        "CÓDIGO": np.arange(1, n + 1),
+        "NOME": [f"COLABORADOR {i}" for i in range(n)],
+        "CPF": [None if i % 7 == 0 else f"{i:011d}" for i in range(n)],
+        "TOTAL A PAGAR (R$)": [np.nan if i % 5 == 0 else i * 1.5 for i in range(n)],
+    })
+
+
+def test_xlsx_em_blocos_gera_planilhas_em_varios_blocos(monkeypatch):
+    monkeypatch.setattr(export, "TAMANHO_BLOCO", 4096)
+    motoristas, ajudantes = _roster(3000), _roster(0)
+
+    blocos = list(export.xlsx_em_blocos({"Motoristas": motoristas, "Ajudantes": ajudantes}))
+
+    assert len(blocos) > 1 and all(len(b) == 4096 for b in blocos[:-1])
+    workbook = load_workbook(io.BytesIO(b"".join(blocos)))
+    assert workbook.sheetnames == ["Motoristas", "Ajudantes"]
+    sheet = workbook["Motoristas"]
+    linhas = list(sheet.iter_rows(values_only=True))
+    assert linhas[0] == tuple(motoristas.columns)
+    assert linhas[1] == (1, "COLABORADOR 0", None, None)
+    assert linhas[2] == (2, "COLABORADOR 1", "00000000001", 1.5)
+    assert len(linhas) == 3001
+    assert sheet["A1"].font.bold
+    assert sheet.column_dimensions["B"].width == len("COLABORADOR 2999") + 2
+    assert list(workbook["Ajudantes"].iter_rows(values_only=True)) == [tuple(ajudantes.columns)]
+
+
+def test_xlsx_em_blocos_cancela_o_escritor_quando_o_cliente_desiste(monkeypatch):
+    monkeypatch.setattr(export, "TAMANHO_BLOCO", 1024)
+    gerador = export.xlsx_em_blocos({"Motoristas": _roster(5000)})
+
+    assert next(gerador)
+    gerador.close()
+
+    escritor = next(t for t in threading.enumerate() if t.name == "exportacao-xlsx")
+    escritor.join(timeout=10)
+    assert not escritor.is_alive()
+
+
+def test_larguras_colunas_pelos_dados():
+    df = pd.DataFrame({"A": ["x", None], "NOME LONGO": [1, 22], "C": [np.nan, 1234.5]})
+
+    assert export.larguras_colunas(df) == [3, 12, 8]
+
+
+def _tabela_mista():
+    return pd.DataFrame({
+        "tipo": ["Motorista", "Ajudante", "Ajudante"],
+        "cod": [10, 501, 502],
+        "nome": ["ANA", "JOAO", None],
+        "total_premio": np.array([100, 12.5, 0.0], dtype=object),
+        # Tipos misturados (ex.: resumo do xadrez): exportados como texto
+        "COD_2": np.array([7, "", None], dtype=object),
+    })
+
+
+def test_csv_em_blocos(monkeypatch):
+    monkeypatch.setattr(export, "LINHAS_POR_BLOCO", 2)
+    df = _tabela_mista()
+
+    blocos = list(export.tabela_em_blocos(df, "csv"))
+
+    assert len(blocos) == 3
+    assert pd.read_csv(io.BytesIO(b"".join(blocos)))["cod"].tolist() == [10, 501, 502]
+
+
+def test_parquet_e_arrow_em_blocos(monkeypatch):
+    pa = pytest.importorskip("pyarrow")
+    import pyarrow.parquet as pq
+    monkeypatch.setattr(export, "LINHAS_POR_BLOCO", 2)
+    df = _tabela_mista()
+
+    parquet = pq.read_table(io.BytesIO(b"".join(export.tabela_em_blocos(df, "parquet"))))
+    arrow = pa.ipc.open_stream(b"".join(export.tabela_em_blocos(df, "arrow"))).read_all()
+
+    for tabela in (parquet, arrow):
+        assert tabela.column_names == list(df.columns)
+        assert tabela.column("total_premio").to_pylist() == [100.0, 12.5, 0.0]
+        assert tabela.column("COD_2").to_pylist() == ["7", "", None]
+        assert tabela.column("nome").to_pylist() == ["ANA", "JOAO", None]
+    assert parquet.to_batches()[0].num_rows == 2
+
+
+def test_juntar_por_tipo():
+    motoristas = pd.DataFrame({"cod": [1], "nome": ["ANA"]})
+    ajudantes = pd.DataFrame(columns=["cod", "nome"])
+
+    tabela = export.juntar_por_tipo({"Motorista": motoristas, "Ajudante": ajudantes})
+
+    assert list(tabela.columns) == ["tipo", "cod", "nome"]
+    assert tabela.to_dict("records") == [{"tipo": "Motorista", "cod": 1, "nome": "ANA"}]
@@ -0,0 +1,179 @@
+import os
+import sys
+import random
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.analysis import gerar_dashboard_e_mapas
+from core.context import ContextoCalculo
+from core.indexes import IndicePessoas
+from routers.incentivo import processar_incentivos_sincrono
+
+
+def _processar_incentivos_legado(df_viagens, df_cadastro, df_indicadores, df_caixas, metas):
+    """Implementação anterior (iterrows por motorista e por ajudante), mantida como referência."""    
+    incentivo_motoristas = []
+    incentivo_ajudantes = []
+    metas_motorista = metas.get("motorista", {})
+    metas_ajudante = metas.get("ajudante", {})
+    premio_motorista_map = {}
+    default_premio_info = {"dev_pdv_val": "N/A", "dev_pdv_passou": False, "rating_val": "N/A", "rating_passou": False, "refugo_val": "N/A", "refugo_passou": False}
+    
+    cpf_motorista_map = {}
+    cpf_ajudante_map = {}
+    indicadores_map = {}
+
+    if df_cadastro is not None and not df_cadastro.empty:
+        df_m = df_cadastro[pd.notna(df_cadastro['Codigo_M'])].drop_duplicates(subset=['Codigo_M'])
+        df_m['Codigo_M_int'] = pd.to_numeric(df_m['Codigo_M'], errors='coerce').fillna(0).astype(int)
+        cpf_motorista_map = df_m.set_index('Codigo_M_int')['CPF_M'].to_dict()
+
+        df_j = df_cadastro[pd.notna(df_cadastro['Codigo_J'])].drop_duplicates(subset=['Codigo_J'])
+        df_j['Codigo_J_int'] = pd.to_numeric(df_j['Codigo_J'], errors='coerce').fillna(0).astype(int)
+        cpf_ajudante_map = df_j.set_index('Codigo_J_int')['CPF_J'].to_dict()
+
+    if df_indicadores is not None and not df_indicadores.empty:
+        # Garante numérico
+        for col in ['dev_pdv', 'Rating_tx', 'refugo']:
+            if col in df_indicadores.columns:
+                df_indicadores[col] = pd.to_numeric(df_indicadores[col], errors='coerce')
+        indicadores_map = df_indicadores.set_index('Codigo_M').to_dict('index')
+
+    if df_viagens is not None and not df_viagens.empty:
+        # Motoristas
+        motoristas_un = df_viagens[['COD', 'MOTORISTA']].drop_duplicates(subset=['COD'])
+        for _, row in motoristas_un.iterrows():
+            cod = int(row['COD'])
+            ind = indicadores_map.get(cod, {})
+            
+            # Valores (multiplica por 100 se necessário, ajuste conforme seu dado no banco)
+            # Se no banco já está 0.11 (11%), multiplicar por 100 é correto.
+            dev = ind.get('dev_pdv')
+            dev = dev * 100 if pd.notna(dev) else None
+            
+            rat = ind.get('Rating_tx')
+            rat = rat * 100 if pd.notna(rat) else None
+            
+            ref = ind.get('refugo')
+            ref = ref * 100 if pd.notna(ref) else None
+
+            # Metas
+            pass_dev = (dev is not None and dev <= metas_motorista.get("dev_pdv_meta_perc", 0))
+            pass_rat = (rat is not None and rat >= metas_motorista.get("rating_meta_perc", 0))
+            pass_ref = (ref is not None and ref <= metas_motorista.get("refugo_meta_perc", 0))
+
+            premio_dev = metas_motorista.get("dev_pdv_premio", 0) if pass_dev else 0.0
+            premio_rat = metas_motorista.get("rating_premio", 0) if pass_rat else 0.0
+            premio_ref = metas_motorista.get("refugo_premio", 0) if pass_ref else 0.0
+
+            info = {
+                "dev_pdv_val": f"{dev:.2f}%" if dev is not None else "N/A", "dev_pdv_passou": pass_dev,
+                "rating_val": f"{rat:.2f}%" if rat is not None else "N/A", "rating_passou": pass_rat,
+                "refugo_val": f"{ref:.2f}%" if ref is not None else "N/A", "refugo_passou": pass_ref
+            }
+            premio_motorista_map[cod] = info
+
+            incentivo_motoristas.append({
+                "cpf": cpf_motorista_map.get(cod, ""),
+                "cod": cod,
+                "nome": str(row['MOTORISTA']).strip(),
+                "dev_pdv_val": info["dev_pdv_val"], "dev_pdv_premio_val": premio_dev,
+                "rating_val": info["rating_val"], "rating_premio_val": premio_rat,
+                "refugo_val": info["refugo_val"], "refugo_premio_val": premio_ref,
+                "total_premio": premio_dev + premio_rat + premio_ref
+            })
+
+        # Ajudantes (Herança)
+        res_xadrez = gerar_dashboard_e_mapas(df_viagens)
+        motorista_fixo_map = res_xadrez["mapas"].get("motorista_fixo_map", {})
+        df_melted = res_xadrez["df_melted"]
+        
+        # --- CORREÇÃO: Filtrar apenas ajudantes visíveis no Xadrez ---
+        ids_visiveis = set(res_xadrez.get("ids_visiveis", []))
+
+        if not df_melted.empty:
+            ajudantes_unicos = df_melted.drop_duplicates(subset=['AJUDANTE_COD'])
+            for _, aj in ajudantes_unicos.iterrows():
+                cod_aj = aj['AJUDANTE_COD']
+                
+                # Se não estiver na lista de visíveis (Fixo ou Visitante Qualificado), pula
+                if cod_aj not in ids_visiveis:
+                    continue
+
+                cod_mot_pai = motorista_fixo_map.get(cod_aj)
+                dados_pai = premio_motorista_map.get(cod_mot_pai, default_premio_info) if cod_mot_pai else default_premio_info
+                
+                p_dev = metas_ajudante.get("dev_pdv_premio", 0) if dados_pai["dev_pdv_passou"] else 0.0
+                p_rat = metas_ajudante.get("rating_premio", 0) if dados_pai["rating_passou"] else 0.0
+                p_ref = metas_ajudante.get("refugo_premio", 0) if dados_pai["refugo_passou"] else 0.0
+                
+                incentivo_ajudantes.append({
+                    "cpf": cpf_ajudante_map.get(cod_aj, ""),
+                    "cod": cod_aj,
+                    "nome": aj['AJUDANTE_NOME'],
+                    "dev_pdv_val": dados_pai["dev_pdv_val"], "dev_pdv_premio_val": p_dev,
+                    "rating_val": dados_pai["rating_val"], "rating_premio_val": p_rat,
+                    "refugo_val": dados_pai["refugo_val"], "refugo_premio_val": p_ref,
+                    "total_premio": p_dev + p_rat + p_ref
+                })
+
+    return sorted(incentivo_motoristas, key=lambda x: x['nome']), sorted(incentivo_ajudantes, key=lambda x: x['nome'])
+
+
+def _dados(n_viagens=600, seed=4):
+    rnd = random.Random(seed)
+    cadastro = pd.DataFrame(
+        [{"Codigo_M": m, "Nome_M": f"M{m}", "CPF_M": f"{m:011d}", "Codigo_J": None, "Nome_J": None, "CPF_J": None} for m in range(1, 25)]
+        + [{"Codigo_M": None, "Nome_M": None, "CPF_M": None, "Codigo_J": a, "Nome_J": f"A{a}", "CPF_J": f"{a:011d}"} for a in range(100, 150)]
+    )
+    viagens = []
+    for i in range(n_viagens):
+        m = rnd.randrange(1, 30)
+        linha = {"MAPA": i, "COD": m, "MOTORISTA": f" Motorista {m % 9} ", "COD_2": None, "MOTORISTA_2": None}
+        for k in (1, 2, 3):
+            a = rnd.choice([None, 100 + (m * 2 + k) % 50, 100 + (m * 2 + k) % 50, rnd.randrange(100, 160)])
+            linha[f"CODJ_{k}"], linha[f"AJUDANTE_{k}"] = a, (f"AJUDANTE {a % 7}" if a else None)
+        viagens.append(linha)
+    indicadores = pd.DataFrame([
+        {"Codigo_M": m, "dev_pdv": rnd.choice([0.01, 0.05, None, "x"]), "Rating_tx": rnd.choice([0.8, 0.95, None]), "refugo": rnd.choice([0.001, 0.02])}
+        for m in range(1, 28)
+    ])
+    metas = {
+        "motorista": {"dev_pdv_meta_perc": 3, "dev_pdv_premio": 100, "rating_meta_perc": 90, "rating_premio": 50.5,
+                      "refugo_meta_perc": 1, "refugo_premio": 30},
+        "ajudante": {"dev_pdv_premio": 40, "rating_premio": 20},
+    }
+    return pd.DataFrame(viagens), cadastro, indicadores, metas
+
+
+def test_incentivo_igual_a_implementacao_anterior():
+    df_viagens, cadastro, indicadores, metas = _dados()
+    pessoas = IndicePessoas(cadastro)
+    for df_indicadores in (indicadores, None, indicadores.drop(columns=["refugo"])):
+        for metas_caso in (metas, {}):
+            esperado = _processar_incentivos_legado(
+                df_viagens, cadastro, None if df_indicadores is None else df_indicadores.copy(), None, metas_caso
+            )
+            resultado = processar_incentivos_sincrono(
+                ContextoCalculo(viagens=df_viagens, pessoas=pessoas, indicadores=df_indicadores, metas=metas_caso)
+            )
+
+            assert resultado == esperado
+            tipos = lambda listas: [[type(v) for v in item.values()] for lista in listas for item in lista]
+            assert tipos(resultado) == tipos(esperado)
+
+
+def test_incentivo_ajudante_herda_do_motorista_fixo():
+    df_viagens, cadastro, indicadores, metas = _dados()
+    motoristas, ajudantes = processar_incentivos_sincrono(
+        ContextoCalculo(viagens=df_viagens, pessoas=IndicePessoas(cadastro), indicadores=indicadores, metas=metas)
+    )
+
+    por_cod = {m["cod"]: m for m in motoristas}
+    fixo = gerar_dashboard_e_mapas(df_viagens)["mapas"]["motorista_fixo_map"]
+    for ajudante in ajudantes:
+        pai = por_cod[fixo[ajudante["cod"]]]
+        assert ajudante["dev_pdv_val"] == pai["dev_pdv_val"]
+        assert ajudante["dev_pdv_premio_val"] == (40 if pai["dev_pdv_premio_val"] else 0.0)
+        assert ajudante["refugo_premio_val"] == 0.0  # sem prêmio de refugo na meta de ajudante
@@ -0,0 +1,67 @@
+import os
+import sys
+import datetime
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.indexes import IndiceCpf, IndicePessoas
+
+
+def _cadastro():
+    df = pd.DataFrame([
+        {"Codigo_M": 10, "Nome_M": "ANA ", "CPF_M": "111.111.111-11", "Data_M": "2020-01-01",
+         "Codigo_J": None, "Nome_J": None, "CPF_J": None, "Data_J": None},
+        {"Codigo_M": None, "Nome_M": None, "CPF_M": None, "Data_M": None,
+         "Codigo_J": 501, "Nome_J": "BRUNO", "CPF_J": "22222222222", "Data_J": "2024-12-31"},
+        # Mesmo CPF como motorista e ajudante
+        {"Codigo_M": 11, "Nome_M": "CARLA", "CPF_M": "33333333333", "Data_M": None,
+         "Codigo_J": 502, "Nome_J": "CARLA", "CPF_J": "33333333333", "Data_J": "data inválida"},
+        # Código repetido: nos relatórios vale a última linha
+        {"Codigo_M": "10", "Nome_M": "ANA NOVA", "CPF_M": "44444444444", "Data_M": "2023-06-15 08:30:00",
+         "Codigo_J": None, "Nome_J": None, "CPF_J": None, "Data_J": None},
+    ])
+    for col in ("CPF_M", "CPF_J"):
+        df[col] = df[col].astype(str).str.replace(r'[.-]', '', regex=True)
+    return df
+
+
+def test_indice_cpf_login_e_codigos():
+    indice = IndiceCpf(_cadastro())
+
+    assert indice.contem("222.222.222-22")
+    assert indice.contem("11111111111")
+    assert not indice.contem("None")
+    assert not indice.contem("00000000000")
+    assert indice.codigos("33333333333", "motorista") == {11}
+    assert indice.codigos("33333333333", "ajudante") == {502}
+    assert indice.buscar("22222222222") == [("ajudante", 501, "BRUNO")]
+
+
+def test_indice_cpf_segue_regra_de_codigo_duplicado_dos_relatorios():
+    indice = IndiceCpf(_cadastro())
+
+    assert indice.codigos("11111111111", "motorista") == frozenset()
+    assert indice.codigos("44444444444", "motorista") == {10}
+
+
+def test_indice_pessoas_por_papel():
+    pessoas = IndicePessoas(_cadastro())
+
+    motoristas = pessoas.colaboradores("motorista", datetime.date(2024, 6, 15))
+    assert motoristas.loc[10, "nome"] == "ANA NOVA"
+    assert motoristas.loc[10, "cpf"] == "44444444444"
+    assert motoristas.loc[10, "dias"] == 366
+    assert motoristas.loc[11, "dias"] == 0  # sem data de admissão
+    assert pessoas.cpfs("ajudante") == {501: "22222222222", 502: "33333333333"}
+    # Continua a responder como índice de CPFs
+    assert pessoas.codigos("33333333333", "ajudante") == {502}
+
+
+def test_indice_pessoas_dias_por_data_de_referencia():
+    pessoas = IndicePessoas(_cadastro())
+
+    ajudantes = pessoas.colaboradores("ajudante", datetime.date(2025, 1, 10))
+    assert ajudantes["dias"].to_dict() == {501: 10, 502: 0}
+    assert pessoas.colaboradores("ajudante", datetime.date(2025, 1, 10)) is ajudantes
+    assert pessoas.colaboradores("ajudante", datetime.date(2025, 1, 11))["dias"].to_dict() == {501: 11, 502: 0}
@@ -0,0 +1,129 @@
+import os
+import sys
+import asyncio
+import itertools
+import pandas as pd
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import core.database as database
+import core.loader as loader
+from core.loader import PlanoDados, carregar_fontes, carregar_plano
+from test_database import ClienteFalso, _distribuicao
+
+
+@pytest.fixture(autouse=True)
+def _cache_limpo():
+    database.clear_cache()
+    yield
+    database.clear_cache()
+
+
+def test_plano_unir_fontes_e_colunas():
+    a = PlanoDados({"viagens": ["COD", "MAPA"], "indicadores": ["Codigo_M"], "metas": None})
+    b = PlanoDados({"caixas": None, "viagens": ["CODJ_1", "COD"]})
+
+    plano = PlanoDados.unir(a, b)
+
+    assert plano.fontes == ("metas", "viagens", "indicadores", "caixas")
+    assert plano.colunas("viagens") == ["COD", "MAPA", "CODJ_1"]
+    assert plano.colunas("caixas") is None
+    # None (todas as colunas) prevalece
+    assert PlanoDados.unir(a, PlanoDados({"viagens": None})).colunas("viagens") is None
+    with pytest.raises(ValueError):
+        PlanoDados({"tabela_inexistente": None})
+
+
+def test_carregar_plano_busca_apenas_as_fontes_declaradas():
+    cliente = ClienteFalso({
+        database.NOME_DA_TABELA: _distribuicao(50),
+        "Resultados_Indicadores": [
+            {"Codigo_M": 1, "dev_pdv": 0.1, "Rating_tx": 0.9, "refugo": 0.0, "observacao": "x",
+             "data_inicio_periodo": "2025-01-01", "data_fim_periodo": "2025-01-31"},
+        ],
+    })
+    plano = PlanoDados({"viagens": ["COD", "MOTORISTA"], "indicadores": ["dev_pdv"]})
+
+    dados = asyncio.run(carregar_plano(cliente, "2025-01-01", "2025-01-31", plano))
+
+    assert {tabela for tabela, _, _ in cliente.chamadas} == {database.NOME_DA_TABELA, "Resultados_Indicadores"}
+    assert list(dados["df_indicadores"].columns) == ["Codigo_M", "dev_pdv"]
+    assert dados["fontes_ignoradas"] == ["metas", "cadastro", "pessoas", "caixas"]
+    assert dados["df_caixas"] is None and dados["indice_pessoas"] is None
+    assert dados["error_message"] is None
+
+
+# Função de core.database chamada por cada fonte (as que devolvem (valor, erro))
+FUNCOES_FONTES = {
+    "viagens": "get_dados_apurados",
+    "cadastro": "get_cadastro_sincrono",
+    "pessoas": "get_pessoas_sincrono",
+    "indicadores": "get_indicadores_sincrono",
+    "caixas": "get_caixas_sincrono",
+}
+
+
+def _fontes_falsas(monkeypatch, falhas, excecoes=()):
+    """Cada fonte devolve um DataFrame próprio, (None, 'erro <fonte>') se estiver em 'falhas' ou lança."""
+    valores = {nome: pd.DataFrame({"fonte": [nome]}) for nome in FUNCOES_FONTES}
+    for nome, funcao in FUNCOES_FONTES.items():
+        def falsa(*args, nome=nome):
+            if nome in excecoes:
+                raise RuntimeError("ligação perdida")
+            return (None, f"erro {nome}") if nome in falhas else (valores[nome], None)
+        monkeypatch.setattr(loader, funcao, falsa)
+    monkeypatch.setattr(loader, "get_metas_sincrono", lambda *args: {"motorista": {"x": 1}, "ajudante": {}})
+    return valores
+
+
+def _sequencial(valores, falhas):
+    """O contrato da busca sequencial anterior: err1 or err2 or ... na ordem das fontes."""
+    resultados = {nome: (None, f"erro {nome}") if nome in falhas else (valores[nome], None) for nome in FUNCOES_FONTES}
+    erro = None
+    for nome in ("viagens", "cadastro", "pessoas", "indicadores", "caixas"):
+        erro = erro or resultados[nome][1]
+    return {loader.FONTES[nome]: valor for nome, (valor, _) in resultados.items()}, erro
+
+
+@pytest.mark.parametrize("falhas", [
+    set(c) for n in range(len(FUNCOES_FONTES) + 1) for c in itertools.combinations(FUNCOES_FONTES, n)
+])
+def test_carregar_fontes_erros_como_na_busca_sequencial(monkeypatch, falhas):
+    valores = _fontes_falsas(monkeypatch, falhas)
+
+    dados = asyncio.run(carregar_fontes(None, "2025-01-01", "2025-01-31"))
+
+    esperado, erro = _sequencial(valores, falhas)
+    assert dados["error_message"] == erro
+    for chave, valor in esperado.items():
+        assert dados[chave] is valor
+    assert dados["metas"] == {"motorista": {"x": 1}, "ajudante": {}}
+
+
+@pytest.mark.parametrize("fonte", list(FUNCOES_FONTES))
+def test_carregar_fontes_excecao_numa_fonte_nao_afeta_as_outras(monkeypatch, fonte):
+    valores = _fontes_falsas(monkeypatch, falhas=(), excecoes={fonte})
+
+    dados = asyncio.run(carregar_fontes(None, "2025-01-01", "2025-01-31"))
+
+    assert dados["error_message"] == f"Erro ao carregar a fonte '{fonte}'."
+    assert dados[loader.FONTES[fonte]] is None
+    for nome, valor in valores.items():
+        if nome != fonte:
+            assert dados[loader.FONTES[nome]] is valor
+
+
+def test_carregar_fontes_metas_padrao_se_a_busca_falhar(monkeypatch):
+    _fontes_falsas(monkeypatch, falhas=())
+
+    def falhar(*args):
+        raise RuntimeError("ligação perdida")
+
+    monkeypatch.setattr(loader, "get_metas_sincrono", falhar)
+
+    dados = asyncio.run(carregar_fontes(None, "2025-01-01", "2025-01-31"))
+
+    assert dados["metas"] == {"motorista": database.METAS_PADRAO, "ajudante": database.METAS_PADRAO}
+    assert dados["error_message"] is None
@@ -1,8 +1,11 @@
+import asyncio
 import pytest
+from types import SimpleNamespace
 from fastapi.testclient import TestClient
-from main import app
+from main import app, get_xadrez_detalhado
 from unittest.mock import patch
 from core.security import create_access_token
+from test_database import ClienteFalso, _Consulta
 
 client = TestClient(app)
 
@@ -21,4 +24,26 @@ def test_caixas():
         response = client.get("/caixas/", params={"data_inicio": "2025-01-01", "data_fim": "2025-01-31"}, headers=headers)
         assert response.status_code == 200
         assert "motoristas" in response.json()
-        assert "ajudantes" in response.json()
\ No newline at end of file
+        assert "ajudantes" in response.json()
+
+# /xadrez/detalhado repete a busca com todas as colunas se a projeção falhar
+def test_xadrez_detalhado_sem_coluna_projetada():
+    class _ConsultaSemMotorista2(_Consulta):
+        def execute(self):
+            if "MOTORISTA_2" in self.colunas:
+                raise Exception("column Distribuição.MOTORISTA_2 does not exist")
+            return super().execute()
+
+    class _Cliente(ClienteFalso):
+        def table(self, nome):
+            return _ConsultaSemMotorista2(self, nome)
+
+    supabase = _Cliente({
+        "Distribuição": [{"id": 1, "DATA": "2025-01-02", "MAPA": 10, "COD": 1, "MOTORISTA": "Ana"}],
+        "Caixas": [{"data": "2025-01-02", "mapa": 10, "caixas": "5"}, {"data": "2025-01-02", "mapa": 10, "caixas": "2"}],
+    })
+    pedido = SimpleNamespace(state=SimpleNamespace(supabase=supabase))
+
+    linhas = asyncio.run(get_xadrez_detalhado(pedido, "2025-01-01", "2025-01-31"))
+
+    assert linhas == [{"DATA": "2025-01-02", "MAPA": 10, "caixas": 7.0, "COD": 1, "MOTORISTA": "Ana"}]
@@ -0,0 +1,122 @@
+import os
+import sys
+import asyncio
+import numpy as np
+import pandas as pd
+import pytest
+from fastapi import HTTPException
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import routers.pagamento as pagamento
+from core.security import create_access_token
+from routers.pagamento import _merge_resultados
+
+
+def _merge_resultados_legado(m_kpi, a_kpi, m_cx, a_cx):
+    """Implementação anterior (merges externos + apply por linha), mantida como referência."""
+    cols_kpi = ['cod', 'nome', 'cpf', 'total_premio']
+    cols_cx = ['cod', 'nome', 'cpf', 'total_premio']
+
+    # Converte para DataFrame e renomeia coluna de valor para evitar colisão
+    df_m_kpi = pd.DataFrame(m_kpi).reindex(columns=cols_kpi).rename(columns={"total_premio": "premio_kpi"}) if m_kpi else pd.DataFrame(columns=cols_kpi)
+    df_a_kpi = pd.DataFrame(a_kpi).reindex(columns=cols_kpi).rename(columns={"total_premio": "premio_kpi"}) if a_kpi else pd.DataFrame(columns=cols_kpi)
+    df_m_cx = pd.DataFrame(m_cx).reindex(columns=cols_cx).rename(columns={"total_premio": "premio_caixas"}) if m_cx else pd.DataFrame(columns=cols_cx)
+    df_a_cx = pd.DataFrame(a_cx).reindex(columns=cols_cx).rename(columns={"total_premio": "premio_caixas"}) if a_cx else pd.DataFrame(columns=cols_cx)
+
+    # Garante 0.0 onde for nulo
+    if 'premio_kpi' in df_m_kpi.columns: df_m_kpi['premio_kpi'] = df_m_kpi['premio_kpi'].fillna(0)
+    if 'premio_caixas' in df_m_cx.columns: df_m_cx['premio_caixas'] = df_m_cx['premio_caixas'].fillna(0)
+
+    # Garante tipo numérico para o COD (chave de merge)
+    for df in [df_m_kpi, df_m_cx, df_a_kpi, df_a_cx]:
+        if not df.empty and 'cod' in df.columns:
+            df['cod'] = pd.to_numeric(df['cod'], errors='coerce').fillna(0).astype(int)
+
+    # Merge Outer (mantém quem tem só KPI ou só Caixa)
+    df_m = pd.merge(df_m_kpi, df_m_cx, on='cod', how='outer', suffixes=('_kpi', '_cx'))
+    df_a = pd.merge(df_a_kpi, df_a_cx, on='cod', how='outer', suffixes=('_kpi', '_cx'))
+    
+    for df in [df_m, df_a]:
+        if 'premio_kpi' not in df.columns: df['premio_kpi'] = 0.0
+        if 'premio_caixas' not in df.columns: df['premio_caixas'] = 0.0
+        
+        df['premio_kpi'] = df['premio_kpi'].fillna(0)
+        df['premio_caixas'] = df['premio_caixas'].fillna(0)
+        df['total_a_pagar'] = df['premio_kpi'] + df['premio_caixas']
+        
+        # Consolida Nome e CPF (pega do lado que tiver informação)
+        df['nome'] = df.apply(lambda row: row.get('nome_kpi') if pd.notna(row.get('nome_kpi')) else row.get('nome_cx', ''), axis=1)
+        df['cpf'] = df.apply(lambda row: row.get('cpf_kpi') if pd.notna(row.get('cpf_kpi')) else row.get('cpf_cx', ''), axis=1)
+        
+        # Remove colunas auxiliares
+        cols_to_drop = ['nome_kpi', 'nome_cx', 'cpf_kpi', 'cpf_cx']
+        df.drop(columns=[c for c in cols_to_drop if c in df.columns], inplace=True)
+
+        df.fillna('', inplace=True)
+
+    return df_m, df_a
+
+
+def _kpi(cod, nome, cpf, premio):
+    return {"cpf": cpf, "cod": cod, "nome": nome, "dev_pdv_val": "N/A", "total_premio": premio}
+
+
+def _cx(cod, nome, cpf, premio):
+    return {"tipo": "Motorista", "cpf": cpf, "cod": cod, "nome": nome, "total_caixas": 10.0, "total_premio": premio}
+
+
+def test_merge_igual_a_implementacao_anterior():
+    m_kpi = [_kpi(30, "CARLA", "333", 100), _kpi(10, "ANA", "", 50.5), _kpi(20, None, "222", 0.0)]
+    m_cx = [_cx(20, "BRUNO", "999", 12.25), _cx(40, "DIEGO", "444", 3.0), _cx(10, "ANA", "111", 0.0)]
+    a_kpi = [_kpi(501, "JOAO", "555", 25)]
+    a_cx = [_cx(502, "PEDRO", None, 1.5)]
+
+    esperado_m, esperado_a = _merge_resultados_legado(m_kpi, a_kpi, m_cx, a_cx)
+    df_m, df_a = _merge_resultados(m_kpi, a_kpi, m_cx, a_cx)
+
+    pd.testing.assert_frame_equal(df_m, esperado_m, check_dtype=False)
+    pd.testing.assert_frame_equal(df_a, esperado_a, check_dtype=False)
+    # KPI tem precedência no nome/CPF, mesmo com CPF vazio
+    assert df_m.set_index("cod").loc[10, "cpf"] == ""
+    assert df_m.set_index("cod").loc[20, "nome"] == "BRUNO"
+
+
+def test_merge_com_os_mesmos_codigos_em_ordem_de_nome():
+    # Os motores devolvem por nome; com o mesmo conjunto de códigos dos dois lados
+    m_kpi = [_kpi(1, "ANA", "111", 10), _kpi(10, "BIA", "222", 20), _kpi(2, "CAIO", "333", 30)]
+    m_cx = [_cx(1, "ANA", "111", 1.0), _cx(10, "BIA", "222", 2.0), _cx(2, "CAIO", "333", 3.0)]
+
+    esperado_m, esperado_a = _merge_resultados_legado(m_kpi, m_kpi, m_cx, m_cx)
+    df_m, df_a = _merge_resultados(m_kpi, m_kpi, m_cx, m_cx)
+
+    assert df_m["cod"].tolist() == [1, 2, 10]
+    pd.testing.assert_frame_equal(df_m, esperado_m, check_dtype=False)
+    pd.testing.assert_frame_equal(df_a, esperado_a, check_dtype=False)
+
+
+def test_merge_colunas_tipadas_e_lados_vazios():
+    df_m, df_a = _merge_resultados([], [], [_cx(7, "ANA", "111", 2.0)], [])
+
+    assert list(df_m.columns) == ["cod", "premio_kpi", "premio_caixas", "total_a_pagar", "nome", "cpf"]
+    assert df_m.to_dict("records") == [
+        {"cod": 7, "premio_kpi": 0.0, "premio_caixas": 2.0, "total_a_pagar": 2.0, "nome": "ANA", "cpf": "111"}
+    ]
+    assert df_m["cod"].dtype == np.int64
+    assert df_m["total_a_pagar"].dtype == np.float64
+    assert df_a.empty and list(df_a.columns) == list(df_m.columns)
+
+
+def test_exportar_devolve_o_erro_das_fontes(monkeypatch):
+    async def com_erro(*args, **kwargs):
+        return {"df_m": None, "df_a": None, "indice_pessoas": None,
+                "error_message": "Erro ao recarregar os dados do período.", "snapshot": None}
+
+    monkeypatch.setattr(pagamento, "_obter_pagamento", com_erro)
+    token = create_access_token({"sub": "gestor", "role": "admin"})
+
+    with pytest.raises(HTTPException) as erro:
+        asyncio.run(pagamento.exportar_relatorio_pagamento("2024-12-26", "2025-01-25", token, "xlsx", None))
+
+    assert erro.value.status_code == 400
+    assert erro.value.detail == "Erro ao recarregar os dados do período."
@@ -0,0 +1,119 @@
+import os
+import sys
+import asyncio
+import datetime
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import core.database as database
+import core.etag as etag
+import routers.caixas as caixas
+import routers.incentivo as incentivo
+import routers.xadrez as xadrez
+from core.scheduler import Agendador, ciclos
+from core.security import get_current_user
+from test_database import ClienteFalso, _distribuicao
+
+HOJE = datetime.date(2025, 1, 20)
+
+
+@pytest.fixture(autouse=True)
+def _caches_limpos():
+    database.clear_cache()
+    etag.cache_respostas.limpar()
+    xadrez.cache_resumos.limpar()
+    yield
+    database.clear_cache()
+    etag.cache_respostas.limpar()
+    xadrez.cache_resumos.limpar()
+
+
+def _cliente():
+    return ClienteFalso({
+        database.NOME_DA_TABELA: _distribuicao(200),
+        "Cadastro": [{"Codigo_M": m, "Nome_M": f"M{m}", "CPF_M": f"{m:011d}", "Data_M": "2020-01-01",
+                      "Codigo_J": None, "Nome_J": None, "CPF_J": None, "Data_J": None} for m in range(1, 41)],
+        "Metas": [{"tipo_colaborador": "motorista", "meta_cx_valor_n1": 0.1}],
+        "Caixas": [{"data": "2025-01-05", "mapa": str(1000 + i), "caixas": 10} for i in range(0, 200, 4)],
+        "Resultados_Indicadores": [{"Codigo_M": m, "dev_pdv": 0.01, "Rating_tx": 0.95, "refugo": 0.001,
+                                    "data_inicio_periodo": "2024-12-26", "data_fim_periodo": "2025-01-25"} for m in range(1, 41)],
+    })
+
+
+def _agendador():
+    agendador = Agendador(intervalo_segundos=3600, quantidade_ciclos=2)
+    agendador.registar("xadrez", xadrez.PLANO_XADREZ_RESUMO, xadrez.aquecer)
+    agendador.registar("caixas", caixas.PLANO_CAIXAS, caixas.aquecer)
+    agendador.registar("incentivo", incentivo.PLANO_INCENTIVO, incentivo.aquecer)
+    return agendador
+
+
+def test_ciclos_26_a_25():
+    assert ciclos(HOJE) == [("2024-12-26", "2025-01-25"), ("2024-11-26", "2024-12-25")]
+    assert ciclos(datetime.date(2025, 1, 26), 1) == [("2025-01-26", "2025-02-25")]
+    assert ciclos(datetime.date(2025, 12, 31), 3) == [
+        ("2025-12-26", "2026-01-25"), ("2025-11-26", "2025-12-25"), ("2025-10-26", "2025-11-25")
+    ]
+
+
+def test_rodada_deixa_os_relatorios_em_cache():
+    supabase, agendador = _cliente(), _agendador()
+    asyncio.run(agendador.rodada(supabase, HOJE))
+
+    estado = agendador.estado()
+    tarefas = estado["tarefas"]
+    assert estado["rodadas"] == 1
+    assert estado["ultima_rodada"]["ciclos"] == [["2024-12-26", "2025-01-25"], ["2024-11-26", "2024-12-25"]]
+    assert all(tarefas[f"{nome} 2024-12-26..2025-01-25"]["ok"] for nome in ("dados", "xadrez", "caixas", "incentivo"))
+    assert tarefas["referencia"]["ok"]
+    # Ciclo anterior sem viagens: o erro fica no estado, as outras tarefas seguem
+    assert tarefas["caixas 2024-11-26..2024-12-25"]["erro"] == "Nenhum dado encontrado para o período selecionado."
+
+    # O primeiro pedido de um admin já não vai ao Supabase
+    app = FastAPI()
+    for modulo in (xadrez, caixas, incentivo):
+        app.include_router(modulo.router)
+    app.dependency_overrides[database.get_supabase] = lambda: supabase
+    app.dependency_overrides[get_current_user] = lambda: {"username": "gestor", "role": "admin"}
+    http = TestClient(app)
+    chamadas = len(supabase.chamadas)
+    periodo = "data_inicio=2024-12-26&data_fim=2025-01-25"
+    for url in (f"/caixas/?{periodo}", f"/incentivo/?{periodo}", f"/xadrez/?{periodo}", f"/xadrez/?{periodo}&view_mode=resumo"):
+        resposta = http.get(url)
+        assert resposta.status_code == 200 and "etag" in resposta.headers
+    assert len(supabase.chamadas) == chamadas
+
+
+def test_rodada_seguinte_recarrega_os_dados():
+    supabase, agendador = _cliente(), _agendador()
+    asyncio.run(agendador.rodada(supabase, HOJE))
+    versao = database.versao_periodo(database.cache_distribuicao, "2024-12-26", "2025-01-25")
+
+    supabase.tabelas[database.NOME_DA_TABELA][0]["MOTORISTA"] = "Outro"
+    asyncio.run(agendador.rodada(supabase, HOJE))
+
+    assert database.versao_periodo(database.cache_distribuicao, "2024-12-26", "2025-01-25") != versao
+    assert agendador.estado()["rodadas"] == 2
+
+
+def test_so_um_processo_corre_o_aquecimento(tmp_path):
+    trava = str(tmp_path / "aquecimento.lock")
+    supabase = _cliente()
+
+    async def cenario():
+        primeiro = Agendador(3600, 1, caminho_trava=trava)
+        segundo = Agendador(3600, 1, caminho_trava=trava)
+        primeiro.iniciar(supabase)
+        segundo.iniciar(supabase)
+        estados = (primeiro.em_execucao, segundo.em_execucao)
+        await primeiro.parar()
+        # Liberta a trava ao parar: outro processo pode assumir
+        segundo.iniciar(supabase)
+        estados += (segundo.em_execucao,)
+        await segundo.parar()
+        return estados
+
+    assert asyncio.run(cenario()) == (True, False, True)
@@ -0,0 +1,138 @@
+import os
+import sys
+import random
+import pandas as pd
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import core.database as database
+from core.context import ContextoCalculo
+from core.indexes import IndicePessoas, filtrar_por_cpf
+from core.scope import EscopoColaborador, get_viagens_do_escopo, recortar_viagens
+from routers.caixas import calcular_caixas
+from routers.incentivo import calcular_incentivos
+from test_database import ClienteFalso
+
+
+def _dados(n_viagens=500, seed=7):
+    rnd = random.Random(seed)
+    cadastro = pd.DataFrame(
+        [{"Codigo_M": m, "Nome_M": f"M{m}", "CPF_M": f"{m:011d}", "Data_M": "2020-01-01",
+          "Codigo_J": None, "Nome_J": None, "CPF_J": None, "Data_J": None} for m in range(1, 25)]
+        + [{"Codigo_M": None, "Nome_M": None, "CPF_M": None, "Data_M": None,
+            "Codigo_J": a, "Nome_J": f"A{a}", "CPF_J": f"{a:011d}", "Data_J": "2022-06-01"} for a in range(100, 140)]
+    )
+    viagens = []
+    for i in range(n_viagens):
+        m = rnd.randrange(1, 28)
+        linha = {
+            "id": i, "DATA": f"2025-01-{rnd.randrange(1, 29):02d}", "MAPA": 5000 + i - rnd.choice([0, 0, 0, 1]),
+            "COD": m, "MOTORISTA": f"MOTORISTA {m}", "COD_2": rnd.choice([None, None, None, rnd.randrange(1, 28)]),
+            "MOTORISTA_2": None,
+        }
+        for k in (1, 2, 3):
+            fixo = 100 + (m * 3 + k) % 40
+            a = rnd.choice([None, fixo, fixo, fixo, fixo, fixo, fixo, rnd.randrange(100, 145)])
+            linha[f"CODJ_{k}"], linha[f"AJUDANTE_{k}"] = a, (f"AJUDANTE {a}" if a else None)
+        viagens.append(linha)
+    caixas = pd.DataFrame([{"mapa": str(5000 + m), "caixas": rnd.choice([0.0, 12.0, 30.5])} for m in range(0, n_viagens, 3)])
+    indicadores = pd.DataFrame([
+        {"Codigo_M": m, "dev_pdv": rnd.choice([0.01, 0.05, None]), "Rating_tx": rnd.choice([0.8, 0.95]), "refugo": 0.001}
+        for m in range(1, 28)
+    ])
+    metas = {
+        "motorista": {"meta_cx_valor_n1": 0.1, "dev_pdv_meta_perc": 3, "dev_pdv_premio": 100,
+                      "rating_meta_perc": 90, "rating_premio": 50, "refugo_meta_perc": 1, "refugo_premio": 30},
+        "ajudante": {"meta_cx_valor_n1": 0.05, "dev_pdv_premio": 40, "rating_premio": 20},
+    }
+    return pd.DataFrame(viagens), IndicePessoas(cadastro), caixas, indicadores, metas
+
+
+def _escopo(pessoas, cpf):
+    return EscopoColaborador(pessoas.codigos(cpf, "motorista"), pessoas.codigos(cpf, "ajudante"))
+
+
+def test_recorte_da_os_mesmos_numeros_que_a_empresa_inteira():
+    df_viagens, pessoas, caixas, indicadores, metas = _dados()
+    contexto = ContextoCalculo(viagens=df_viagens, pessoas=pessoas, caixas=caixas, indicadores=indicadores, metas=metas)
+    completos = {motor: motor(contexto) for motor in (calcular_caixas, calcular_incentivos)}
+    tamanhos = []
+
+    for cpf in [f"{m:011d}" for m in range(1, 25)] + [f"{a:011d}" for a in range(100, 140)]:
+        recorte = recortar_viagens(df_viagens, _escopo(pessoas, cpf))
+        tamanhos.append(len(recorte))
+        contexto_recorte = ContextoCalculo(viagens=recorte, pessoas=pessoas, caixas=caixas, indicadores=indicadores, metas=metas)
+        for motor, (motoristas, ajudantes) in completos.items():
+            esperado = filtrar_por_cpf(motoristas, ajudantes, cpf, pessoas)
+            resultado = filtrar_por_cpf(*motor(contexto_recorte), cpf, pessoas)
+            for a, b in zip(resultado, esperado):
+                pd.testing.assert_frame_equal(a.reset_index(drop=True), b.reset_index(drop=True))
+    # Motoristas: só as suas viagens (e as dos mesmos MAPAs)
+    assert max(tamanhos[:24]) < len(df_viagens) / 5
+
+
+@pytest.mark.parametrize("cpf", ["00000000007", "00000000112"])
+def test_busca_restrita_igual_ao_recorte_em_memoria(cpf):
+    database.clear_cache()
+    df_viagens, pessoas, *_ = _dados()
+    escopo = _escopo(pessoas, cpf)
+    # Códigos inteiros (como no banco), não os floats das colunas com vazios
+    linhas = df_viagens.convert_dtypes().astype(object).where(df_viagens.notna(), None).to_dict("records")
+    cliente = ClienteFalso({database.NOME_DA_TABELA: linhas})
+
+    restrito, erro = get_viagens_do_escopo(cliente, "2025-01-01", "2025-01-31", escopo)
+    # A busca restrita não preenche o cache por dia (não tem o período inteiro)
+    assert database.versao_periodo(database.cache_distribuicao, "2025-01-01", "2025-01-31") is None
+    completo, _ = database.get_dados_apurados(cliente, "2025-01-01", "2025-01-31", "")
+    em_memoria, _ = get_viagens_do_escopo(cliente, "2025-01-01", "2025-01-31", escopo)
+
+    assert erro is None
+    assert database.versao_periodo(database.cache_distribuicao, "2025-01-01", "2025-01-31") is not None
+    assert 0 < len(restrito) < len(completo)
+    pd.testing.assert_frame_equal(
+        restrito.reset_index(drop=True)[em_memoria.columns], em_memoria.reset_index(drop=True), check_dtype=False
+    )
+    database.clear_cache()
+
+
+def test_escopo_sem_viagens_em_periodo_vazio():
+    database.clear_cache()
+    cliente = ClienteFalso({database.NOME_DA_TABELA: []})
+    df, erro = get_viagens_do_escopo(cliente, "2025-01-01", "2025-01-31", EscopoColaborador(frozenset({1}), frozenset()))
+
+    assert df is None
+    assert erro == "Nenhum dado encontrado para o período selecionado."
+
+
+def test_recorte_segue_ajudantes_da_quarta_posicao():
+    df_viagens, pessoas, *_ = _dados(n_viagens=60)
+    df_viagens["CODJ_4"], df_viagens["AJUDANTE_4"] = None, None
+    df_viagens.loc[[5, 40], ["CODJ_4", "AJUDANTE_4"]] = [150, "AJUDANTE 150"]
+
+    recorte = recortar_viagens(df_viagens, EscopoColaborador(frozenset(), frozenset({150})))
+
+    assert {5, 40} <= set(recorte["id"])
+
+
+def test_busca_restrita_com_mapas_com_caracteres_reservados():
+    database.clear_cache()
+    mapas = ['A,1', 'B(2)', 'C"3', 'D.4', 'E\\5']
+    linhas = [
+        {"id": i, "DATA": "2025-01-10", "MAPA": mapa, "COD": 1, "MOTORISTA": "M1", "COD_2": None,
+         "CODJ_1": None, "AJUDANTE_1": None}
+        for i, mapa in enumerate(mapas)
+    ]
+    # Mesmo MAPA de outro motorista: entra no recorte; os MAPAs 'A' e '1' não
+    linhas += [
+        {"id": 10 + i, "DATA": "2025-01-10", "MAPA": mapa, "COD": 2, "MOTORISTA": "M2", "COD_2": None,
+         "CODJ_1": None, "AJUDANTE_1": None}
+        for i, mapa in enumerate(mapas + ['A', '1', 'B', '2)'])
+    ]
+    cliente = ClienteFalso({database.NOME_DA_TABELA: linhas})
+
+    df, erro = get_viagens_do_escopo(cliente, "2025-01-01", "2025-01-31", EscopoColaborador(frozenset({1}), frozenset()))
+
+    assert erro is None
+    assert sorted(df["id"]) == list(range(5)) + list(range(10, 15))
+    database.clear_cache()
@@ -0,0 +1,70 @@
+import os
+import sys
+import json
+import numpy as np
+import pandas as pd
+import pytest
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import core.serialization as serialization
+from core.export import registros
+from core.serialization import serializar, tabela_json
+
+
+def _tabela():
+    return pd.DataFrame({
+        "cod": np.array([10, 11, 12], dtype=np.int64),
+        "nome": ["ANA", "JOÃO", "BIA"],
+        "total_caixas": [1.5, 0.0, 1e-7],
+        "valor_por_caixa": np.array([1, 0.25, 2], dtype=object),
+        "ativo": [True, False, True],
+    })
+
+
+@pytest.fixture(params=["orjson", "json"])
+def encoder(request, monkeypatch):
+    if request.param == "json":
+        monkeypatch.setattr(serialization, "orjson", None)
+    elif serialization.orjson is None:
+        pytest.skip("orjson não instalado")
+    return request.param
+
+
+def test_records_igual_ao_caminho_do_fastapi(encoder):
+    df = _tabela()
+    antes = JSONResponse(jsonable_encoder({"motoristas": registros(df), "error": None})).body
+
+    depois = serializar({"motoristas": df, "error": None})
+
+    assert json.loads(depois) == json.loads(antes)
+
+
+def test_columnar(encoder):
+    df = _tabela()
+
+    corpo = json.loads(serializar({"t": df}, layout="columnar"))
+
+    assert list(corpo["t"]) == list(df.columns)
+    assert corpo["t"]["cod"] == [10, 11, 12]
+    assert corpo["t"]["valor_por_caixa"] == [1, 0.25, 2]
+    assert corpo["t"]["ativo"] == [True, False, True]
+
+
+def test_vazios_como_null(encoder):
+    df = pd.DataFrame({"x": [1.0, np.nan], "y": ["a", None], "d": pd.to_datetime(["2025-01-02", None])})
+
+    assert json.loads(serializar(df)) == [
+        {"x": 1.0, "y": "a", "d": "2025-01-02T00:00:00"},
+        {"x": None, "y": None, "d": None},
+    ]
+    assert json.loads(serializar(df, layout="columnar"))["x"] == [1.0, None]
+
+
+def test_tabela_sem_linhas():
+    df = _tabela().iloc[:0]
+
+    assert tabela_json(df) == []
+    assert json.loads(serializar(df, layout="columnar")) == {col: [] for col in df.columns}
@@ -0,0 +1,103 @@
+import os
+import sys
+import asyncio
+import pandas as pd
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import routers.pagamento as pagamento
+from core.scope import EscopoColaborador
+from core.singleflight import ExecucaoUnica
+
+
+def _calculo(chamadas, valor="resultado", atraso=0.01):
+    async def calcular():
+        chamadas.append(valor)
+        await asyncio.sleep(atraso)
+        return valor
+    return calcular
+
+
+def test_pedidos_simultaneos_partilham_o_calculo():
+    execucoes, chamadas = ExecucaoUnica(), []
+
+    async def cenario():
+        return await asyncio.gather(*(execucoes.executar(("rota", "2025-01"), "v1", _calculo(chamadas)) for _ in range(10)))
+
+    assert asyncio.run(cenario()) == ["resultado"] * 10
+    assert chamadas == ["resultado"]
+    assert execucoes.estatisticas() == {"em_curso": 0, "execucoes": 1, "partilhadas": 9}
+
+
+def test_versao_diferente_ou_outra_chave_calcula_de_novo():
+    execucoes, chamadas = ExecucaoUnica(), []
+
+    async def cenario():
+        return await asyncio.gather(
+            execucoes.executar("a", "v1", _calculo(chamadas, "a1")),
+            execucoes.executar("a", "v2", _calculo(chamadas, "a2")),
+            execucoes.executar("b", "v1", _calculo(chamadas, "b1")),
+            # Versão desconhecida (dados ainda não em cache): junta-se ao cálculo em curso
+            execucoes.executar("b", None, _calculo(chamadas, "b2")),
+        )
+
+    assert asyncio.run(cenario()) == ["a1", "a2", "b1", "b1"]
+    assert chamadas == ["a1", "a2", "b1"]
+
+
+def test_erro_chega_a_todos_e_nada_fica_guardado():
+    execucoes, chamadas = ExecucaoUnica(), []
+
+    async def falhar():
+        chamadas.append(1)
+        await asyncio.sleep(0.01)
+        raise ValueError("falhou")
+
+    async def cenario():
+        resultados = await asyncio.gather(*(execucoes.executar("x", None, falhar) for _ in range(3)), return_exceptions=True)
+        depois = await execucoes.executar("x", None, _calculo(chamadas, "ok"))
+        return resultados, depois
+
+    resultados, depois = asyncio.run(cenario())
+    assert all(isinstance(r, ValueError) for r in resultados)
+    assert depois == "ok" and chamadas == [1, "ok"]
+
+
+def test_cancelar_o_primeiro_pedido_nao_cancela_o_calculo():
+    execucoes, chamadas = ExecucaoUnica(), []
+
+    async def cenario():
+        primeiro = asyncio.ensure_future(execucoes.executar("x", None, _calculo(chamadas, atraso=0.05)))
+        await asyncio.sleep(0)
+        segundo = asyncio.ensure_future(execucoes.executar("x", None, _calculo(chamadas)))
+        await asyncio.sleep(0)
+        primeiro.cancel()
+        return await segundo
+
+    assert asyncio.run(cenario()) == "resultado"
+    assert chamadas == ["resultado"]
+
+
+def test_pagamento_do_colaborador_reaproveita_o_calculo_completo(monkeypatch):
+    df_m = pd.DataFrame({"cod": [1, 2], "premio_kpi": [10.0, 20.0]})
+    cargas = []
+
+    async def dados_falsos(data_inicio, data_fim, supabase, escopo=None):
+        cargas.append(escopo)
+        await asyncio.sleep(0.02)
+        return {"indice_pessoas": None, "error_message": None}
+
+    monkeypatch.setattr(pagamento, "_get_dados_completos", dados_falsos)
+    monkeypatch.setattr(pagamento, "_calcular_pagamento", lambda dados: (df_m, df_m.iloc[:0]))
+    escopo = EscopoColaborador(frozenset({1}), frozenset())
+
+    async def cenario():
+        pedidos = [pagamento._obter_pagamento("2099-01-01", "2099-01-31", None)]
+        pedidos += [pagamento._obter_pagamento("2099-01-01", "2099-01-31", None, escopo=escopo) for _ in range(3)]
+        return await asyncio.gather(*pedidos)
+
+    resultados = asyncio.run(cenario())
+
+    assert cargas == [None]
+    assert all(r is resultados[0] for r in resultados)
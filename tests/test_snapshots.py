@@ -0,0 +1,151 @@
+import os
+import sys
+import asyncio
+import datetime
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+pytest.importorskip("pyarrow")
+
+import core.snapshots as snapshots
+import routers.pagamento as pagamento
+from core.scope import EscopoColaborador
+from core.snapshots import RepositorioSnapshots, periodo_fechado
+
+
+def _tabelas():
+    df_m, df_a = pagamento._merge_resultados(
+        [{"cod": 10, "nome": "ANA", "cpf": "111", "total_premio": 100}],
+        [],
+        [{"cod": 10, "nome": "ANA", "cpf": "111", "total_premio": 12.5}, {"cod": 11, "nome": "BIA", "cpf": "", "total_premio": 3.0}],
+        [],
+    )
+    return df_m, df_a
+
+
+def test_periodo_fechado():
+    hoje = datetime.date(2025, 2, 10)
+
+    assert periodo_fechado("2024-12-26", "2025-01-25", hoje)
+    assert not periodo_fechado("2025-01-26", "2025-02-25", hoje)
+    assert not periodo_fechado("2025-01-26", "2025-02-10", hoje)
+    assert not periodo_fechado("../x", "2025-01-25", hoje)
+
+
+def test_snapshot_ida_e_volta(tmp_path):
+    repositorio = RepositorioSnapshots(tmp_path)
+    df_m, df_a = _tabelas()
+    metas = {"motorista": {"dev_pdv_premio": 100}, "ajudante": {}}
+
+    repositorio.gravar("2024-12-26", "2025-01-25", df_m, df_a, metas, "abc123")
+    lido = repositorio.ler("2024-12-26", "2025-01-25")
+
+    pd.testing.assert_frame_equal(lido.motoristas, df_m)
+    pd.testing.assert_frame_equal(lido.ajudantes, df_a)
+    assert lido.motoristas["cod"].dtype == np.int64
+    assert (lido.metas, lido.impressao) == (metas, "abc123")
+    assert repositorio.ler("2024-11-26", "2024-12-25") is None
+    assert repositorio.ler("..", "2025-01-25") is None
+    assert [p.name for p in tmp_path.iterdir()] == ["pagamento_2024-12-26_2025-01-25.parquet"]
+
+
+def test_snapshot_de_outra_versao_e_ignorado(tmp_path, monkeypatch):
+    repositorio = RepositorioSnapshots(tmp_path)
+    repositorio.gravar("2024-12-26", "2025-01-25", *_tabelas(), {}, "abc123")
+
+    monkeypatch.setattr(snapshots, "VERSAO_SNAPSHOT", snapshots.VERSAO_SNAPSHOT + 1)
+
+    assert repositorio.ler("2024-12-26", "2025-01-25") is None
+
+
+def test_snapshot_so_serve_as_versoes_do_fecho(tmp_path):
+    repositorio = RepositorioSnapshots(tmp_path)
+    versoes = {"viagens": "a1", "metas": "m1"}
+    repositorio.gravar("2024-12-26", "2025-01-25", *_tabelas(), {}, "abc123", versoes)
+
+    assert repositorio.ler("2024-12-26", "2025-01-25").valido_para(versoes)
+    assert not repositorio.ler("2024-12-26", "2025-01-25").valido_para(None)
+    assert repositorio.versao("2024-12-26", "2025-01-25", versoes) is not None
+    assert repositorio.versao("2024-12-26", "2025-01-25", {"viagens": "a2", "metas": "m1"}) is None
+    assert repositorio.versao("2024-12-26", "2025-01-25", None) is None
+
+
+def test_pagamento_de_periodo_fechado_servido_do_snapshot(tmp_path, monkeypatch):
+    df_m, df_a = _tabelas()
+    cargas = []
+    versoes = {"atual": None}
+
+    async def dados_falsos(data_inicio, data_fim, supabase, escopo=None):
+        cargas.append(escopo)
+        versoes["atual"] = versoes["atual"] or {"viagens": "v1"}
+        return {"indice_pessoas": None, "error_message": None, "metas": {}, "df_viagens_dedup": None,
+                "df_indicadores": None, "df_caixas": None}
+
+    renovacoes = []
+    monkeypatch.setattr(pagamento, "repositorio_snapshots", RepositorioSnapshots(tmp_path))
+    monkeypatch.setattr(pagamento, "renovar_periodo", lambda *args: renovacoes.append(args[1:3]))
+    monkeypatch.setattr(pagamento, "versoes_plano", lambda *args: versoes["atual"])
+    monkeypatch.setattr(pagamento, "_get_dados_completos", dados_falsos)
+    monkeypatch.setattr(pagamento, "_calcular_pagamento", lambda dados: (df_m, df_a))
+    obter = lambda **kwargs: asyncio.run(pagamento._obter_pagamento("2024-12-26", "2025-01-25", None, **kwargs))
+
+    # O GET nunca grava: sem fecho, calcula (só o colaborador, para um não-admin)
+    escopo = EscopoColaborador(frozenset({10}), frozenset())
+    assert obter(escopo=escopo)["snapshot"] is None and obter()["snapshot"] is None
+    assert cargas == [escopo, None] and list(tmp_path.iterdir()) == []
+
+    fechado = obter(refechar=True)
+    assert renovacoes == [("2024-12-26", "2025-01-25")]
+    assert fechado["snapshot"].versoes == {"viagens": "v1"}
+
+    # Mesmas versões das fontes: servido do snapshot, sem carregar nada
+    servido = obter(escopo=escopo)
+    assert len(cargas) == 3 and servido["snapshot"].impressao == fechado["snapshot"].impressao
+    pd.testing.assert_frame_equal(servido["df_m"], df_m)
+
+    # Dados novos ou /refresh (versões desconhecidas): o snapshot é ignorado
+    versoes["atual"] = {"viagens": "v2"}
+    assert obter()["snapshot"] is None
+    versoes["atual"] = None
+    assert obter()["snapshot"] is None
+    assert len(cargas) == 5
+
+
+def test_refecho_nao_aproveita_o_calculo_em_curso(tmp_path, monkeypatch):
+    df_m, df_a = _tabelas()
+    cargas = []
+
+    async def dados_falsos(data_inicio, data_fim, supabase, escopo=None):
+        cargas.append(escopo)
+        await asyncio.sleep(0.02)
+        return {"indice_pessoas": None, "error_message": None, "metas": {}, "df_viagens_dedup": None,
+                "df_indicadores": None, "df_caixas": None}
+
+    monkeypatch.setattr(pagamento, "repositorio_snapshots", RepositorioSnapshots(tmp_path))
+    monkeypatch.setattr(pagamento, "renovar_periodo", lambda *args: None)
+    monkeypatch.setattr(pagamento, "_get_dados_completos", dados_falsos)
+    monkeypatch.setattr(pagamento, "_calcular_pagamento", lambda dados: (df_m, df_a))
+
+    async def cenario():
+        return await asyncio.gather(
+            pagamento._obter_pagamento("2024-12-26", "2025-01-25", None),
+            pagamento._obter_pagamento("2024-12-26", "2025-01-25", None, refechar=True),
+        )
+
+    leitura, refecho = asyncio.run(cenario())
+
+    assert len(cargas) == 2 and leitura is not refecho
+
+
+def test_refecho_falha_se_o_periodo_nao_recarregar(tmp_path, monkeypatch):
+    monkeypatch.setattr(pagamento, "repositorio_snapshots", RepositorioSnapshots(tmp_path))
+    monkeypatch.setattr(pagamento, "renovar_periodo", lambda *args: "Erro ao recarregar os dados do período.")
+
+    resultado = asyncio.run(pagamento._obter_pagamento("2024-12-26", "2025-01-25", None, refechar=True))
+
+    assert resultado["error_message"] == "Erro ao recarregar os dados do período."
+    assert resultado["snapshot"] is None
+    assert RepositorioSnapshots(tmp_path).ler("2024-12-26", "2025-01-25") is None
@@ -0,0 +1,64 @@
+import os
+import sys
+import json
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import core.database as database
+import core.etag as etag
+import routers.xadrez as xadrez
+from core.security import get_current_user
+from test_database import ClienteFalso, _distribuicao
+
+PERIODO = "data_inicio=2025-01-01&data_fim=2025-01-31&view_mode=resumo"
+
+
+@pytest.fixture
+def cliente():
+    database.clear_cache()
+    etag.cache_respostas.limpar()
+    xadrez.cache_resumos.limpar()
+    supabase = ClienteFalso({database.NOME_DA_TABELA: _distribuicao(120)})
+    app = FastAPI()
+    app.include_router(xadrez.router)
+    app.dependency_overrides[database.get_supabase] = lambda: supabase
+    app.dependency_overrides[get_current_user] = lambda: {"username": "admin", "role": "admin"}
+    yield TestClient(app), supabase
+    database.clear_cache()
+
+
+def test_paginas_do_resumo_ordenado(cliente):
+    http, supabase = cliente
+
+    completo = http.get(f"/xadrez/?{PERIODO}").json()
+    chamadas = len(supabase.chamadas)
+    paginas = [http.get(f"/xadrez/?{PERIODO}&limit=50&offset={o}").json() for o in (0, 50, 100)]
+
+    assert completo["paginacao"] == {"total": 120, "offset": 0, "limit": None}
+    assert [p["paginacao"]["offset"] for p in paginas] == [0, 50, 100]
+    assert sum((p["resumo"] for p in paginas), []) == completo["resumo"]
+    # Páginas seguintes servidas do resumo ordenado em cache, sem ir ao Supabase
+    assert len(supabase.chamadas) == chamadas
+
+
+def test_ordenacao_pelo_servidor(cliente):
+    http, _ = cliente
+
+    resumo = http.get(f"/xadrez/?{PERIODO}&sort=-DATA,MAPA").json()["resumo"]
+
+    assert [(r["DATA"], -r["MAPA"]) for r in resumo] == sorted(((r["DATA"], -r["MAPA"]) for r in resumo), reverse=True)
+    assert http.get(f"/xadrez/?{PERIODO}&sort=NAO_EXISTE").status_code == 400
+    assert http.get(f"/xadrez/?{PERIODO}&sort=DATA;drop").status_code == 422
+
+
+def test_ndjson(cliente):
+    http, _ = cliente
+
+    resposta = http.get(f"/xadrez/?{PERIODO}&format=ndjson&limit=30&offset=10")
+    linhas = [json.loads(linha) for linha in resposta.text.splitlines()]
+
+    assert resposta.headers["content-type"] == "application/x-ndjson"
+    assert linhas == http.get(f"/xadrez/?{PERIODO}").json()["resumo"][10:40]